@@ -24,6 +24,9 @@ class BlueSkyKMLConfigParser(configparser.ConfigParser):
         'DispersionGridInput': {
             'LAYERS': {
                 "type": list, "nested_type": int
+            },
+            'BOUNDING_BOX': {
+                "type": list, "nested_type": float
             }
         },
         'DispersionImages': {
@@ -36,7 +39,7 @@ class BlueSkyKMLConfigParser(configparser.ConfigParser):
 
     def __init__(self, *args, **params):
         super(BlueSkyKMLConfigParser, self).__init__(*args, **params)
-        self._converted = defaultdict(lambda: {})
+        self._converted = defaultdict(dict)
 
     ##
     ## Set Methods
@@ -234,6 +237,26 @@ class ConfigBuilder(object):
             "section": "DispersionGridInput",
             "option": "LAYERS"
         },
+        {
+            "command_line_option": "streaming",
+            "section": "DispersionGridInput",
+            "option": "STREAMING"
+        },
+        {
+            "command_line_option": "restyle",
+            "section": "DispersionGridInput",
+            "option": "RESTYLE"
+        },
+        {
+            "command_line_option": "jobs",
+            "section": "DispersionImages",
+            "option": "JOBS"
+        },
+        {
+            "command_line_option": "incremental",
+            "section": "DispersionImages",
+            "option": "INCREMENTAL"
+        },
         {
             "command_line_option": "fire_locations_csv",
             "section": "SmokeDispersionKMLInput",
@@ -260,7 +283,7 @@ class ConfigBuilder(object):
 
         # Apply overrides specified with the alias command-line options
         for o in self.OVERRIDES:
-            val = getattr(self._options, o["command_line_option"])
+            val = getattr(self._options, o["command_line_option"], None)
             if val:
                 self._add_config_option(o["section"], o["option"], val, o["command_line_option"])
 
@@ -10,8 +10,9 @@ __all__ = [
 class TimeSeriesTypes:
     """Effectively an enum of image time series types"""
     # Enum to represent different time series
-    NUM_TYPES = 5
-    HOURLY, THREE_HOUR, DAILY_MAXIMUM, DAILY_MINIMUM, DAILY_AVERAGE = list(range(NUM_TYPES))
+    NUM_TYPES = 7
+    (HOURLY, THREE_HOUR, DAILY_MAXIMUM, DAILY_MINIMUM, DAILY_AVERAGE,
+        TWENTY_FOUR_HOUR, NOWCAST) = list(range(NUM_TYPES))
     ALL = list(range(NUM_TYPES))
 
     @classmethod
@@ -31,7 +32,9 @@ TIME_SET_DIR_NAMES = {
     TimeSeriesTypes.THREE_HOUR: 'three_hour',
     TimeSeriesTypes.DAILY_MAXIMUM: 'daily_maximum',
     TimeSeriesTypes.DAILY_MINIMUM: 'daily_minimum',
-    TimeSeriesTypes.DAILY_AVERAGE: 'daily_average'
+    TimeSeriesTypes.DAILY_AVERAGE: 'daily_average',
+    TimeSeriesTypes.TWENTY_FOUR_HOUR: 'twenty_four_hour',
+    TimeSeriesTypes.NOWCAST: 'nowcast'
 }
 
 TIME_SERIES_PRETTY_NAMES = dict(
@@ -44,7 +47,9 @@ CONFIG_COLOR_LABELS = {
     TimeSeriesTypes.THREE_HOUR: 'THREE_HOUR_COLORS',
     TimeSeriesTypes.DAILY_MAXIMUM: 'HOURLY_COLORS', # Is this right?
     TimeSeriesTypes.DAILY_MINIMUM: 'HOURLY_COLORS', # Is this right?
-    TimeSeriesTypes.DAILY_AVERAGE: 'DAILY_COLORS'
+    TimeSeriesTypes.DAILY_AVERAGE: 'DAILY_COLORS',
+    TimeSeriesTypes.TWENTY_FOUR_HOUR: 'TWENTY_FOUR_HOUR_COLORS',
+    TimeSeriesTypes.NOWCAST: 'NOWCAST_COLORS'
 }
 
 FILE_NAME_TIME_STAMP_PATTERNS = {
@@ -52,15 +57,21 @@ FILE_NAME_TIME_STAMP_PATTERNS = {
     TimeSeriesTypes.THREE_HOUR:     "%Y%m%d%H%M",
     TimeSeriesTypes.DAILY_MAXIMUM: "%Y%m%d",
     TimeSeriesTypes.DAILY_MINIMUM: "%Y%m%d",
-    TimeSeriesTypes.DAILY_AVERAGE: "%Y%m%d"
+    TimeSeriesTypes.DAILY_AVERAGE: "%Y%m%d",
+    TimeSeriesTypes.TWENTY_FOUR_HOUR: "%Y%m%d%H%M",
+    TimeSeriesTypes.NOWCAST: "%Y%m%d%H%M"
 }
 
 PARAMETER_LABELS = {
     'PM25': 'PM2.5',
-    'VisualRange': 'Visual Range'
+    'VisualRange': 'Visual Range',
+    'AQI': 'PM2.5 AQI',
+    'AQICategory': 'PM2.5 AQI Category'
 }
 
 PARAMETER_PLOT_LABELS = {
     'PM25': r'$PM_{2.5} \/[\mu g/m^{3}]$',
-    'VisualRange': 'Visual Range (miles)'
+    'VisualRange': 'Visual Range (miles)',
+    'AQI': r'$PM_{2.5}$ AQI',
+    'AQICategory': r'$PM_{2.5}$ AQI Category'
 }
\ No newline at end of file
@@ -1,5 +1,6 @@
 # TODO: refactor this as a class (possibly singleton?) that takes config in contstructor
 
+import datetime
 import os
 
 from .constants import *
@@ -7,8 +8,10 @@ from .memoize import memoizeme
 
 __all__ = [
     'create_dispersion_images_dir', 'create_image_set_dir',
-    'image_pathname', 'legend_pathname', 'parse_color_map_names',
-    'collect_all_dispersion_images', 'collect_dispersion_images'
+    'image_pathname', 'series_pathname', 'legend_pathname',
+    'parse_color_map_names',
+    'DispersionImage', 'image_time_span', 'iter_smoke_images',
+    'collect_dispersion_images_for_kml'
 ]
 
 def create_height_label(height):
@@ -38,8 +41,7 @@ def create_image_set_dir(config, parameter, *dirs):
 
     images_output_dir = images_dir_name(config, parameter)
     outdir = os.path.join(images_output_dir, *dirs)
-    if not os.path.exists(outdir):
-        os.makedirs(outdir)
+    os.makedirs(outdir, exist_ok=True)
 
     if (config.getboolean('DispersionGridOutput', 'CREATE_RGBA_GEOTIFFS')
             or config.getboolean('DispersionGridOutput', 'CREATE_SINGLE_BAND_RAW_PM25_GEOTIFFS')
@@ -47,8 +49,7 @@ def create_image_set_dir(config, parameter, *dirs):
         geotiff_images_output_dir = images_dir_name(
             config, parameter, output_dir_key="GEOTIFF_OUTPUT_DIR")
         geotiff_outdir = os.path.join(geotiff_images_output_dir, *dirs)
-        if not os.path.exists(geotiff_outdir):
-            os.makedirs(geotiff_outdir)
+        os.makedirs(geotiff_outdir, exist_ok=True)
     else:
         geotiff_outdir = None
 
@@ -67,19 +68,46 @@ def image_pathname(image_set_dir, parameter, height_label, time_series_type,
 
     return os.path.join(image_set_dir, filename)
 
-def legend_pathname(image_set_dir, parameter, height_label, time_series_type,
+def series_pathname(image_set_dir, parameter, height_label, time_series_type,
         color_map_section, utc_offset=None):
+    """Returns the fileroot of files holding all of an image set's frames"""
     filename = (
         parameter.lower()
         + '_' + height_label
         + '_' + TIME_SET_DIR_NAMES[time_series_type]
         + ('_{}'.format(get_utc_label(utc_offset)) if utc_offset is not None else '')
         +  '_' + color_map_section
-        + '_' + "colorbar"
     )
 
     return os.path.join(image_set_dir, filename)
 
+def legend_pathname(image_set_dir, parameter, height_label, time_series_type,
+        color_map_section, utc_offset=None):
+    return series_pathname(image_set_dir, parameter, height_label,
+        time_series_type, color_map_section, utc_offset=utc_offset) + '_' + "colorbar"
+
+def transparent_image_pathname(config, parameter):
+    """The fully transparent image that the parameter's empty frames are
+    linked to, if EMPTY_FRAMES is 'transparent'
+    """
+    return os.path.join(images_dir_name(config, parameter),
+        parameter.lower() + '_transparent.png')
+
+def image_manifest_pathname(config, parameter):
+    """The manifest of the parameter's images, if DispersionImages >
+    INCREMENTAL is True
+    """
+    return os.path.join(images_dir_name(config, parameter), 'manifest.jsonl')
+
+def frame_cache_dir_name(config, parameter):
+    return images_dir_name(config, parameter, output_dir_key="FRAME_CACHE_DIR")
+
+def frame_cache_index_pathname(config, parameter):
+    """The index of the parameter's cached frames, if DispersionGridOutput
+    > CREATE_FRAME_CACHE is True
+    """
+    return os.path.join(frame_cache_dir_name(config, parameter), 'index.json')
+
 def get_utc_label(utc_offset):
     return 'UTC{}{}{}00'.format('+' if utc_offset >= 0 else '-',
         '0' if abs(utc_offset) < 10 else '', abs(utc_offset))
@@ -103,117 +131,101 @@ def parse_color_map_names(config, parameter, set_name):
 
     return []
 
-def is_smoke_image(file_name, parameter, height_label, time_series_type):
-    return (file_name.startswith(parameter.lower() + '_' + height_label + '_'
-        + TIME_SET_DIR_NAMES[time_series_type])) and file_name.find('colorbar') == -1
-
-
 ##
-## Collecting all images for post-processing
+## Created images
 ##
 
-@memoizeme
-def collect_all_dispersion_images(config, parameter, heights):
-    """Collect images from all sets of colormap images in each time series
-    category
+class DispersionImage:
+    """An image, or legend, created by dispersiongrid.create_dispersion_images,
+    identified by its height, time series type, UTC offset (daily images
+    only) and color map section.  start and end are the first and last
+    second that a smoke image represents; they're None for legends.
     """
-    utc_offsets = config.get('DispersionImages', "DAILY_IMAGES_UTC_OFFSETS")
 
-    images = {}
+    def __init__(self, path, height_label, time_series_type,
+            color_map_section, utc_offset=None, start=None, end=None):
+        self.path = path
+        self.height_label = height_label
+        self.time_series_type = time_series_type
+        self.color_map_section = color_map_section
+        self.utc_offset = utc_offset
+        self.start = start
+        self.end = end
+
+    @property
+    def is_legend(self):
+        return self.start is None
+
+    @property
+    def is_daily(self):
+        return self.utc_offset is not None
+
+    def describe(self):
+        return ' > '.join([self.height_label,
+            TIME_SET_DIR_NAMES[self.time_series_type]]
+            + ([get_utc_label(self.utc_offset)] if self.is_daily else [])
+            + [self.color_map_section, os.path.basename(self.path)])
+
+def image_time_span(time_series_type, ts):
+    """Returns the first and last second represented by an image whose file
+    name is stamped with ts (see image_pathname)
+    """
+    if FILE_NAME_TIME_STAMP_PATTERNS[time_series_type] == "%Y%m%d":
+        start = datetime.datetime(ts.year, ts.month, ts.day)
+        duration = datetime.timedelta(hours=24)
+    else:
+        start = datetime.datetime(ts.year, ts.month, ts.day, ts.hour)
+        duration = datetime.timedelta(hours=1)
+    return start, start + duration - datetime.timedelta(seconds=1)
 
-    for height in heights:
-        height_label = create_height_label(height)
-        time_series_types = TimeSeriesTypes.all_for_parameter(parameter)
-        images[height_label] = dict((v, {}) for v in time_series_types)
-        for time_series_type in time_series_types:
-            if time_series_type in (TimeSeriesTypes.DAILY_MAXIMUM,
-                    TimeSeriesTypes.DAILY_MINIMUM,
-                    TimeSeriesTypes.DAILY_AVERAGE):
-                for utc_offset in utc_offsets:
-                    collect_all_colormap_dispersion_images(config, parameter, images,
-                        height_label, time_series_type, utc_offset=utc_offset)
-            else:
-                collect_all_colormap_dispersion_images(config, parameter, images,
-                    height_label, time_series_type)
-    return images
-
-def collect_all_colormap_dispersion_images(config, parameter, images, height_label,
-        time_series_type, utc_offset=None):
-    keys = [height_label, TIME_SET_DIR_NAMES[time_series_type]]
-    if utc_offset is not None:
-        keys.append(get_utc_label(utc_offset))
-
-    for color_map_section in parse_color_map_names(config, parameter,
-            CONFIG_COLOR_LABELS[time_series_type]):
-        # Initialize and get reference to nested color section imatges dict
-        _keys = keys + [color_map_section]
-        color_set = initialize_sections_dict(images, *_keys)
-
-        # create output dir
-        color_set['root_dir'], _ = create_image_set_dir(config, parameter, *_keys)
-
-        # collect images
-        for image in os.listdir(color_set['root_dir']):
-            if is_smoke_image(image, parameter, height_label, time_series_type):  # <-- this is to exclude color bar
-                color_set['smoke_images'].append(image)
-            else:  #  There should only be smoke images and a legend
-                color_set['legend'] = image
+def iter_smoke_images(images):
+    return (image for image in images if not image.is_legend)
 
 
 ##
 ## Collection images for KML
 ##
 
-# Note: collect_dispersion_images_for_kml was copied over from
-# smokedispersionkml.py and refactored to remove redundancy
-def collect_dispersion_images_for_kml(config, parameter, heights):
-    """Collect images from first set of colormap images in each time series
-    category. Used in KML generation.
+def collect_dispersion_images_for_kml(config, parameter, heights, images):
+    """Groups the images created by dispersiongrid.create_dispersion_images
+    by height label, time series type, UTC offset label (daily images only)
+    and color map section, in the order they're configured, each with its
+    legend's path and its smoke images in chronological order.  Used in
+    KML generation.
     """
-    utc_offsets = config.get('DispersionImages', "DAILY_IMAGES_UTC_OFFSETS")
+    by_set = {}
+    for image in images:
+        key = (image.height_label, image.time_series_type, image.utc_offset,
+            image.color_map_section)
+        images_section = by_set.setdefault(key, {'smoke_images': [], 'legend': None})
+        if image.is_legend:
+            images_section['legend'] = image.path
+        else:
+            images_section['smoke_images'].append(image)
 
-    images = {}
+    utc_offsets = config.get('DispersionImages', "DAILY_IMAGES_UTC_OFFSETS")
 
+    collected = {}
     for height in heights:
         height_label = create_height_label(height)
         for time_series_type in TimeSeriesTypes.all_for_parameter(parameter):
-            if time_series_type in (TimeSeriesTypes.DAILY_MAXIMUM,
-                    TimeSeriesTypes.DAILY_MINIMUM,
-                    TimeSeriesTypes.DAILY_AVERAGE):
-                for utc_offset in utc_offsets:
-                    collect_color_map_dispersion_images_section_for_kml(
-                        config, parameter, images, height_label,
-                        time_series_type, utc_offset=utc_offset)
-            else:
-                collect_color_map_dispersion_images_section_for_kml(
-                    config, parameter, images, height_label,
-                    time_series_type)
-    return images
-
-def collect_color_map_dispersion_images_section_for_kml(config, parameter,
-        images, height_label, time_series_type, utc_offset=None):
-    color_map_sections = parse_color_map_names(config, parameter,
-        CONFIG_COLOR_LABELS[time_series_type])
-    for color_map_section in color_map_sections:
-
-        # Initialize and get reference to nested color section imatges dict
-        keys = [height_label, time_series_type]
-        if utc_offset is not None:
-            keys.append(get_utc_label(utc_offset))
-        keys.append(color_map_section)
-        images_section = initialize_sections_dict(images, *keys)
-
-        # create output dir
-        keys[1] = TIME_SET_DIR_NAMES[keys[1]]
-        outdir, _ = create_image_set_dir(config, parameter, *keys)
-
-        # collect images
-        images_section['root_dir'] = outdir
-        for image in os.listdir(outdir):
-            if is_smoke_image(image, parameter, height_label, time_series_type):  # <-- this is to exclude color bar
-                images_section['smoke_images'].append(image)
-            else:  #  There should only be smoke images and a legend
-                images_section['legend'] = image
+            is_daily = time_series_type in (TimeSeriesTypes.DAILY_MAXIMUM,
+                TimeSeriesTypes.DAILY_MINIMUM, TimeSeriesTypes.DAILY_AVERAGE)
+            for utc_offset in (utc_offsets if is_daily else [None]):
+                for color_map_section in parse_color_map_names(config,
+                        parameter, CONFIG_COLOR_LABELS[time_series_type]):
+                    keys = [height_label, time_series_type]
+                    if utc_offset is not None:
+                        keys.append(get_utc_label(utc_offset))
+                    keys.append(color_map_section)
+                    images_section = initialize_sections_dict(collected, *keys)
+
+                    key = (height_label, time_series_type, utc_offset,
+                        color_map_section)
+                    if key in by_set:
+                        images_section.update(by_set[key])
+                    images_section['smoke_images'].sort(key=lambda i: i.start)
+    return collected
 
 ##
 ## General image collecting utilities
@@ -1,41 +1,310 @@
 
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+import io
+import json
 import os
 import logging
 import math
 import numpy as np
 import re
-import subprocess
+import shutil
+import tempfile
+import weakref
+import zlib
+from collections import deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
 
 import matplotlib as mpl
 mpl.use('Agg')
-import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 from osgeo import gdal
+from PIL import Image, ImageChops, ImageDraw, ImageFont
+try:
+    import netCDF4
+except ImportError:
+    netCDF4 = None
 
 from .memoize import memoizeme
 from . import dispersion_file_utils as dfu
+from . import dispersionimages
+from .image_manifest import (
+    get_image_manifest, remove_image_manifest, get_grid_file_id
+)
 from .constants import (
     TimeSeriesTypes, CONFIG_COLOR_LABELS,
     TIME_SET_DIR_NAMES, PARAMETER_PLOT_LABELS
 )
 
-class BSDispersionGrid:
+##
+## Derived Parameters
+##
+
+def normalize_parameter_name(param):
+    return re.sub("[ _-]*", "", param.lower())
+
+def _pm25_to_visual_range(pm25):
+    # Visual Range (miles) = 541/PM2.5, but set to 541 if PM2.5 < 1.0
+    # See https://digitalcommons.unl.edu/cgi/viewcontent.cgi?article=1004&context=jfspresearch
+    # and https://www.fs.usda.gov/research/treesearch/62314
+    # Note: fmax, unlike maximum, treats NaN as missing, like the builtin max
+    return np.divide(541, np.fmax(pm25, 1, out=pm25), out=pm25)
+
+# US EPA PM2.5 AQI breakpoints (2024 revision); concentrations in ug/m^3
+AQI_PM25_CONCENTRATIONS = [0.0, 9.0, 9.1, 35.4, 35.5, 55.4, 55.5, 125.4,
+    125.5, 225.4, 225.5, 325.4]
+AQI_PM25_INDICES = [0, 50, 51, 100, 101, 150, 151, 200, 201, 300, 301, 500]
+
+def _pm25_to_aqi(pm25):
+    # Note that values above the highest breakpoint are capped at 500
+    aqi = np.interp(pm25, AQI_PM25_CONCENTRATIONS, AQI_PM25_INDICES)
+    aqi[np.isnan(pm25)] = np.nan
+    return aqi
+
+def _pm25_to_aqi_category(pm25):
+    # Categories are numbered from 1 (Good) to 6 (Hazardous), and are
+    # defined by the upper concentration of each of the first five
+    categories = np.searchsorted(AQI_PM25_CONCENTRATIONS[1:-1:2], pm25,
+        side='left') + 1.0
+    categories[np.isnan(pm25)] = np.nan
+    return categories
+
+# Parameters that aren't in the dispersion netCDF file but can be computed
+# from one that is.  Keys are normalized parameter names (see
+# normalize_parameter_name), and each 'convert' function is applied once,
+# to the entire [TSTEP, LAY, ROW, COL] array of the source parameter.
+# Conversion functions may modify the array passed to them.
+DERIVED_PARAMETERS = {
+    'visualrange': {
+        'source_parameter': 'PM25',
+        'convert': _pm25_to_visual_range
+    },
+    'aqi': {
+        'source_parameter': 'PM25',
+        'convert': _pm25_to_aqi
+    },
+    'aqicategory': {
+        'source_parameter': 'PM25',
+        'convert': _pm25_to_aqi_category
+    }
+}
 
-    GDAL_VERSION_MATCHER = re.compile('GDAL (\d+)\.(\d+)\.\d+, released \d+/\d+/\d+')
-    def get_geotransform(self):
-        flip_images = False
+def get_derived_parameter(param):
+    return DERIVED_PARAMETERS.get(normalize_parameter_name(param))
 
-        try:
-            gdal_info = subprocess.check_output(["gdalinfo","--version"])
-            matches = self.GDAL_VERSION_MATCHER.match(gdal_info.decode('ascii'))
-            major = int(matches.group(1))
-            minor = int(matches.group(2))
-            if (major > 1) or (major == 1 and minor >= 9):
-                flip_images = True
-        except OSError:
-            # TODO: rather than just default to flip_images = False, read value from config
-            pass
+def is_derived_parameter(param):
+    return get_derived_parameter(param) is not None
+
+
+##
+## Grid Readers
+##
+
+class GDALGridReader:
+    """Reads a parameter of a BlueSky Models3-style netCDF dispersion file
+    through GDAL's netCDF driver.
+
+    Public attributes:
+      metadata -- GDAL metadata, with global attributes keyed 'NC_GLOBAL#<name>'
+      sizeX, sizeY -- number of columns and rows
+      num_layers, num_times -- number of layers and time steps
+      north_up -- whether rows are returned north to south (i.e. the
+            reverse of the order in which they're stored in the file)
+    """
+
+    def __init__(self, filename, param):
+        gdal_filename = "NETCDF:%s:%s" % (filename, param)
+        logging.debug("loading gdal file %s", gdal_filename)
+        self.ds = gdal.Open(gdal_filename)
+        self.metadata = self.ds.GetMetadata()
+        self.sizeX = self.ds.RasterXSize
+        self.sizeY = self.ds.RasterYSize
+        self.num_layers = int(self.metadata["NC_GLOBAL#NLAYS"])
+        # BlueSky dispersion outputs are dimensioned by [TSTEP, LAY, ROW, COL].
+        # The number of GDAL raster bands (ds.RasterCount) will be TSTEP*LAY.
+        self.num_times = self.ds.RasterCount // self.num_layers
+        # GDAL >= 1.9 flips netCDF rows so that they're north up
+        self.north_up = int(gdal.VersionInfo('VERSION_NUM')) >= 1090000
+
+    def read(self, times, layers, window):
+        """Reads the given times and layers, within the (xoff, yoff, xsize,
+        ysize) window, in a single GDAL read.
+
+        Returns an array dimensioned by [time, layer, row, col]
+        """
+        # GDAL bands will increment by layer the fastest, then by time
+        band_list = [t * self.num_layers + z + 1 for t in times for z in layers]
+        return self.ds.ReadAsArray(*window, band_list=band_list).reshape(
+            len(times), len(layers), window[3], window[2])
+
+
+class NetCDFGridReader:
+    """Reads a parameter of a BlueSky Models3-style netCDF dispersion file
+    directly, with the netCDF4 package, one hyperslab per read.
+
+    Has the same public attributes as GDALGridReader.  Global attributes
+    are formatted as GDAL formats them, and rows are returned north up,
+    so that grids are identical regardless of reader.
+    """
+
+    def __init__(self, filename, param):
+        if not netCDF4:
+            raise ImportError("The netCDF4 package is required to read grids"
+                " with the 'netcdf' reader")
+        logging.debug("loading netCDF file %s, variable %s", filename, param)
+        self.ds = netCDF4.Dataset(filename)
+        self.var = self.ds.variables[param]
+        self.var.set_auto_mask(False)
+        self.metadata = dict(("NC_GLOBAL#" + k,
+            self._format_attribute(self.ds.getncattr(k)))
+            for k in self.ds.ncattrs())
+        self.num_times, self.num_layers, self.sizeY, self.sizeX = self.var.shape
+        self.north_up = True
+
+    def _format_attribute(self, val):
+        if np.ndim(val) > 0:
+            return '{' + ','.join([self._format_value(e) for e in val]) + '}'
+        return self._format_value(val)
+
+    def _format_value(self, val):
+        # Doubles, e.g. XORIG and XCELL, need 17 significant digits to
+        # round trip, so that the geotransform isn't truncated
+        if isinstance(val, (float, np.float64)):
+            return '%.17g' % val
+        if isinstance(val, np.floating):
+            return '%.8g' % val
+        return str(val)
+
+    def read(self, times, layers, window):
+        """Reads the given times and layers, within the (xoff, yoff, xsize,
+        ysize) window, in a single hyperslab read.
+
+        Returns an array dimensioned by [time, layer, row, col]
+        """
+        xoff, yoff, xsize, ysize = window
+        # rows are stored south to north; window rows are north to south
+        rows = slice(self.sizeY - yoff - ysize, self.sizeY - yoff)
+        data = self.var[self._index(times), self._index(layers), rows,
+            xoff:xoff + xsize]
+        return data[:, :, ::-1, :]
+
+    def _index(self, indices):
+        # Contiguous indices are read as a slice, which is more efficient
+        indices = list(indices)
+        if indices == list(range(indices[0], indices[-1] + 1)):
+            return slice(indices[0], indices[-1] + 1)
+        return indices
+
+GRID_READERS = {
+    'gdal': GDALGridReader,
+    'netcdf': NetCDFGridReader
+}
+
+def get_grid_reader_class(reader):
+    if reader == 'auto':
+        reader = 'netcdf' if netCDF4 else 'gdal'
+    if reader not in GRID_READERS:
+        raise ValueError("Invalid grid reader: {}".format(reader))
+    return GRID_READERS[reader]
+
+
+##
+## Grid Storage
+##
+
+class GridStorage:
+    """Determines how grid values are held in memory - as float64 (the
+    default), float32, or uint16 values scaled and offset such that
+    value = stored * scale + offset.
+
+    With uint16 storage, values are rounded to the nearest multiple of
+    scale, values outside of the representable range are clipped to it,
+    and NaN is stored as FILL_VALUE.  Stored values are decoded to float32.
+    """
+
+    DTYPES = ('float64', 'float32', 'uint16')
+    FILL_VALUE = np.iinfo(np.uint16).max
+
+    def __init__(self, dtype='float64', scale=None, offset=0.0):
+        if dtype not in self.DTYPES:
+            raise ValueError("Invalid storage dtype: {}".format(dtype))
+        self.dtype = np.dtype(dtype)
+        self.is_scaled = self.dtype.kind == 'u'
+        if self.is_scaled:
+            if not scale or scale <= 0:
+                raise ValueError("{} storage requires a positive scale".format(
+                    dtype))
+            self.scale = float(scale)
+            self.offset = float(offset)
+            self.value_dtype = np.dtype('float32')
+        else:
+            self.value_dtype = self.dtype
+
+    def encode(self, data):
+        """Converts float values to the storage dtype"""
+        data = np.asarray(data)
+        if not self.is_scaled:
+            return data.astype(self.dtype, copy=False)
+
+        stored = np.rint((data - self.offset) / self.scale)
+        np.clip(stored, 0, self.FILL_VALUE - 1, out=stored)
+        stored[np.isnan(data)] = self.FILL_VALUE
+        return stored.astype(self.dtype)
+
+    def decode(self, stored):
+        """Converts stored values back to floats"""
+        if not self.is_scaled:
+            return stored
+
+        values = np.asarray(stored, dtype=self.value_dtype)
+        values *= self.value_dtype.type(self.scale)
+        values += self.value_dtype.type(self.offset)
+        values[np.asarray(stored) == self.FILL_VALUE] = np.nan
+        return values
+
+    def wrap(self, stored):
+        """Returns an array-like of already encoded values that yields
+        decoded values when indexed
+        """
+        return StoredGridData(stored, self) if self.is_scaled else stored
+
+    def store(self, data):
+        return self.wrap(self.encode(data))
+
+def create_grid_storage(config):
+    return GridStorage(
+        dtype=config.get('DispersionGridInput', "STORAGE_DTYPE"),
+        scale=config.getfloat('DispersionGridInput', "STORAGE_SCALE"),
+        offset=config.getfloat('DispersionGridInput', "STORAGE_OFFSET"))
+
+
+class StoredGridData:
+    """Stands in for an array of scaled integer values, decoding them as
+    they're accessed, e.g. data[t, layer, :, :] returns floats.
+    """
+
+    def __init__(self, stored, storage):
+        self.stored = stored
+        self._storage = storage
+        self.shape = stored.shape
+        self.ndim = stored.ndim
+        self.dtype = storage.value_dtype
+
+    def __len__(self):
+        return self.shape[0]
 
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self[:], dtype=dtype)
+
+    def __getitem__(self, key):
+        return self._storage.decode(self.stored[key])
+
+
+class BSDispersionGrid:
+
+    def get_geotransform(self):
         x0 = float(self.metadata["NC_GLOBAL#XORIG"])
         y0 = float(self.metadata["NC_GLOBAL#YORIG"])
         dx = float(self.metadata["NC_GLOBAL#XCELL"])
@@ -43,12 +312,14 @@ class BSDispersionGrid:
         #nx = int(self.metadata["NC_GLOBAL#NCOLS"])
         ny = int(self.metadata["NC_GLOBAL#NROWS"])
 
-        if flip_images:
+        # The reader determines the row orientation
+        if self.reader.north_up:
             return (x0, dx, 0.0, y0+float(ny-1)*dy, 0.0, -dy)
         else:
             return (x0, dx, 0.0, y0, 0.0, dy)
 
-    def __init__(self, filename, param=None, time=None):
+    def __init__(self, filename, param=None, time=None, data_access='eager',
+            layers=None, bbox=None, reader='gdal', storage=None):
         if not os.path.exists(filename):
             raise ValueError("NetCDF file does not exists - {}.".format(
                 filename))
@@ -56,14 +327,16 @@ class BSDispersionGrid:
         if not param:
             raise ValueError ("No NetCDF parameter supplied.")
 
-        # if param is "visual range", we actually read PM25
-        self.is_visual_range = re.sub("[ _-]*", "", param.lower()) == 'visualrange'
-        file_param = 'PM25' if self.is_visual_range else param
-        gdal_filename = "NETCDF:%s:%s" % (filename, file_param)
-        logging.debug("loading gdal file %s", gdal_filename)
+        # if param is a derived parameter (e.g. "visual range"), we actually
+        # read its source parameter (e.g. PM25) and convert it once loaded
+        self.parameter = param
+        self.derived_parameter = get_derived_parameter(param)
+        self.is_visual_range = normalize_parameter_name(param) == 'visualrange'
+        self.file_param = (self.derived_parameter['source_parameter']
+            if self.derived_parameter else param)
 
-        self.ds = gdal.Open(gdal_filename)
-        self.metadata = self.ds.GetMetadata()
+        self.reader = get_grid_reader_class(reader)(filename, self.file_param)
+        self.metadata = self.reader.metadata
 
         if not self.is_ioapi():
             raise Exception("[ERROR] Not dealing with a BlueSky Models3-style netCDF dispersion file.")
@@ -78,42 +351,123 @@ class BSDispersionGrid:
         # Extract grid information
         self.minX, self.cellSizeX, self.skewX = self.geotransform[:3]
         self.minY, self.skewY, self.cellSizeY = self.geotransform[3:]
-        self.sizeX = self.ds.RasterXSize
-        self.sizeY = self.ds.RasterYSize
-        self.sizeZ = int(self.metadata["NC_GLOBAL#NLAYS"])
-        self.heights = self.metadata['NC_GLOBAL#VGLVLS'].replace('{','').replace(',0}','').split(',')
-
-        # BlueSky dispersion outputs are dimensioned by [TSTEP, LAY, ROW, COL].
-        # The number of GDAL raster bands (ds.RasterCount) will be TSTEP*LAY.
-        self.num_times = self.ds.RasterCount // self.sizeZ
+        self.sizeX = self.reader.sizeX
+        self.sizeY = self.reader.sizeY
+        self.num_file_layers = self.reader.num_layers
+        heights = self.metadata['NC_GLOBAL#VGLVLS'].replace('{','').replace(',0}','').split(',')
+        self.num_times = self.reader.num_times
+
+        # Only the requested layers, and only the rows and columns within
+        # the requested bounding box, are read.  The grid's layer indices,
+        # heights, and dimensions refer to that subset.
+        self.set_layers(layers)
+        self.heights = [heights[l] for l in self.layers]
+        if bbox:
+            self.set_window(bbox)
+        else:
+            self.window = (0, 0, self.sizeX, self.sizeY)
 
         # Extract date-time information
         self.datetimes = self.get_datetimes()
 
-        # Extract the data
-        timeid = 0
-        layerid = 0
-        self.data = np.zeros((self.num_times, self.sizeZ, self.sizeY, self.sizeX), dtype=float)
-        for i in range(self.ds.RasterCount):
-            rb = self.ds.GetRasterBand(i+1)
-            data = rb.ReadAsArray(0, 0, self.sizeX, self.sizeY)
-            # if param is "visual range", we need to convert PM25 values
-            if self.is_visual_range:
-                logging.debug("Converting PM2.5 to visual range")
-                for d in data:
-                    for k in range(len(d)):
-                        # Visual Range (miles) = 541/PM2.5, but set to 541 if PM2.5 < 1.0
-                        # See https://digitalcommons.unl.edu/cgi/viewcontent.cgi?article=1004&context=jfspresearch
-                        # and https://www.fs.usda.gov/research/treesearch/62314
-                        d[k] = 541 / max(1, d[k])
-
-            self.data[timeid,layerid,:,:] = data
-
-            # GDAL bands will increment by layer the fastest, then by time
-            layerid += 1
-            if layerid == self.sizeZ:
-                timeid += 1
-                layerid = 0
+        # Values are held in memory, in grid.data and in any aggregates,
+        # using the storage's dtype
+        self.storage = storage or GridStorage()
+
+        # Daily aggregates, keyed by (statistic, layer, utc_offset); see
+        # get_daily_aggregate
+        self._daily_aggregates = {}
+        # Rolling window statistics, keyed by (statistic, layer, width); see
+        # get_rolling_window
+        self._rolling_windows = {}
+
+        # Extract the data.  In 'eager' mode, the whole (sub)grid is read at
+        # once.  Otherwise, grid.data reads [time, layer] slabs as they're
+        # accessed, caching them in memory ('lazy') or in a memory-mapped
+        # temporary file ('mmap')
+        if data_access == 'eager':
+            self.data = self.read_all()
+        elif data_access in ('lazy', 'mmap'):
+            self.data = LazyGridData(self, memory_mapped=(data_access == 'mmap'),
+                storage=self.storage)
+        else:
+            raise ValueError("Invalid data access mode: {}".format(data_access))
+
+    def set_layers(self, layers):
+        if layers is None:
+            layers = list(range(self.num_file_layers))
+        elif max(layers) >= self.num_file_layers:
+            raise Exception("Requested layers ({}) outside of what's available in"
+                " dispersion grid (which has {} layer{})".format(
+                    ', '.join([str(e) for e in layers]), self.num_file_layers,
+                    's' if self.num_file_layers > 1 else ''))
+        self.layers = list(layers)
+        self.sizeZ = len(self.layers)
+
+    def set_window(self, bbox):
+        """Restricts the grid to the rows and columns covering the given
+        (lonmin, latmin, lonmax, latmax) bounding box
+        """
+        lonmin, latmin, lonmax, latmax = bbox
+        cols = sorted([(lon - self.minX) / self.cellSizeX for lon in (lonmin, lonmax)])
+        rows = sorted([(lat - self.minY) / self.cellSizeY for lat in (latmin, latmax)])
+        # Include the grid points just outside of the bounding box, so
+        # that the plotted area covers all of it
+        col0 = max(0, int(math.floor(cols[0])))
+        col1 = min(self.sizeX, int(math.ceil(cols[1])) + 1)
+        row0 = max(0, int(math.floor(rows[0])))
+        row1 = min(self.sizeY, int(math.ceil(rows[1])) + 1)
+        if col0 >= col1 or row0 >= row1:
+            raise ValueError("Bounding box {} does not intersect the dispersion"
+                " grid".format(bbox))
+
+        self.window = (col0, row0, col1 - col0, row1 - row0)
+        logging.debug("Reading grid window (xoff, yoff, xsize, ysize): %s",
+            self.window)
+        self.minX += col0 * self.cellSizeX
+        self.minY += row0 * self.cellSizeY
+        self.sizeX = col1 - col0
+        self.sizeY = row1 - row0
+        self.geotransform = (self.minX, self.cellSizeX, self.skewX,
+            self.minY, self.skewY, self.cellSizeY)
+
+    def read(self, times, layers):
+        """Reads the specified times and layers in a single read,
+        converting to the derived parameter, if necessary.  Layer indices
+        are into self.layers, and only the grid window is read.
+
+        Returns an array dimensioned by [time, layer, row, col]
+        """
+        data = np.asarray(self.reader.read(list(times),
+            [self.layers[z] for z in layers], self.window), dtype=float)
+
+        # Derived parameters are computed over the entire read, not per band
+        if self.derived_parameter:
+            logging.debug("Converting %s to %s", self.file_param, self.parameter)
+            data = self.derived_parameter['convert'](data)
+
+        return data
+
+    def read_all(self):
+        """Reads the entire (sub)grid into the storage dtype"""
+        if self.storage.dtype == np.float64:
+            return self.read(range(self.num_times), range(self.sizeZ))
+
+        # Read one time step at a time, so that the full grid is never
+        # held at float64
+        stored = np.empty((self.num_times, self.sizeZ, self.sizeY, self.sizeX),
+            dtype=self.storage.dtype)
+        for t in range(self.num_times):
+            stored[t] = self.storage.encode(self.read([t], range(self.sizeZ))[0])
+        return self.storage.wrap(stored)
+
+    def iter_time_steps(self):
+        """Yields (t, data) for each time step, where data is dimensioned
+        by [layer, row, col].  Time steps are read one at a time, as
+        they're needed, and aren't cached.
+        """
+        for t in range(self.num_times):
+            yield t, self.read([t], range(self.sizeZ))[0]
 
     def is_ioapi(self):
         if "NC_GLOBAL#IOAPI_VERSION" in self.metadata:
@@ -162,40 +516,562 @@ class BSDispersionGrid:
             self.local_start + i * self.ONE_DAY for i in range(self.num_days)
         ]
 
-    def calc_aggregate_data(self, utc_offset=0):
-        """Calculate various daily aggregates
-
-        Assumes hourly time interval.
+    def get_day_starts(self, utc_offset):
+        """Returns the index of the first time step of each full or partial
+        local day.  Assumes hourly time interval.
+        """
+        local_start = self.datetimes[0] + timedelta(hours=utc_offset)
+        return np.array([0] + list(range(24 - local_start.hour,
+            self.num_times, 24)), dtype=int)
+
+    def get_daily_aggregate(self, statistic, layer, utc_offset,
+            utc_offsets=None):
+        """Returns the daily statistic ('max', 'min', or 'mean'; see
+        DAILY_STATISTICS) of the given layer, for local days at utc_offset,
+        dimensioned by [day, row, col].
+
+        Each (statistic, layer, utc_offset) is computed only once.  When
+        it's first requested, it's computed along with those of all other
+        utc_offsets - the 'max' and 'min' in a single pass over the layer's
+        data, and the 'mean' summed in time order for each offset, so that
+        it's the same as np.average's.
         """
         assert utc_offset > -24 and utc_offset < 24, ("[ERROR] utc_offset "
             "for aggregate calculations must be between -24 and 24.")
 
-        self.compute_days_spanned(utc_offset)
-        self.max_data = np.zeros((self.num_days, self.sizeZ, self.sizeY, self.sizeX), dtype=float)
-        self.min_data = np.zeros((self.num_days, self.sizeZ, self.sizeY, self.sizeX), dtype=float)
-        self.avg_data = np.zeros((self.num_days, self.sizeZ, self.sizeY, self.sizeX), dtype=float)
+        key = (statistic, layer, utc_offset)
+        if key not in self._daily_aggregates:
+            utc_offsets = sorted(set(utc_offsets or []) | set([utc_offset]))
+            self._calc_daily_aggregates(statistic, layer, [
+                o for o in utc_offsets
+                if (statistic, layer, o) not in self._daily_aggregates])
+        return self._daily_aggregates[key]
+
+    def _calc_daily_aggregates(self, statistic, layer, utc_offsets):
+        if statistic not in DAILY_STATISTICS:
+            raise ValueError("Invalid daily statistic: {}".format(statistic))
+        ufunc = DAILY_STATISTICS[statistic]
+        logging.debug("Computing daily %s of layer %s for UTC offsets %s",
+            statistic, layer, utc_offsets)
+
+        day_starts = dict((o, self.get_day_starts(o)) for o in utc_offsets)
+        data = self.data[:,layer,:,:]
+        if statistic == 'mean':
+            # Summed in time order, as np.average and DailyAggregateState
+            # sum them, rather than reducing shared segments of days, which
+            # can differ in the last bits and so move a mean equal to a
+            # contour level into the next interval
+            for utc_offset, starts in day_starts.items():
+                self._daily_aggregates[(statistic, layer, utc_offset)] = (
+                    self.storage.store(_daily_mean(data, starts)))
+            return
+
+        # Reduce the hours between every day boundary of every offset, and
+        # then reduce those segments into each offset's days
+        segment_starts = np.unique(np.concatenate(list(day_starts.values())))
+        segments = ufunc.reduceat(data, segment_starts, axis=0)
+        for utc_offset, starts in day_starts.items():
+            days = ufunc.reduceat(segments,
+                np.searchsorted(segment_starts, starts), axis=0)
+            self._daily_aggregates[(statistic, layer, utc_offset)] = (
+                self.storage.store(days))
 
-        shour = 0
-        ehour = min(24 - self.local_start.hour, self.num_times)
+    def calc_aggregate_data(self, utc_offset=0):
+        """Calculate various daily aggregates, for all layers
 
-        for day in range(self.num_days):
+        Sets max_data, min_data, and avg_data, dimensioned by [day, layer,
+        row, col].  Daily images use get_daily_aggregate instead, which
+        computes only what's needed.
+        """
+        self.compute_days_spanned(utc_offset)
+        for attr, statistic in (('max_data', 'max'), ('min_data', 'min'),
+                ('avg_data', 'mean')):
+            data = np.zeros((self.num_days, self.sizeZ, self.sizeY, self.sizeX),
+                dtype=self.storage.dtype)
             for layer in range(self.sizeZ):
-                self.max_data[day,layer,:,:] = np.max(self.data[shour:ehour,layer,:,:], axis=0)
-                self.min_data[day,layer,:,:] = np.min(self.data[shour:ehour,layer,:,:], axis=0)
-                self.avg_data[day,layer,:,:] = np.average(self.data[shour:ehour,layer,:,:], axis=0)
-            shour = ehour
-            ehour  = min(ehour + 24, self.num_times)
+                data[:,layer,:,:] = self.storage.encode(self.get_daily_aggregate(
+                    statistic, layer, utc_offset)[:])
+            setattr(self, attr, self.storage.wrap(data))
+
+    def get_rolling_window(self, statistic, layer, width):
+        """Returns the rolling statistic ('mean' or 'nowcast'; see
+        ROLLING_STATISTICS) of every `width` consecutive time steps of the
+        given layer, dimensioned by [window, row, col], where window i
+        covers time steps i through i + width - 1.
 
+        Each (statistic, layer, width) is computed only once.
+        """
+        key = (statistic, layer, width)
+        if key not in self._rolling_windows:
+            if statistic not in ROLLING_STATISTICS:
+                raise ValueError("Invalid rolling statistic: {}".format(
+                    statistic))
+            logging.debug("Computing %s hour rolling %s of layer %s", width,
+                statistic, layer)
+            self._rolling_windows[key] = self.storage.store(
+                ROLLING_STATISTICS[statistic](self.data[:,layer,:,:], width))
+        return self._rolling_windows[key]
+
+# Daily statistics, by name, and the ufuncs that accumulate them over a
+# day's time steps (the 'mean' being the sum divided by the number of hours)
+DAILY_STATISTICS = {
+    'max': np.maximum,
+    'min': np.minimum,
+    'mean': np.add
+}
+
+def _daily_mean(data, starts):
+    # The mean of the [time, row, col] data of each day starting at the
+    # given time step indices.  Each day's time steps are added into a
+    # float64 accumulator in time order, as the hour of the day is
+    # advanced across all days at once
+    hours = np.diff(np.append(starts, len(data)))
+    sums = np.array(data[starts], dtype=np.float64)
+    for h in range(1, hours.max(initial=0)):
+        days = np.flatnonzero(hours > h)
+        if len(days) == len(starts):
+            sums += data[starts + h]
+        else:
+            sums[days] += data[starts[days] + h]
+    sums /= hours[:, np.newaxis, np.newaxis]
+    return sums
+
+class _WindowSum:
+    """The running sum of a window of [row, col] frames, updated in constant
+    time as frames are added to and removed from it, whatever the window's
+    width.
+
+    Each update is error free (Knuth's TwoSum), with the rounding errors
+    accumulated separately, so that the sum is that of the window's values
+    rounded once, rather than depending on the order they were added and
+    removed in - a running sum's drift could otherwise move a mean equal to
+    a contour level into the next interval.  Windows of only zeros, e.g.
+    after a spike has left them, sum to exactly zero.
+    """
+
+    def __init__(self, shape):
+        self._sum = np.zeros(shape)
+        self._errors = np.zeros(shape)
+        self._nonzero = np.zeros(shape, dtype=np.int64)
+        # buffers, so that updates don't allocate
+        self._value = np.empty(shape)
+        self._new_sum = np.empty(shape)
+        self._tmp = np.empty(shape)
+        self._mask = np.empty(shape, dtype=bool)
+
+    def add(self, frame):
+        np.copyto(self._value, frame)
+        self._update()
+        self._nonzero += np.not_equal(frame, 0, out=self._mask)
+
+    def remove(self, frame):
+        np.negative(frame, out=self._value, dtype=np.float64)
+        self._update()
+        self._nonzero -= np.not_equal(frame, 0, out=self._mask)
+
+    def _update(self):
+        # s = a + v, whose rounding error is (a - (s - b)) + (v - b), where
+        # b = s - a
+        v, a, s, b = self._value, self._sum, self._new_sum, self._tmp
+        np.add(a, v, out=s)
+        np.subtract(s, a, out=b)
+        np.subtract(v, b, out=v)
+        np.subtract(s, b, out=b)
+        np.subtract(a, b, out=b)
+        np.add(b, v, out=b)
+        self._errors += b
+        self._sum, self._new_sum = s, a
+
+    def total(self, out=None):
+        total = np.add(self._sum, self._errors, out=out)
+        total[self._nonzero == 0] = 0.0
+        return total
+
+def _rolling_mean(data, width):
+    # Each window's sum is updated from the last's, by adding the time step
+    # entering it and removing the one leaving it, so that every width
+    # costs the same
+    num_windows = max(len(data) - width + 1, 0)
+    means = np.empty((num_windows,) + data.shape[1:])
+    window_sum = _WindowSum(data.shape[1:])
+    for t in range(len(data) if num_windows else 0):
+        window_sum.add(data[t])
+        if t >= width:
+            window_sum.remove(data[t - width])
+        if t >= width - 1:
+            np.divide(window_sum.total(out=means[t - width + 1]), width,
+                out=means[t - width + 1])
+    return means
+
+def _rolling_nowcast(data, width):
+    # EPA NowCast-style weighted average, weighting the value i hours before
+    # the most recent by w**i, where w is the ratio of the window's minimum
+    # to its maximum, but no less than 0.5
+    if len(data) < width:
+        return np.zeros((0,) + data.shape[1:])
+    windows = np.lib.stride_tricks.sliding_window_view(data, width, axis=0)
+    minimums = windows.min(axis=-1).astype(np.float64)
+    maximums = windows.max(axis=-1)
+    weight = np.divide(minimums, maximums, out=np.ones_like(minimums),
+        where=(maximums > 0))
+    np.fmax(weight, 0.5, out=weight)
+
+    numerator = np.zeros_like(weight)
+    denominator = np.zeros_like(weight)
+    weight_i = np.ones_like(weight)
+    for i in range(width):
+        numerator += weight_i * data[width - 1 - i:len(data) - i]
+        denominator += weight_i
+        weight_i *= weight
+    return np.divide(numerator, denominator, out=numerator)
+
+# Rolling window statistics, by name.  Each function takes a layer's
+# [time, row, col] data and window width, and returns [window, row, col]
+ROLLING_STATISTICS = {
+    'mean': _rolling_mean,
+    'nowcast': _rolling_nowcast
+}
+
+
+class RollingWindowState:
+    """Computes a rolling window statistic (see ROLLING_STATISTICS) from
+    one time step at a time, keeping only as many frames as the window
+    needs.  Results are the same as those of BSDispersionGrid.get_rolling_window.
+    """
+
+    def __init__(self, statistic, width):
+        if statistic not in ROLLING_STATISTICS:
+            raise ValueError("Invalid rolling statistic: {}".format(statistic))
+        self.statistic = statistic
+        self.width = width
+        self._frames = deque(maxlen=width)
+        # the window's running sum (see _WindowSum), for the 'mean'
+        self._sum = None
+
+    def add(self, frame):
+        """Adds the next time step's [row, col] frame.  Returns the
+        statistic of the window ending with it, or None if fewer than
+        `width` time steps have been added.
+        """
+        if self.statistic == 'mean':
+            # Updated as _rolling_mean updates it, adding the frame before
+            # removing the one leaving the window, for the same results
+            if self._sum is None:
+                self._sum = _WindowSum(np.shape(frame))
+            self._sum.add(frame)
+            if len(self._frames) == self.width:
+                self._sum.remove(self._frames[0])
+            self._frames.append(frame)
+            if len(self._frames) == self.width:
+                return np.divide(self._sum.total(), self.width)
+            return None
+
+        self._frames.append(frame)
+        if len(self._frames) == self.width:
+            return ROLLING_STATISTICS[self.statistic](
+                np.array(self._frames), self.width)[0]
+        return None
+
+
+class DailyAggregateState:
+    """Computes daily statistics (see DAILY_STATISTICS), for local days
+    starting at the given time step indices, from one time step at a time.
+    """
+
+    def __init__(self, statistics, day_starts, num_times):
+        for statistic in statistics:
+            if statistic not in DAILY_STATISTICS:
+                raise ValueError("Invalid daily statistic: {}".format(statistic))
+        self.statistics = statistics
+        self._day_ends = set(np.append(day_starts[1:], num_times) - 1)
+        self._day = 0
+        self._hours = 0
+        self._values = {}
+
+    def add(self, t, frame):
+        """Adds time step t's [row, col] frame.  If t is the last time step
+        of a day, returns (day, values), where day is the index of the day,
+        and values are the day's [row, col] aggregates keyed by statistic.
+        Otherwise, returns None.
+        """
+        for statistic in self.statistics:
+            if self._hours == 0:
+                # accumulate at float64, whatever the storage dtype
+                self._values[statistic] = np.array(frame,
+                    dtype=(np.float64 if statistic == 'mean' else frame.dtype))
+            else:
+                DAILY_STATISTICS[statistic](self._values[statistic], frame,
+                    out=self._values[statistic])
+        self._hours += 1
+
+        if t in self._day_ends:
+            day, values = self._day, self._values
+            if 'mean' in values:
+                values['mean'] /= self._hours
+            self._day += 1
+            self._hours = 0
+            self._values = {}
+            return day, values
+        return None
+
+
+class LazyGridData:
+    """Stands in for BSDispersionGrid.data, reading [time, layer] slabs from
+    the dispersion file the first time they're accessed, and caching them.
+
+    Supports basic indexing on the time and layer dimensions (integers,
+    slices, or lists of indices), followed by any indexing on rows and
+    columns, e.g. data[t, layer, :, :] or data[t0:t1, layer].
+
+    Slabs are cached in the storage dtype, and decoded when accessed.
+    """
+
+    def __init__(self, grid, memory_mapped=False, storage=None):
+        self._grid = grid
+        self._storage = storage or GridStorage()
+        self.shape = (grid.num_times, grid.sizeZ, grid.sizeY, grid.sizeX)
+        self.ndim = len(self.shape)
+        self.dtype = self._storage.value_dtype
+        self._loaded = np.zeros(self.shape[:2], dtype=bool)
+        if memory_mapped:
+            # Slabs are cached in a temporary file, so that they can be
+            # paged out rather than all staying resident
+            self._cache = np.memmap(tempfile.TemporaryFile(),
+                dtype=self._storage.dtype, mode='w+', shape=self.shape)
+        else:
+            self._cache = {}
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self[:], dtype=dtype)
+
+    def __getitem__(self, key):
+        key = key if isinstance(key, tuple) else (key,)
+        time_key = key[0]
+        layer_key = key[1] if len(key) > 1 else slice(None)
+        times = np.arange(self.shape[0])[time_key]
+        layers = np.arange(self.shape[1])[layer_key]
+        self._load(np.unique(times), np.unique(layers))
+
+        if isinstance(self._cache, np.memmap):
+            return self._storage.decode(self._cache[key])
+
+        data = np.array([[self._cache[t, z] for z in np.atleast_1d(layers)]
+            for t in np.atleast_1d(times)])
+        # drop the time and/or layer dimensions if indexed by integer
+        return self._storage.decode(data[(0 if np.ndim(times) == 0 else slice(None),
+            0 if np.ndim(layers) == 0 else slice(None)) + key[2:]])
+
+    def _load(self, times, layers):
+        # Read, in one read, every time and layer with any slab not yet
+        # loaded.  (In practice, that's just the missing slabs.)
+        missing = ~self._loaded[np.ix_(times, layers)]
+        if missing.any():
+            times = times[missing.any(axis=1)]
+            layers = layers[missing.any(axis=0)]
+            logging.debug("Reading %s time(s) x %s layer(s)", len(times),
+                len(layers))
+            data = self._storage.encode(self._grid.read(times, layers))
+            for i, t in enumerate(times):
+                for j, z in enumerate(layers):
+                    self._cache[int(t), int(z)] = data[i, j]
+            self._loaded[np.ix_(times, layers)] = True
+
+
+##
+## Frames
+##
+
+class RenderFrame:
+    """A frame of data - an hour, rolling window or daily aggregate of a
+    layer - as handed to every color map and output sink that renders it.
+    Arrays derived from the frame, such as its resampling for GeoTIFFs and
+    its classification against a set of levels, are computed by whichever
+    plot first needs them, and reused by every other plot rendering the
+    frame.  (All such plots share the grid's geometry.)  Frames read ahead
+    together (see render_frame_batch) may derive arrays for all of them
+    at once.
+    """
+
+    def __init__(self, data, batch=None):
+        self.data = np.asarray(data)
+        self.shape = self.data.shape
+        self._derived = {}
+        # Weak references to the frames in this frame's batch, if any
+        self._batch = batch
+
+    def derive(self, key, compute):
+        """Returns the array identified by key, calling compute to create
+        it the first time it's asked for
+        """
+        if key not in self._derived:
+            self._derived[key] = compute()
+        return self._derived[key]
+
+    def derive_batch(self, key, compute):
+        """As derive, except that compute is called with the data of all
+        frames in the batch that haven't yet derived the array, stacked,
+        and returns the array derived from each of them
+        """
+        if key not in self._derived:
+            frames = ([f for f in (ref() for ref in self._batch)
+                if f is not None and key not in f._derived]
+                if self._batch else [self])
+            for frame, derived in zip(frames, compute(np.stack(
+                    [f.data for f in frames]))):
+                frame._derived[key] = derived
+        return self._derived[key]
+
+def as_render_frame(raster_data):
+    if isinstance(raster_data, RenderFrame):
+        return raster_data
+    return RenderFrame(raster_data)
+
+def render_frame_batch(frames):
+    """Returns RenderFrames of frames, which derive arrays together (see
+    RenderFrame.derive_batch).  Frames reference each other weakly, so
+    each is released as soon as it's no longer used.
+    """
+    batch = []
+    render_frames = [RenderFrame(data, batch=batch) for data in frames]
+    batch.extend(weakref.ref(frame) for frame in render_frames)
+    return render_frames
+
+def batch_render_frames(frames, batch_size):
+    """Yields RenderFrames of frames, read ahead in batches of batch_size"""
+    frames = iter(frames)
+    while True:
+        batch = render_frame_batch(islice(frames, batch_size))
+        if not batch:
+            return
+        yield from batch
+
+
+# zlib compression strategies for PNG images, by name; 'default' leaves
+# the choice to PIL
+PNG_COMPRESS_TYPES = {
+    'default': -1,
+    'filtered': zlib.Z_FILTERED,
+    'huffman_only': zlib.Z_HUFFMAN_ONLY,
+    'rle': zlib.Z_RLE,
+    'fixed': zlib.Z_FIXED
+}
+
+# The number of frames read ahead, so that their GeoTIFFs are resampled
+# and classified together
+FRAMES_PER_BATCH = 24
+
+# Each kind of GeoTIFF, by the option that enables it, and its file name
+# suffix
+GEOTIFF_KINDS = {
+    'rgba': ('CREATE_RGBA_GEOTIFFS', '-rgba'),
+    'raw-pm25': ('CREATE_SINGLE_BAND_RAW_PM25_GEOTIFFS', '-raw-pm25'),
+    'smoke-level': ('CREATE_SINGLE_BAND_SMOKE_LEVEL_GEOTIFFS', '')
+}
+
+# GeoTIFFs are written a file per frame, or a file per image set, as a
+# multi-band GeoTIFF or netCDF file - see add_to_geotiff_series
+GEOTIFF_LAYOUTS = ('frame', 'series', 'netcdf')
+
+# Compression of COGs and GeoTIFF series - see get_geotiff_creation_options
+GEOTIFF_COMPRESSIONS = ('NONE', 'DEFLATE', 'ZSTD', 'LZW')
+
+def get_geotiff_kinds(config):
+    """Returns the kinds of GeoTIFFs configured (see GEOTIFF_KINDS)"""
+    return [kind for kind, (option, suffix) in GEOTIFF_KINDS.items()
+        if config.getboolean('DispersionGridOutput', option)]
+
+def writes_geotiff_series(config):
+    """Returns True if GeoTIFFs are configured, and written as series"""
+    return bool(config.get('DispersionGridOutput', "GEOTIFF_OUTPUT_DIR")
+        and config.get('DispersionGridOutput', "GEOTIFF_LAYOUT") != 'frame'
+        and get_geotiff_kinds(config))
+
+def mathtext_to_plain_text(label):
+    """Approximates the mathtext in a legend label (e.g. those in
+    PARAMETER_PLOT_LABELS) in plain ASCII text, which PIL's default font
+    covers, for legends drawn without matplotlib - e.g. '$PM_{2.5}$' as
+    'PM2.5'.  Only sub- and superscripts, \\mu and thin spaces (\\/) are
+    translated.
+    """
+    def _plain(match):
+        # Spaces are ignored in mathtext
+        text = match.group(1).replace(' ', '')
+        text = text.replace(r'\/', ' ').replace(r'\mu', 'u')
+        return re.sub(r'[_^]\{([^}]*)\}|[_^](\w)',
+            lambda m: m.group(1) or m.group(2), text)
+    return re.sub(r'\$(.*?)\$', _plain, label)
+
+@memoizeme
+def get_rendered_legends(config):
+    """Returns the pathname of the first legend rendered with this config,
+    by legend key (see BSDispersionPlot.get_legend_key), in this process
+    """
+    return {}
 
 class BSDispersionPlot:
 
     def __init__(self, config, parameter, section, dpi=75):
         self.config = config
-        self.is_visual_range = re.sub("[ _-]*", "", parameter.lower()) == 'visualrange'
+        self.parameter = parameter
+        self.is_visual_range = normalize_parameter_name(parameter) == 'visualrange'
         self.parameter_label = PARAMETER_PLOT_LABELS.get(parameter) or parameter
         self.section = section
         self.dpi = dpi
         self.export_format = 'png'
+        # 'contour' renders PNGs with matplotlib's contourf; 'raster'
+        # classifies resampled grid values directly (see create_raster_png)
+        self.renderer = config.get('DispersionImages', "RENDERER")
+        if self.renderer not in ('contour', 'raster'):
+            raise ValueError("Invalid renderer: {}".format(self.renderer))
+        # 'matplotlib' draws legends as colorbar figures; 'pil' draws them
+        # directly (see draw_colorbar)
+        self.legend_renderer = config.get('DispersionImages', "LEGEND_RENDERER")
+        if self.legend_renderer not in ('matplotlib', 'pil'):
+            raise ValueError("Invalid legend renderer: {}".format(
+                self.legend_renderer))
+        # PNG encoding - see write_image
+        self.png_palette = config.getboolean('DispersionImages', "PNG_PALETTE")
+        self.png_compress_level = config.getint('DispersionImages',
+            "PNG_COMPRESS_LEVEL")
+        compress_type = config.get('DispersionImages', "PNG_COMPRESS_TYPE")
+        if compress_type not in PNG_COMPRESS_TYPES:
+            raise ValueError("Invalid PNG compress type: {}".format(compress_type))
+        self.png_compress_type = PNG_COMPRESS_TYPES[compress_type]
+        # What to do with frames that would render as fully transparent
+        # images - see make_contour_plot
+        self.empty_frames = config.get('DispersionImages', "EMPTY_FRAMES")
+        if self.empty_frames not in ('render', 'transparent', 'omit'):
+            raise ValueError("Invalid empty frames option: {}".format(
+                self.empty_frames))
+        # GeoTIFFs are written a file per frame, or per image set - see
+        # add_to_geotiff_series
+        self.geotiff_layout = config.get('DispersionGridOutput', "GEOTIFF_LAYOUT")
+        if self.geotiff_layout not in GEOTIFF_LAYOUTS:
+            raise ValueError("Invalid GeoTIFF layout: {}".format(
+                self.geotiff_layout))
+        # GeoTIFF encoding - see get_geotiff_creation_options
+        self.cloud_optimized_geotiffs = config.getboolean('DispersionGridOutput',
+            "CLOUD_OPTIMIZED_GEOTIFFS")
+        self.geotiff_compress = config.get('DispersionGridOutput',
+            "GEOTIFF_COMPRESS").upper()
+        if self.geotiff_compress not in GEOTIFF_COMPRESSIONS:
+            raise ValueError("Invalid GeoTIFF compression: {}".format(
+                self.geotiff_compress))
+        self.geotiff_predictor = config.getboolean('DispersionGridOutput',
+            "GEOTIFF_PREDICTOR")
+        self.geotiff_block_size = config.getint('DispersionGridOutput',
+            "GEOTIFF_BLOCK_SIZE")
+        self.geotiff_overview_levels = [int(l) for l in config.get(
+            'DispersionGridOutput', "GEOTIFF_OVERVIEW_LEVELS").split()]
+        self.geotiff_num_threads = config.get('DispersionGridOutput',
+            "GEOTIFF_NUM_THREADS")
+        # Agg figures, reused across frames; see get_frame_figure
+        self._figures = {}
+        # Frames added to each GeoTIFF series, by fileroot, until written
+        self._geotiff_series = {}
 
     def colormap_from_RGB(self, r, g, b):
         """ Create a colormap from lists of non-normalized RGB values (0-255)"""
@@ -294,9 +1170,10 @@ class BSDispersionPlot:
 
     def set_plot_bounds(self, grid):
         """Set X-axis and Y-axis coordinate values for the plot.
-           Takes a BSDispersionGrid class as an input."""
+           Takes a BSDispersionGrid class as an input.
 
-        # TODO: Add bounds cropping capability.
+           Note that any cropping to DispersionGridInput.BOUNDING_BOX
+           was already done when the grid was read."""
 
         # X-axis and Y-axis values (longitudes and latitudes)
         self.xvals = np.linspace(grid.minX, grid.minX + ((grid.sizeX-1) * grid.cellSizeX), num=grid.sizeX)
@@ -326,34 +1203,215 @@ class BSDispersionPlot:
     def make_quadmesh_plot(self, raster_data, fileroot):
         """Create a quadilateral mesh plot."""
 
-        fig = plt.figure()
-        #fig.set_size_inches(7,5)
-        ax = plt.Axes(fig, [0., 0., 1., 1.], )
-        ax.set_axis_off()
-        fig.add_axes(ax)
-        plt.pcolormesh(self.xvals,
-                       self.yvals,
-                       raster_data,
-                       cmap=self.colormap,
-                       norm=self.norm)
-        plt.savefig(fileroot+'.'+self.export_format, bbox_inches='tight', pad_inches=0., dpi=self.dpi, transparent=True)
-        # explicitly close plot - o/w pyplot keeps it open until end of program
-        plt.close()
+        fig, ax = self.get_frame_figure(raster_data.shape)
+        mesh = ax.pcolormesh(self.xvals,
+                             self.yvals,
+                             raster_data,
+                             cmap=self.colormap,
+                             norm=self.norm)
+        self.save_figure(fig, fileroot, bbox_inches='tight', pad_inches=0.,
+            dpi=self.dpi, transparent=True)
+        mesh.remove()
 
     def make_contour_plot(self, raster_data, fileroot, geotiff_fileroot, filled=True, lines=False):
-        """Create a contour plot."""
-
-        # Always generate png
-        self.create_png(raster_data, fileroot, filled=filled, lines=lines)
+        """Create a contour plot.  raster_data may be a RenderFrame, to share
+        derived arrays with other plots rendering the same frame.  Returns
+        the pathnames of the files created."""
+
+        raster_data = as_render_frame(raster_data)
+
+        # Always generate png, unless the frame is empty and configured
+        # not to render empty frames
+        files = [fileroot + '.' + self.export_format]
+        if self.empty_frames != 'render' and self.is_empty_frame(raster_data):
+            self.skip_empty_frame(raster_data, fileroot)
+            if self.empty_frames == 'omit':
+                files = []
+        else:
+            self.create_png(raster_data, fileroot, filled=filled, lines=lines)
 
         # Will only create GeoTIFFs if configured to do so
-        self.create_geotiffs(raster_data, geotiff_fileroot)
+        return files + self.create_geotiffs(raster_data, geotiff_fileroot)
+
+    ##
+    ## Empty Frames
+    ##
+
+    def is_empty_frame(self, frame):
+        """Returns True if the frame's image would be fully transparent -
+        i.e. if all values are NaN, or lie between the same two levels
+        as the frame's min and max, in intervals drawn in the background
+        color (usually the lowest) or not at all.  The frame's min and max
+        are shared by all color maps.
+        """
+        low, high = frame.derive('nanrange', lambda: (
+            np.fmin.reduce(frame.data, axis=None),
+            np.fmax.reduce(frame.data, axis=None)))
+        if np.isnan(high):
+            return True
+        # Classes as in classify_raster_data, except that values at a level
+        # may be in either of the intervals it bounds
+        first = np.searchsorted(self.levels, low, side='left')
+        last = np.searchsorted(self.levels, high, side='right')
+        return not self.get_raster_lut()[first:last + 1, 3].any()
+
+    def skip_empty_frame(self, frame, fileroot):
+        """Stands in for create_png for an empty frame - linking it to the
+        parameter's shared transparent image, or writing nothing at all
+        """
+        # GeoTIFFs are resampled to the width of the PNGs, whether or not
+        # any have been rendered yet (see set_geotiff_constants)
+        self.set_target_pixel_width(frame.shape)
+
+        if self.empty_frames == 'transparent':
+            self.link_transparent_image(fileroot)
+        elif os.path.exists(fileroot + '.' + self.export_format):
+            # Rendered by an earlier run
+            os.remove(fileroot + '.' + self.export_format)
+
+    def set_target_pixel_width(self, shape):
+        """Sets the width of the PNGs of frames of the given shape, as
+        rendering one would
+        """
+        if not hasattr(self, 'target_pixel_width'):
+            if self.renderer == 'raster':
+                self.target_pixel_width = len(self.get_raster_sampling(shape)[1][0])
+            else:
+                fig, ax = self.get_frame_figure(shape)
+                self.target_pixel_width = fig.get_figwidth() * self.dpi
+
+    def link_transparent_image(self, fileroot):
+        """Hard links fileroot, with the export format's extension, to the
+        parameter's transparent image, so that the KML can point the frame's
+        overlay at that one image.
+        """
+        transparent_image = dfu.transparent_image_pathname(self.config,
+            self.parameter)
+        try:
+            # Exclusive create, so that, when rendering in parallel, frames
+            # are all linked to the same file
+            with open(transparent_image, 'xb') as f:
+                Image.new('RGBA', (1, 1), (0, 0, 0, 0)).save(f,
+                    format=self.export_format)
+        except FileExistsError:
+            pass
+
+        self.link_image(transparent_image, fileroot + '.' + self.export_format)
+
+    def link_image(self, source, filename):
+        """Hard links filename to source, replacing any existing file.
+        Falls back to a copy where hard links aren't supported.
+        """
+        if os.path.lexists(filename):
+            os.remove(filename)
+        try:
+            os.link(source, filename)
+        except OSError:
+            shutil.copyfile(source, filename)
+
+    def new_image_pathname(self, fileroot):
+        """Returns fileroot with the export format's extension, having
+        removed any existing file - which may be hard linked to other
+        images (see link_image), so mustn't be written through
+        """
+        filename = fileroot + '.' + self.export_format
+        if os.path.lexists(filename):
+            os.remove(filename)
+        return filename
+
+    ##
+    ## Figures
+    ##
+
+    def get_frame_figure(self, shape):
+        """Returns the figure and axes that frames of the given grid shape
+        are drawn on.  They're created once per shape and DPI, directly
+        rather than through pyplot (which would keep track of every figure
+        until closed), and reused for every frame; callers remove what
+        they've drawn once it's saved.
+        """
+        key = (shape, self.dpi)
+        if key not in self._figures:
+            fig = Figure()
+            FigureCanvasAgg(fig)
+            ax = fig.add_axes([0., 0., 1., 1.])
+            ax.set_axis_off()
+            self._figures[key] = (fig, ax)
+        return self._figures[key]
+
+    def save_figure(self, fig, fileroot, **kwargs):
+        """Renders the figure into an in-memory buffer and writes it out
+        to fileroot, with the export format's extension, in one go.
+        """
+        buf = io.BytesIO()
+        fig.savefig(buf, format=self.export_format, **kwargs)
+        with open(self.new_image_pathname(fileroot), 'wb') as f:
+            f.write(buf.getbuffer())
+
+    def render_figure(self, fig, dpi, **kwargs):
+        """Renders the figure, without bbox_inches, to an array of RGBA
+        pixels, as savefig would write them to a PNG
+        """
+        buf = io.BytesIO()
+        fig.savefig(buf, format='rgba', dpi=dpi, **kwargs)
+        # Agg truncates the figure's size in pixels
+        width = int(fig.get_figwidth() * dpi)
+        return np.frombuffer(buf.getbuffer(), dtype=np.uint8).reshape(-1, width, 4)
+
+    ##
+    ## Image Formatting
+    ##
+
+    def format_image(self, rgba):
+        """Makes the background color fully transparent, and applies the
+        image opacity factor, to an array of RGBA pixels before they're
+        first encoded - as post processing the written images (see
+        dispersionimages.format_dispersion_images) would.
+        """
+        if not hasattr(self, '_image_formatting'):
+            self._image_formatting = (
+                dispersionimages.get_background_color(self.config, self.parameter),
+                dispersionimages.get_image_opacity_factor(self.config, self.section))
+        return dispersionimages.apply_transparency(rgba, *self._image_formatting)
+
+    def write_image(self, rgba, fileroot):
+        """Encodes an array of RGBA pixels and writes it to fileroot, with
+        the export format's extension - as an 8-bit paletted image, if so
+        configured and there are no more than 256 distinct colors.
+        """
+        if self.png_palette:
+            colors, indices = np.unique(rgba.reshape(-1, 4).view(np.uint32),
+                return_inverse=True)
+            if len(colors) <= 256:
+                return self.write_indexed_image(indices.reshape(rgba.shape[:2]),
+                    colors.view(np.uint8).reshape(-1, 4), fileroot)
+        Image.fromarray(rgba, 'RGBA').save(self.new_image_pathname(fileroot),
+            compress_level=self.png_compress_level,
+            compress_type=self.png_compress_type)
+
+    def write_indexed_image(self, indices, palette, fileroot):
+        """Writes an 8-bit paletted image, of colors palette[indices], with
+        the palette's alpha values in a transparency (tRNS) table
+        """
+        image = Image.fromarray(indices.astype(np.uint8), 'P')
+        image.putpalette(palette[:, :3].tobytes())
+        image.save(self.new_image_pathname(fileroot),
+            transparency=palette[:, 3].tobytes(),
+            compress_level=self.png_compress_level,
+            compress_type=self.png_compress_type)
 
     ##
     ## PNGs
     ##
 
     def create_png(self, raster_data, fileroot, filled=True, lines=False):
+        # The raster renderer doesn't draw contour lines
+        if self.renderer == 'raster' and not lines:
+            return self.create_raster_png(raster_data, fileroot)
+        return self.create_contour_png(as_render_frame(raster_data).data,
+            fileroot, filled=filled, lines=lines)
+
+    def create_contour_png(self, raster_data, fileroot, filled=True, lines=False):
         """ TODO: contour() and contourf() assume the data are defined on grid edges.
         i.e. They line up the bottom-left corner of each square with the coordinates given.
         If the data are defined at grid centers, a half-grid displacement is necessary.
@@ -361,39 +1419,125 @@ class BSDispersionPlot:
         yv = plot.yvals[:-1] + grid.cellSizeY / 2.
         """
 
-        fig = plt.figure()
-        ax = plt.Axes(fig, [0., 0., 1., 1.], )
-        ax.set_axis_off()
-        fig.add_axes(ax)
-        cnf = plt.contourf(self.xvals,
-                           self.yvals,
-                           raster_data,
-                           levels=self.levels,
-                           cmap=self.colormap,
-                           norm=self.norm,
-                           extend='max')
+        fig, ax = self.get_frame_figure(raster_data.shape)
+        artists = [ax.contourf(self.xvals,
+                               self.yvals,
+                               raster_data,
+                               levels=self.levels,
+                               cmap=self.colormap,
+                               norm=self.norm,
+                               extend='max')]
         if lines:
-            cn = plt.contour(self.xvals,
-                             self.yvals,
-                             raster_data,
-                             levels=self.levels,
-                             colors='black',
-                             norm=self.norm)
+            artists.append(ax.contour(self.xvals,
+                                      self.yvals,
+                                      raster_data,
+                                      levels=self.levels,
+                                      colors='black',
+                                      norm=self.norm))
 
         # self.target_pixel_width will be used when resampling the GeoTIFF
         # imput raster data so that the GeoTIFF images have the same (or
         # similar) image resolution and dimensions as the PNGs
         self.target_pixel_width = fig.get_figwidth() * self.dpi
 
-        plt.savefig(fileroot+'.'+self.export_format, dpi=self.dpi, transparent=True)
-        # explicitly close plot - o/w pyplot keeps it open until end of program
-        plt.close()
+        rgba = self.render_figure(fig, dpi=self.dpi, transparent=True)
+        self.write_image(self.format_image(rgba), fileroot)
+        # Leave the axes empty for the next frame
+        for artist in artists:
+            artist.remove()
+
+    def create_raster_png(self, raster_data, fileroot):
+        """Renders the same image as create_contour_png, but by bilinearly
+        resampling the data to the image's pixels, classifying each pixel
+        against self.levels, and mapping classes to colors through a lookup
+        table.  Classes and colors match contourf's (see get_raster_lut),
+        though boundaries between them are traced a little differently.
+        """
+        frame = as_render_frame(raster_data)
+        # Classes only depend on the levels, so are shared by all color maps
+        # with the same levels
+        classes = frame.derive(('raster_classes', self.dpi, tuple(self.levels)),
+            lambda: self.classify_raster_data(frame.data))
+
+        self.target_pixel_width = classes.shape[1]
+        lut = self.get_raster_lut()
+        if self.png_palette and len(lut) <= 256:
+            # The classes already index the lookup table
+            return self.write_indexed_image(classes, lut, fileroot)
+
+        # Looking up whole RGBA pixels, as uint32, is faster than by channel
+        lut = lut.view(np.uint32).ravel()
+        rgba = lut[classes].view(np.uint8).reshape(classes.shape + (4,))
+        self.write_image(rgba, fileroot)
+
+    def classify_raster_data(self, raster_data):
+        """Returns the raster renderer's class of each pixel of the PNG
+        image (see get_raster_lut), from the data bilinearly resampled to
+        the image's size.
+        """
+        rows, cols, weights = self.get_raster_sampling(raster_data.shape)
+        data = np.asarray(raster_data, dtype=np.float64)
+        left = data[:, cols[0]]
+        right = data[:, cols[1]]
+        columns = left + (right - left) * weights[1]
+        resampled = columns[rows[0]] + (columns[rows[1]] - columns[rows[0]]) * weights[0]
+
+        # Like contourf's, intervals are (levels[i], levels[i+1]], except
+        # for the lowest, which includes levels[0]
+        classes = np.searchsorted(self.levels, resampled, side='left')
+        classes[resampled == self.levels[0]] = 1
+        classes[np.isnan(resampled)] = 0
+        return classes
+
+    def get_raster_sampling(self, shape):
+        """Returns the rows, columns, and weights for bilinearly resampling
+        a grid of the given shape to the PNG image size, i.e. the default
+        figure size at self.dpi.
+        """
+        # contourf draws increasing latitudes upward
+        flip = len(self.yvals) > 1 and self.yvals[0] < self.yvals[-1]
+        if getattr(self, '_raster_sampling_key', None) != (shape, flip):
+            width, height = [int(round(s * self.dpi))
+                for s in mpl.rcParams['figure.figsize']]
+
+            def _sample(num_pixels, num_points):
+                # grid coordinates of the pixel centers, with the first and
+                # last grid points at the image edges, as in contourf
+                f = (np.arange(num_pixels) + 0.5) * (num_points - 1) / num_pixels
+                i0 = np.minimum(np.floor(f).astype(int), max(num_points - 2, 0))
+                return i0, np.minimum(i0 + 1, num_points - 1), f - i0
+
+            row0, row1, row_weights = _sample(height, shape[0])
+            col0, col1, col_weights = _sample(width, shape[1])
+            if flip:
+                row0, row1 = shape[0] - 1 - row0, shape[0] - 1 - row1
+            self._raster_sampling = ((row0, row1), (col0, col1),
+                (row_weights[:, np.newaxis], col_weights))
+            self._raster_sampling_key = (shape, flip)
+        return self._raster_sampling
+
+    def get_raster_lut(self):
+        """Returns the RGBA lookup table of the raster renderer's classes -
+        transparent for NaN and values below the lowest level, then the
+        color of each interval, then the color of values above the highest
+        level - computed as contourf computes its colors, and formatted as
+        its images are (see format_image)
+        """
+        if not hasattr(self, '_raster_lut'):
+            levels = np.asarray(self.levels, dtype=np.float64)
+            values = np.append(0.5 * (levels[:-1] + levels[1:]), levels[-1] + 1)
+            colors = self.colormap(self.norm(values), bytes=True)
+            self._raster_lut = self.format_image(np.vstack([
+                np.zeros((1, 4), dtype=np.uint8), colors]).astype(np.uint8))
+        return self._raster_lut
 
     ##
     ## GeoTIFFs
     ##
 
     def create_geotiffs(self, raster_data, geotiff_fileroot):
+        """Returns the pathnames of the GeoTIFFs created, if any"""
+        files = []
         # Only generate GeoTIFFs if configured to
         # Note that geotiff_fileroot should be defined if
         #  CREATE_SINGLE_BAND_SMOKE_LEVEL_GEOTIFFS, CREATE_SINGLE_BAND_RAW_PM25_GEOTIFFS,
@@ -401,21 +1545,21 @@ class BSDispersionPlot:
         #  The only exception is if GEOTIFF_OUTPUT_DIR is specifically set to
         #  an empty string in the configuration. So, check that it's defined.
         if geotiff_fileroot:
-            create_rgba = self.config.getboolean('DispersionGridOutput',
-                'CREATE_RGBA_GEOTIFFS')
-            create_single_raw = self.config.getboolean('DispersionGridOutput',
-                'CREATE_SINGLE_BAND_RAW_PM25_GEOTIFFS')
-            create_single_smoke_level = self.config.getboolean('DispersionGridOutput',
-                'CREATE_SINGLE_BAND_SMOKE_LEVEL_GEOTIFFS')
-            if create_rgba or create_single_raw or create_single_smoke_level:
-                self.set_geotiff_constants(raster_data)
-                resampled_data = self.resample_data_for_geotiffs(raster_data)
-                if create_rgba:
+            kinds = get_geotiff_kinds(self.config)
+            if kinds:
+                frame = as_render_frame(raster_data)
+                self.set_geotiff_constants(frame.data)
+                resampled_data = self.get_geotiff_resampled(frame)
+                if 'rgba' in kinds:
                     self.create_geotiff_rgba(resampled_data, geotiff_fileroot)
-                if create_single_raw:
+                    files.append(geotiff_fileroot + '-rgba.tif')
+                if 'raw-pm25' in kinds:
                     self.create_geotiff_single_band_raw_pm25(resampled_data, geotiff_fileroot)
-                if create_single_smoke_level:
+                    files.append(geotiff_fileroot + '-raw-pm25.tif')
+                if 'smoke-level' in kinds:
                     self.create_geotiff_single_band_smoke_level (resampled_data, geotiff_fileroot)
+                    files.append(geotiff_fileroot + '.tif')
+        return files
 
     def set_geotiff_constants(self, raster_data):
         """This sets various parameters that only need to be set once.
@@ -425,10 +1569,10 @@ class BSDispersionPlot:
         if not hasattr(self, 'geotransform'):
             logging.debug(f'Setting GeoTIFF constants')
 
-            # The PNG images, when generated with matplotlib.pyplot.savefig,
+            # The PNG images, when generated with matplotlib's savefig,
             # have their resolution changed via resampling.  The raster data
-            # are initially loaded into a matplotlib.pyplot.figure object with
-            # default DPI=100 (matplotlib.pyplot.figure's default). They are
+            # are initially loaded into a matplotlib.figure.Figure object with
+            # default DPI=100 (matplotlib.figure.Figure's default). They are
             # then written with dpi = self.dpi.  So, we need to resample
             # the raster data so that the GeoTIFF images have the same resolution
             # and pixel width x height
@@ -458,48 +1602,134 @@ class BSDispersionPlot:
         else:
             logging.debug(f'GeoTIFF constants ALREADY SET')
 
+    def get_geotiff_resampled(self, frame):
+        """Returns the frame resampled for GeoTIFFs, as a RenderFrame.  The
+        resampling only depends on the grid and DPI, so is shared, along
+        with arrays derived from it, by all color maps.  The frames in a
+        batch are resampled in one warp, and their resamplings form a batch
+        of their own.
+        """
+        return frame.derive_batch(
+            ('geotiff_resampled', self.resampling_scale_factor),
+            lambda stack: render_frame_batch(self.resample_data_for_geotiffs(stack)))
+
     def resample_data_for_geotiffs(self, raster_data):
+        """Resamples a frame, or a stack of frames as the bands of a single
+        dataset, in one warp
+        """
 
         # Upscale or downscale the raster data based on self.dpi, so that the
         # resolution  of the geotiff images matches that of the png images
 
         logging.debug(f'resample_data_for_geotiffs')
 
-        new_x_size = int(raster_data.shape[1] * self.resampling_scale_factor)
-        new_y_size = int(raster_data.shape[0] * self.resampling_scale_factor)
+        stack = raster_data.reshape((-1,) + raster_data.shape[-2:])
+        new_x_size = int(stack.shape[2] * self.resampling_scale_factor)
+        new_y_size = int(stack.shape[1] * self.resampling_scale_factor)
 
-        # Create an in-memory dataset
+        # Create an in-memory dataset, with a band per frame
         driver = gdal.GetDriverByName("MEM")
-        src_ds = driver.Create("", raster_data.shape[1],
-            raster_data.shape[0], 1, gdal.GDT_Float32)
+        src_ds = driver.Create("", stack.shape[2], stack.shape[1], len(stack),
+            gdal.GDT_Float32)
         src_ds.SetGeoTransform(self.original_geotransform)
         src_ds.SetProjection(self.projection)
-        src_ds.GetRasterBand(1).WriteArray(raster_data)
+        for i, frame in enumerate(stack):
+            src_ds.GetRasterBand(i + 1).WriteArray(frame)
 
         # Perform resampling
         resampled_ds = gdal.Warp("", src_ds, width=new_x_size, height=new_y_size,
                                   resampleAlg=gdal.GRA_Bilinear, format="MEM")
 
         # Get resampled data
-        resampled_array = resampled_ds.GetRasterBand(1).ReadAsArray()
-        resampled_array = np.round(resampled_array)
+        resampled_array = np.round(resampled_ds.ReadAsArray())
 
         # Note that resampled_ds.GetGeoTransform() gives a geotransform that's
         # equal to what we already saved to self.target_geotransform, so
         # we don't need to return it along with resampled_array
 
-        return resampled_array
+        return resampled_array.reshape(raster_data.shape[:-2] + (new_y_size, new_x_size))
 
-    def create_geotiff_dataset(self, raster_data, filename, num_bands):
-        driver = gdal.GetDriverByName("GTiff")
-        max_val = int(max([max(a) for a in raster_data]))
-        data_type = (gdal.GDT_UInt16 if max_val >= 255 else gdal.GDT_Byte)
-        dataset = driver.Create(filename, raster_data.shape[1],
+    def classify_geotiff_data(self, raster_data):
+        """Returns the index, i, of the interval [levels[i], levels[i+1])
+        that each value falls in, or -1 for values outside all of them.
+        """
+        # Compare in the data's precision, as elementwise comparisons would
+        levels = np.asarray(self.levels, dtype=raster_data.dtype)
+        classes = np.searchsorted(levels, raster_data, side='right') - 1
+        classes[classes == len(levels) - 1] = -1
+        return classes
+
+    def get_geotiff_classes(self, frame):
+        # Classified in one pass for the whole batch
+        return frame.derive_batch(('geotiff_classes', tuple(self.levels)),
+            self.classify_geotiff_data)
+
+    def get_geotiff_data_type(self, max_val):
+        return gdal.GDT_UInt16 if max_val >= 255 else gdal.GDT_Byte
+
+    def create_geotiff_dataset(self, raster_data, num_bands):
+        """Returns an in-memory dataset for a GeoTIFF of the frame, to be
+        written with write_geotiff, and the frame's maximum value
+        """
+        driver = gdal.GetDriverByName("MEM")
+        frame = as_render_frame(raster_data)
+        max_val = int(frame.derive_batch('max',
+            lambda stack: np.max(stack.reshape(len(stack), -1), axis=1)))
+        data_type = self.get_geotiff_data_type(max_val)
+        dataset = driver.Create("", raster_data.shape[1],
             raster_data.shape[0], num_bands, data_type)
         dataset.SetGeoTransform(self.target_geotransform)
         dataset.SetProjection(self.projection)
         return dataset, max_val
 
+    def write_geotiff(self, dataset, filename, series=False):
+        """Writes an in-memory dataset to filename in one pass, as a COG if
+        so configured, or else as a GeoTIFF (see get_geotiff_creation_options)
+        """
+        options = self.get_geotiff_creation_options(series=series,
+            data_type=dataset.GetRasterBand(1).DataType)
+        if self.cloud_optimized_geotiffs and self.geotiff_overview_levels:
+            # Overviews are of classes or colors, so aren't interpolated
+            dataset.BuildOverviews('NEAREST', self.geotiff_overview_levels)
+        driver = gdal.GetDriverByName('COG' if self.cloud_optimized_geotiffs
+            else 'GTiff')
+        output = driver.CreateCopy(filename, dataset, options=options)
+        output = None  # Close file
+
+    def get_geotiff_creation_options(self, series=False, data_type=None):
+        """Returns the options with which to write GeoTIFFs of the given GDAL
+        data type.  COGs are tiled, compressed, and have overviews - either
+        those at GEOTIFF_OVERVIEW_LEVELS, or, if unspecified, down to a
+        single tile.  GeoTIFF series are tiled, compressed and band
+        interleaved, so that any one frame, or a whole series, is read with
+        one open and one read.  Other GeoTIFFs are written stripped and
+        uncompressed.
+
+        The predictor is horizontal differencing (2) for integer data, and
+        floating point (3) for floating point data, which the COG driver
+        selects itself.
+        """
+        compress = ['COMPRESS=' + self.geotiff_compress,
+            'NUM_THREADS=' + self.geotiff_num_threads]
+        predict = self.geotiff_predictor and self.geotiff_compress != 'NONE'
+        if self.cloud_optimized_geotiffs:
+            return compress + [
+                'BLOCKSIZE={}'.format(self.geotiff_block_size),
+                'OVERVIEWS=' + ('FORCE_USE_EXISTING'
+                    if self.geotiff_overview_levels else 'AUTO'),
+                'OVERVIEW_RESAMPLING=NEAREST'
+            ] + (['PREDICTOR=YES'] if predict else [])
+        if series:
+            return compress + [
+                'TILED=YES',
+                'BLOCKXSIZE={}'.format(self.geotiff_block_size),
+                'BLOCKYSIZE={}'.format(self.geotiff_block_size),
+                'INTERLEAVE=BAND',
+                'BIGTIFF=IF_SAFER'
+            ] + (['PREDICTOR={}'.format(3 if data_type in (gdal.GDT_Float32,
+                gdal.GDT_Float64) else 2)] if predict else [])
+        return []
+
     def create_geotiff_rgba(self, raster_data, geotiff_fileroot):
 
         # TODO: It seems as though a lot of the pixels in the geotiff images
@@ -509,40 +1739,52 @@ class BSDispersionPlot:
         #     b. assigning pixels with values matching the breakpoints
         #        to the lower category
 
-        # Create an empty RGBA array
-        rgba = np.zeros((4, raster_data.shape[0], raster_data.shape[1]), dtype=np.uint8)
-
-        # Assign colors based on thresholds
-        for i in range(len(self.levels)-1):
-            low = self.levels[i]
-            high = self.levels[i+1]
-            mask = (raster_data >= low) & (raster_data < high)
-            (r,g,b) = self.colors[i]
-            rgba[0, mask] = r  # Red
-            rgba[1, mask] = g  # Green
-            rgba[2, mask] = b  # Blue
-            rgba[3, mask] = self.image_opacity
-
-        # Explicitly set zero values to be fully transparent
-        rgba[3, raster_data == 0] = 0  # Alpha = 0 for transparent pixels
+        frame = as_render_frame(raster_data)
+        rgba = self.get_geotiff_rgba_data(frame)
 
         # Create GeoTIFF
-        dataset, max_val = self.create_geotiff_dataset(raster_data, geotiff_fileroot + '-rgba.tif', 4)
+        dataset, max_val = self.create_geotiff_dataset(frame, 4)
 
         # Write each band
-        for i in range(4):
+        for i, color_interpretation in enumerate([gdal.GCI_RedBand,
+                gdal.GCI_GreenBand, gdal.GCI_BlueBand, gdal.GCI_AlphaBand]):
             band = dataset.GetRasterBand(i + 1)
             band.WriteArray(rgba[i])
+            band.SetRasterColorInterpretation(color_interpretation)
 
         # Set the fourth band as the alpha channel
         dataset.GetRasterBand(4).SetMetadataItem("ALPHA", "YES", "IMAGE_STRUCTURE")
 
-        dataset.FlushCache()
-        dataset = None  # Close file
+        self.write_geotiff(dataset, geotiff_fileroot + '-rgba.tif')
+
+    def get_geotiff_rgba_data(self, frame):
+        # Assign colors based on thresholds
+        rgba = np.moveaxis(self.get_geotiff_rgba_palette()[
+            self.get_geotiff_classes(frame)], -1, 0)
+
+        # Explicitly set zero values to be fully transparent
+        rgba[3, frame.data == 0] = 0  # Alpha = 0 for transparent pixels
+        return rgba
+
+    def get_geotiff_rgba_palette(self):
+        """Returns the RGBA GeoTIFFs' color for each class, with values
+        outside of all of them (class -1, i.e. the last row) left
+        transparent
+        """
+        if not hasattr(self, '_geotiff_rgba_palette'):
+            num_classes = len(self.levels) - 1
+            palette = np.zeros((num_classes + 1, 4), dtype=np.uint8)
+            palette[:num_classes, :3] = self.colors[:num_classes]
+            palette[:num_classes, 3] = self.image_opacity
+            self._geotiff_rgba_palette = palette
+        return self._geotiff_rgba_palette
 
     def create_geotiff_single_band_raw_pm25(self, raster_data, geotiff_fileroot):
+        frame = as_render_frame(raster_data)
+        raster_data = frame.data
+
         # Create GeoTIFF
-        dataset, max_val = self.create_geotiff_dataset(raster_data, geotiff_fileroot + '-raw-pm25.tif', 1)
+        dataset, max_val = self.create_geotiff_dataset(frame, 1)
 
         # Write classified data
         band = dataset.GetRasterBand(1)
@@ -550,139 +1792,1037 @@ class BSDispersionPlot:
         data_type = (np.uint16 if max_val >= 255 else np.uint8)
         band.WriteArray(raster_data.astype(data_type))
 
-        # Create and assign colors to each data range by using color ramps,
-        # but with the same color at each end of each data range
-        color_table = gdal.ColorTable()
-        for i, (r, g, b) in enumerate(self.colors):
-            alpha = self.image_opacity if i > 0 else 0
-            rgba = (r, g, b, alpha)
-
-            if self.levels[i] <= max_val:
-                # Example: Create a color ramp from 0 to 255
-                for val in range(int(self.levels[i]), min(max_val+1, int(self.levels[i+1]))):
-                    logging.debug(f'CT:  {val}={rgba}')
-                    color_table.SetColorEntry(val, rgba)  # Gradient from blue to red
-
         # Write color table
-        band.SetRasterColorTable(color_table)
+        band.SetRasterColorTable(self.get_raw_pm25_color_table(max_val))
         band.SetRasterColorInterpretation(gdal.GCI_PaletteIndex)
 
-        # Close and save
-        band.FlushCache()
-        dataset = None
+        # Save
+        self.write_geotiff(dataset, geotiff_fileroot + '-raw-pm25.tif')
+
+    def get_raw_pm25_color_table(self, max_val):
+        """Returns the color table of a raw value GeoTIFF whose maximum
+        value is max_val, with every value up to it in its data range's
+        color.  Each is built once per plot and maximum value.
+        """
+        if not hasattr(self, '_raw_pm25_color_tables'):
+            self._raw_pm25_color_tables = {}
+        if max_val not in self._raw_pm25_color_tables:
+            color_table = gdal.ColorTable()
+            for i, (r, g, b) in enumerate(self.colors):
+                alpha = self.image_opacity if i > 0 else 0
+                rgba = (r, g, b, alpha)
+
+                start = int(self.levels[i])
+                end = min(max_val, int(self.levels[i+1]) - 1)
+                # Each data range is assigned its color with a color ramp
+                # with the same color at each end.  GDAL only creates ramps
+                # up to index 255, so larger values are set one at a time.
+                if start <= min(end, 255):
+                    color_table.CreateColorRamp(start, rgba, min(end, 255), rgba)
+                for val in range(max(start, 256), end + 1):
+                    color_table.SetColorEntry(val, rgba)
+            self._raw_pm25_color_tables[max_val] = color_table
+        return self._raw_pm25_color_tables[max_val]
 
     def create_geotiff_single_band_smoke_level(self, raster_data, geotiff_fileroot):
         # Convert smoke levels into categories based on self.levels.
         # (Note that the self.levels array is one element larger than the
-        # self.colors array, since it define ranges
-        classified_data = np.zeros_like(raster_data, dtype=np.uint8)
-        for i in range(len(self.levels)-1):
-            low = self.levels[i]
-            high = self.levels[i+1]
-            # The example I found online used 1-based indexing for category, but
-            # we're using 0-indexing.  It doesn't seem to make a difference.
-            classified_data[(raster_data >= low) & (raster_data < high)] = i
+        # self.colors array, since it define ranges.  Values outside of all
+        # ranges are assigned to category 0
+        # The example I found online used 1-based indexing for category, but
+        # we're using 0-indexing.  It doesn't seem to make a difference.
+        frame = as_render_frame(raster_data)
+        classified_data = self.get_geotiff_smoke_levels(frame)
 
         # Create GeoTIFF
-        dataset, max_val = self.create_geotiff_dataset(raster_data, geotiff_fileroot + '.tif', 1)
+        dataset, max_val = self.create_geotiff_dataset(frame, 1)
 
         # Write classified data
         band = dataset.GetRasterBand(1)
         band.WriteArray(classified_data)
 
-        # Create and assign color table
-        color_table = gdal.ColorTable()
-        for i, (r, g, b) in enumerate(self.colors):
-            alpha = self.image_opacity if i > 0 else 0
-            color_table.SetColorEntry(i, (r, g, b, alpha))  # RGBA
-
         # Write color table
-        band.SetRasterColorTable(color_table)
+        band.SetRasterColorTable(self.get_smoke_level_color_table())
         band.SetRasterColorInterpretation(gdal.GCI_PaletteIndex)
 
-        # Close and save
-        band.FlushCache()
-        dataset = None
+        # Save
+        self.write_geotiff(dataset, geotiff_fileroot + '.tif')
+
+    def get_geotiff_smoke_levels(self, frame):
+        return np.maximum(self.get_geotiff_classes(frame), 0).astype(np.uint8)
+
+    def get_smoke_level_color_table(self):
+        """Returns the color table of smoke level GeoTIFFs, built once per
+        plot
+        """
+        if not hasattr(self, '_smoke_level_color_table'):
+            color_table = gdal.ColorTable()
+            for i, (r, g, b) in enumerate(self.colors):
+                alpha = self.image_opacity if i > 0 else 0
+                color_table.SetColorEntry(i, (r, g, b, alpha))  # RGBA
+            self._smoke_level_color_table = color_table
+        return self._smoke_level_color_table
+
+    ##
+    ## GeoTIFF Series
+    ##
+
+    def add_to_geotiff_series(self, raster_data, series_fileroot, start, end,
+            utc_offset=None):
+        """Adds a frame, spanning start to end (local times at utc_offset,
+        if specified, or else UTC), to the image set's GeoTIFFs, which are
+        written to series_fileroot by write_geotiff_series.  Frames must be
+        added in order.
+        """
+        kinds = get_geotiff_kinds(self.config)
+        if not kinds:
+            return
+        frame = as_render_frame(raster_data)
+        # The frame's PNG may not have been rendered, if up to date
+        self.set_target_pixel_width(frame.shape)
+        self.set_geotiff_constants(frame.data)
+        resampled_data = self.get_geotiff_resampled(frame)
+
+        series = self._geotiff_series.setdefault(series_fileroot,
+            dict([('times', [])] + [(kind, []) for kind in kinds]))
+        tz = timezone(timedelta(hours=utc_offset or 0))
+        series['times'].append((start.replace(tzinfo=tz), end.replace(tzinfo=tz)))
+        if 'rgba' in kinds:
+            series['rgba'].append(self.get_geotiff_rgba_data(resampled_data))
+        if 'raw-pm25' in kinds:
+            series['raw-pm25'].append(resampled_data.data.astype(np.uint16))
+        if 'smoke-level' in kinds:
+            series['smoke-level'].append(self.get_geotiff_smoke_levels(resampled_data))
+
+    def write_geotiff_series(self):
+        """Writes each series that frames have been added to, each in one
+        pass, as a multi-band GeoTIFF per kind of GeoTIFF, or, with the
+        'netcdf' layout, as a netCDF file.  (RGBA images aren't data, so are
+        always written as GeoTIFFs.)
+        """
+        for series_fileroot, series in self._geotiff_series.items():
+            times = series.pop('times')
+            if self.geotiff_layout == 'netcdf':
+                data = dict((kind, frames) for kind, frames in series.items()
+                    if kind != 'rgba')
+                if data:
+                    self.write_netcdf_series(series_fileroot + '.nc', data, times)
+                series = dict((kind, frames) for kind, frames in series.items()
+                    if kind == 'rgba')
+
+            for kind, frames in series.items():
+                filename = series_fileroot + GEOTIFF_KINDS[kind][1] + '.tif'
+                if kind == 'rgba':
+                    self.write_geotiff_series_file(filename,
+                        np.concatenate(frames), times,
+                        channels=['red', 'green', 'blue', 'alpha'])
+                else:
+                    bands = np.stack(frames)
+                    if kind == 'raw-pm25' and bands.max() < 255:
+                        bands = bands.astype(np.uint8)
+                    self.write_geotiff_series_file(filename, bands, times)
+        self._geotiff_series = {}
+
+    def write_geotiff_series_file(self, filename, bands, times, channels=None):
+        """Writes bands - one per frame, or, given channels, one per channel
+        per frame - as a GeoTIFF, assembled in memory and written in one
+        pass.  Each band's start and end times are in its metadata.  Color
+        tables only apply to single band GeoTIFFs, so the levels and colors
+        are in the dataset's metadata.
+        """
+        logging.debug("Writing GeoTIFF series %s", filename)
+        channels = channels or [None]
+        data_type = gdal.GDT_UInt16 if bands.dtype == np.uint16 else gdal.GDT_Byte
+        dataset = gdal.GetDriverByName("MEM").Create("", bands.shape[2],
+            bands.shape[1], len(bands), data_type)
+        dataset.SetGeoTransform(self.target_geotransform)
+        dataset.SetProjection(self.projection)
+        dataset.SetMetadata({
+            'LEVELS': ' '.join('%g' % l for l in self.levels),
+            'COLORS': ' '.join('#%02x%02x%02x' % tuple(c) for c in self.colors)
+        })
+        for i, data in enumerate(bands):
+            (start, end), channel = times[i // len(channels)], channels[i % len(channels)]
+            band = dataset.GetRasterBand(i + 1)
+            band.WriteArray(data)
+            band.SetDescription(start.isoformat()
+                + (' ' + channel if channel else ''))
+            band.SetMetadata({
+                'START_TIME': start.isoformat(),
+                'END_TIME': end.isoformat()
+            })
+
+        self.write_geotiff(dataset, filename, series=True)
+
+    def write_netcdf_series(self, filename, series, times):
+        """Writes the raw and/or smoke level series as variables of a
+        CF-compliant netCDF file, with a time step per frame (times in UTC,
+        with bounds), and compressed a frame per chunk
+        """
+        if not netCDF4:
+            raise ImportError("The netCDF4 package is required to write "
+                "GeoTIFF series as netCDF")
+        logging.debug("Writing netCDF series %s", filename)
+        num_rows, num_cols = next(iter(series.values()))[0].shape
+        lonmin, lon_res, _, latmax, _, lat_res = self.target_geotransform
+        epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+        with netCDF4.Dataset(filename, 'w') as ds:
+            ds.Conventions = 'CF-1.8'
+            ds.title = '{} ({})'.format(self.parameter_label, self.section)
+            ds.createDimension('time', len(times))
+            ds.createDimension('bnds', 2)
+            ds.createDimension('lat', num_rows)
+            ds.createDimension('lon', num_cols)
+
+            time = ds.createVariable('time', 'f8', ('time',))
+            time.setncatts({'standard_name': 'time', 'calendar': 'standard',
+                'units': 'seconds since 1970-01-01 00:00:00', 'bounds': 'time_bnds'})
+            time[:] = [(start - epoch).total_seconds() for start, end in times]
+            # Frames end a second before the next begins
+            time_bnds = ds.createVariable('time_bnds', 'f8', ('time', 'bnds'))
+            time_bnds[:] = [[(start - epoch).total_seconds(),
+                (end - epoch).total_seconds() + 1] for start, end in times]
+
+            # Coordinates are of cell centers, north to south
+            lat = ds.createVariable('lat', 'f8', ('lat',))
+            lat.setncatts({'standard_name': 'latitude', 'units': 'degrees_north'})
+            lat[:] = latmax + (np.arange(num_rows) + 0.5) * lat_res
+            lon = ds.createVariable('lon', 'f8', ('lon',))
+            lon.setncatts({'standard_name': 'longitude', 'units': 'degrees_east'})
+            lon[:] = lonmin + (np.arange(num_cols) + 0.5) * lon_res
+            crs = ds.createVariable('crs', 'i4')
+            crs.grid_mapping_name = 'latitude_longitude'
+
+            for kind, frames in series.items():
+                stack = np.stack(frames)
+                var = ds.createVariable(kind.replace('-', '_'), stack.dtype,
+                    ('time', 'lat', 'lon'), zlib=True,
+                    chunksizes=(1, num_rows, num_cols))
+                var.grid_mapping = 'crs'
+                if kind == 'smoke-level':
+                    var.long_name = '{} level'.format(self.parameter_label)
+                    var.flag_values = np.arange(len(self.colors), dtype=stack.dtype)
+                    var.flag_meanings = ' '.join('from_%g_to_%g' % (low, high)
+                        for low, high in zip(self.levels[:-1], self.levels[1:]))
+                    var.colors = ' '.join('#%02x%02x%02x' % tuple(c)
+                        for c in self.colors)
+                else:
+                    var.long_name = '{}, rounded'.format(self.parameter_label)
+                var[:] = stack
 
     ##
     ## Colorbar
     ##
 
     def make_colorbar(self, fileroot):
-        mpl.rc('mathtext', default='regular')
+        """Writes the legend to fileroot, with the export format's extension.
+        Legends only depend on what get_legend_key returns, so each distinct
+        legend is rendered once, and linked to by the image sets and color
+        maps sharing it.
+        """
+        rendered_legends = get_rendered_legends(self.config)
+        key = self.get_legend_key()
+        if key in rendered_legends:
+            self.link_image(rendered_legends[key],
+                fileroot + '.' + self.export_format)
+            return
+
         assert len(self.levels) == self.colormap.N + 1
-        fig = plt.figure(figsize=(8,1))
-        ax = fig.add_axes([0.05, 0.5, 0.9, 0.45])
-        ax.tick_params(labelsize=12)
-        cb = mpl.colorbar.ColorbarBase(ax, cmap=self.cb_colormap,
-                                           norm=self.cb_norm,
-                                           ticks=self.levels[0:-1],
-                                           orientation='horizontal')
-        cb.set_label(self.parameter_label, size=12)
-        plt.savefig(fileroot+'.'+self.export_format, dpi=self.dpi/3, bbox_inches='tight')
-        # explicitly close plot - o/w pyplot keeps it open until end of program
-        plt.close()
+        if self.legend_renderer == 'pil':
+            self.draw_colorbar(fileroot)
+        else:
+            mpl.rc('mathtext', default='regular')
+            self.save_figure(self.get_colorbar_figure(), fileroot,
+                dpi=self.dpi/3, bbox_inches='tight')
+        rendered_legends[key] = fileroot + '.' + self.export_format
+
+    def get_legend_key(self):
+        return (self.legend_renderer,
+            tuple(tuple(float(v) for v in c) for c in self.cb_colormap.colors),
+            tuple(self.levels), self.parameter_label, self.dpi)
+
+    def get_colorbar_figure(self):
+        """Returns the colorbar legend's figure, which only depends on the
+        plot's levels and colors, so is drawn once and saved for every
+        image set
+        """
+        if not hasattr(self, '_colorbar_figure'):
+            fig = Figure(figsize=(8,1))
+            FigureCanvasAgg(fig)
+            ax = fig.add_axes([0.05, 0.5, 0.9, 0.45])
+            ax.tick_params(labelsize=12)
+            cb = mpl.colorbar.ColorbarBase(ax, cmap=self.cb_colormap,
+                                               norm=self.cb_norm,
+                                               ticks=self.levels[0:-1],
+                                               orientation='horizontal')
+            cb.set_label(self.parameter_label, size=12)
+            self._colorbar_figure = fig
+        return self._colorbar_figure
+
+    def draw_colorbar(self, fileroot):
+        """Draws the same legend as get_colorbar_figure with PIL - a bar of
+        equal width intervals in the colorbar colors, ticked and labeled at
+        each interval's lower level, over the parameter label (with any
+        mathtext in plain text) - laid out in points at the legend's DPI,
+        and cropped to its contents plus a margin, as bbox_inches='tight'
+        would
+        """
+        dpi = self.dpi / 3
+        px = lambda points: max(int(round(points * dpi / 72.)), 1)
+        font_size = px(12)
+        try:
+            font = ImageFont.load_default(font_size)
+        except TypeError:
+            # Before Pillow 10.1, only the fixed size bitmap font
+            font = ImageFont.load_default()
+
+        bar_width, bar_height = int(0.9 * 8 * dpi), int(0.45 * dpi)
+        x0 = y0 = bar_width // 4
+        image = Image.new('RGBA', (bar_width + 2 * x0, 2 * y0 + 4 * bar_height),
+            (255, 255, 255, 255))
+        draw = ImageDraw.Draw(image)
+
+        colors = self.cb_colormap.colors
+        edges = [x0 + i * bar_width // len(colors) for i in range(len(colors) + 1)]
+        for color, left, right in zip(colors, edges[:-1], edges[1:]):
+            draw.rectangle([left, y0, right, y0 + bar_height],
+                fill=tuple(int(round(v * 255)) for v in color[:3]))
+        draw.rectangle([x0, y0, x0 + bar_width, y0 + bar_height],
+            outline=(0, 0, 0))
+
+        tick_bottom = y0 + bar_height + px(3.5)
+        labels_top = tick_bottom + px(3.5)
+        for level, x in zip(self.levels[:-1], edges):
+            draw.line([x, y0 + bar_height, x, tick_bottom], fill=(0, 0, 0))
+            draw.text((x, labels_top), '{:g}'.format(level), font=font,
+                fill=(0, 0, 0), anchor='ma')
+        labels_bottom = draw.textbbox((x0, labels_top), '0', font=font,
+            anchor='ma')[3]
+        draw.text((x0 + bar_width // 2, labels_bottom + px(3.5)),
+            mathtext_to_plain_text(self.parameter_label), font=font,
+            fill=(0, 0, 0), anchor='ma')
+
+        left, top, right, bottom = ImageChops.difference(image.convert('RGB'),
+            Image.new('RGB', image.size, (255, 255, 255))).getbbox()
+        pad = int(0.1 * dpi)
+        image.crop((left - pad, top - pad, right + pad, bottom + pad)).save(
+            self.new_image_pathname(fileroot), format=self.export_format)
 
 def create_dispersion_images(config, parameter):
+    """Creates the parameter's images, legends and GeoTIFFs.  Returns the
+    grid's start datetime, its lon/lat bounding box, the heights rendered,
+    and the list of images and legends created (dfu.DispersionImage
+    objects), from which the KMZ is assembled and images post-processed
+    without rescanning the output directories.
+    """
     # [DispersionGridInput] configurations
     infile = config.get('DispersionGridInput', "FILENAME")
     layers = config.get('DispersionGridInput', "LAYERS")
+    bbox = config.get('DispersionGridInput', "BOUNDING_BOX")
+    data_access = config.get('DispersionGridInput', "DATA_ACCESS")
+    streaming = config.getboolean('DispersionGridInput', "STREAMING")
+    restyle = config.getboolean('DispersionGridInput', "RESTYLE")
+    # Streaming renders as time steps are read, and so isn't parallelized
+    jobs = config.getint('DispersionImages', "JOBS")
     utc_offsets = config.get('DispersionImages', "DAILY_IMAGES_UTC_OFFSETS")
 
-    grid = BSDispersionGrid(infile, param=parameter)  # dispersion grid instance
-    if max(layers) >= grid.sizeZ:
-        raise Exception("Requested layers ({}) outside of what's available in"
-            " dispersion grid (which has {} layer{})".format(
-                ', '.join([str(e) for e in layers]), grid.sizeZ,
-                's' if grid.sizeZ > 1 else ''))
-
-    plot = None
-
-    for layer in layers:
-        for color_map_section in dfu.parse_color_map_names(config, parameter,
-            CONFIG_COLOR_LABELS[TimeSeriesTypes.HOURLY]):
-            plot = create_hourly_dispersion_images(
-                config, parameter, grid, color_map_section, layer)
-
-        for color_map_section in dfu.parse_color_map_names(config, parameter,
-            CONFIG_COLOR_LABELS[TimeSeriesTypes.THREE_HOUR]):
-            plot = create_three_hour_dispersion_images(
-                config, parameter, grid, color_map_section, layer)
-
-        # Create MIN only for VR, and MAX only for all other;
-        #  update any other parts of the code as necessary
-        if grid.is_visual_range:
-            for color_map_section in dfu.parse_color_map_names(config, parameter,
-                CONFIG_COLOR_LABELS[TimeSeriesTypes.DAILY_MINIMUM]):
-                for utc_offset in utc_offsets:
-                    plot = create_daily_dispersion_images(
-                        config, parameter, grid, color_map_section, layer, utc_offset,
-                        dfu.TimeSeriesTypes.DAILY_MINIMUM)
+    # Images already created from the same inputs are skipped, if so
+    # configured.  Otherwise, any manifest left by an earlier run would be
+    # out of date.
+    manifest = get_image_manifest(config, parameter)
+    if not manifest:
+        remove_image_manifest(config, parameter)
+
+    images = []
+
+    if restyle:
+        # Frames cached by an earlier run are rendered, without reading
+        # the grid file
+        frame_cache = FrameCache(config, parameter)
+        grid = frame_cache.load_grid()
+        plot = create_layer_dispersion_images(config, parameter, grid,
+            utc_offsets, frame_sets=frame_cache.iter_frame_sets, images=images)
+        return _finish_dispersion_images(plot, grid, manifest, images)
+
+    if streaming and writes_geotiff_series(config):
+        # Series would grow with the number of time steps, which streaming
+        # is meant to bound
+        raise ValueError("GeoTIFF series (GEOTIFF_LAYOUT {}) aren't supported"
+            " when streaming".format(config.get('DispersionGridOutput',
+            "GEOTIFF_LAYOUT")))
+
+    # Only the requested layers, within the bounding box, are read, so
+    # grid layer indices are into `layers`.  When streaming, time steps
+    # are read one at a time, so nothing is read up front.
+    grid = BSDispersionGrid(infile, param=parameter,
+        data_access=('lazy' if streaming else data_access),
+        layers=layers, bbox=bbox, reader=config.get('DispersionGridInput',
+        "READER"), storage=create_grid_storage(config))  # dispersion grid instance
+
+    if config.getboolean('DispersionGridOutput', "CREATE_FRAME_CACHE"):
+        if streaming:
+            # Frames are never all computed at once
+            logging.warning("Frames aren't cached when streaming")
         else:
-            for color_map_section in dfu.parse_color_map_names(config, parameter,
-                CONFIG_COLOR_LABELS[TimeSeriesTypes.DAILY_MAXIMUM]):
-                for utc_offset in utc_offsets:
-                    plot = create_daily_dispersion_images(
-                        config, parameter, grid, color_map_section, layer, utc_offset,
-                        dfu.TimeSeriesTypes.DAILY_MAXIMUM)
+            FrameCache(config, parameter).save(grid, utc_offsets)
+
+    if streaming:
+        plot = create_streaming_dispersion_images(config, parameter, grid,
+            utc_offsets, images=images)
+    elif jobs > 1:
+        plot = create_parallel_dispersion_images(config, parameter, grid,
+            utc_offsets, jobs, images=images)
+    else:
+        plot = create_layer_dispersion_images(config, parameter, grid,
+            utc_offsets, images=images)
 
-        for color_map_section in dfu.parse_color_map_names(config, parameter,
-            CONFIG_COLOR_LABELS[TimeSeriesTypes.DAILY_AVERAGE]):
-            for utc_offset in utc_offsets:
-                plot = create_daily_dispersion_images(
-                    config, parameter, grid, color_map_section, layer, utc_offset,
-                    dfu.TimeSeriesTypes.DAILY_AVERAGE)
+    return _finish_dispersion_images(plot, grid, manifest, images)
 
+def _finish_dispersion_images(plot, grid, manifest, images):
     if not plot:
         raise Exception("Configuration ERROR... No color maps defined.")
 
+    if manifest:
+        manifest.compact()
+
     # Return the grid starting date, and a tuple lon/lat bounding box of the plot
     return (
         grid.datetimes[0],
         (plot.lonmin, plot.latmin, plot.lonmax, plot.latmax),
-        [grid.heights[l] for l in layers] # only the heights extracted
+        grid.heights, # only the heights extracted
+        images
     )
 
+def create_layer_dispersion_images(config, parameter, grid, utc_offsets,
+        frame_sets=None, images=None):
+    """Creates all images, one layer and set of frames at a time.  Each
+    frame is computed once, and rendered with every color map configured
+    for its time series type.  frame_sets, if specified, replaces
+    iter_frame_sets as the source of frames.  The images and legends
+    created are appended to images.
+    """
+    frame_sets = frame_sets or iter_frame_sets
+    plot = None
+
+    for layer in range(grid.sizeZ):
+        for time_series_type, utc_offset, frames, dts in frame_sets(
+                config, parameter, grid, layer, utc_offsets):
+            sections = get_color_map_sections(config, parameter,
+                time_series_type)
+            frames = batch_render_frames(frames, FRAMES_PER_BATCH)
+            for i, (raster_data, dt) in enumerate(zip(frames, dts)):
+                logging.debug("Creating height %s %s concentration plot %d "
+                    "of %d", dfu.create_height_label(grid.heights[layer]),
+                    TIME_SET_DIR_NAMES[time_series_type], i + 1, len(dts))
+                plot = create_frame_images(config, parameter, grid, sections,
+                    layer, time_series_type, raster_data, dt,
+                    utc_offset=utc_offset, images=images)
+            write_geotiff_series(config, parameter, grid, sections)
+
+            # Create color bars to use in overlays
+            for section in sections:
+                plot = create_dispersion_legend(config, parameter, grid,
+                    section, layer, time_series_type, utc_offset=utc_offset,
+                    images=images)
+
+    # plot will be used for its already computed min/max lat/lon
+    return plot
+
+def get_color_map_sections(config, parameter, time_series_type):
+    return dfu.parse_color_map_names(config, parameter,
+        CONFIG_COLOR_LABELS[time_series_type])
+
+def get_daily_time_series_types(grid):
+    # Create MIN only for VR, and MAX only for all other
+    return [
+        TimeSeriesTypes.DAILY_MINIMUM if grid.is_visual_range else TimeSeriesTypes.DAILY_MAXIMUM,
+        TimeSeriesTypes.DAILY_AVERAGE
+    ]
+
+def iter_frame_sets(config, parameter, grid, layer, utc_offsets,
+        all_time_series_types=False):
+    """Yields, for each time series type (and UTC offset, for daily
+    aggregates) with color maps configured, or for all time series types,
+    a tuple of the time series type, the UTC offset (None if not daily),
+    the layer's frames, and their datetimes (or dates).  Frames are
+    computed as they're iterated, or are rows of a stack computed once for
+    all color maps.
+    """
+    def _include(time_series_type):
+        return all_time_series_types or get_color_map_sections(config,
+            parameter, time_series_type)
+
+    if _include(TimeSeriesTypes.HOURLY):
+        yield (TimeSeriesTypes.HOURLY, None,
+            (grid.data[t, layer] for t in range(grid.num_times)),
+            grid.datetimes)
+
+    for time_series_type, window in ROLLING_WINDOWS.items():
+        if _include(time_series_type):
+            frames = grid.get_rolling_window(window['statistic'], layer,
+                window['width'])
+            # index, into grid.datetimes, of the hour represented by the
+            # first window.  Centered windows are stamped with their middle
+            # hour, and trailing windows with their last
+            first = ((window['width'] - 1) // 2 if window['centered']
+                else window['width'] - 1)
+            yield (time_series_type, None, frames,
+                grid.datetimes[first:first + len(frames)])
+
+    for time_series_type in get_daily_time_series_types(grid):
+        if _include(time_series_type):
+            for utc_offset in utc_offsets:
+                # Aggregates are cached on the grid, and are computed for
+                # all of utc_offsets the first time any one of them is needed
+                grid.compute_days_spanned(utc_offset)
+                frames = grid.get_daily_aggregate(
+                    DAILY_STATISTIC[time_series_type], layer, utc_offset,
+                    utc_offsets=utc_offsets)
+                yield (time_series_type, utc_offset, frames, list(grid.dates))
+
+def create_streaming_dispersion_images(config, parameter, grid, utc_offsets,
+        images=None):
+    """Creates all images from one time step at a time.  Hourly images are
+    created as each time step is read, and rolling windows and daily
+    aggregates are updated incrementally and rendered as they complete,
+    so that memory use doesn't depend on the number of time steps.  The
+    images and legends created are appended to images.
+    """
+    def _sections(time_series_type):
+        return get_color_map_sections(config, parameter, time_series_type)
+
+    daily_types = [t for t in get_daily_time_series_types(grid) if _sections(t)]
+    rolling_types = [t for t in ROLLING_WINDOWS if _sections(t)]
+
+    rolling_states = dict(((time_series_type, layer), RollingWindowState(
+            ROLLING_WINDOWS[time_series_type]['statistic'],
+            ROLLING_WINDOWS[time_series_type]['width']))
+        for time_series_type in rolling_types for layer in range(grid.sizeZ))
+    daily_states = {}
+    daily_dates = {}
+    for utc_offset in utc_offsets:
+        grid.compute_days_spanned(utc_offset)
+        daily_dates[utc_offset] = grid.dates
+        for layer in range(grid.sizeZ):
+            daily_states[(utc_offset, layer)] = DailyAggregateState(
+                [DAILY_STATISTIC[t] for t in daily_types],
+                grid.get_day_starts(utc_offset), grid.num_times)
+
+    for t, data in grid.iter_time_steps():
+        logging.debug("Creating images for time step %d of %d", t + 1,
+            grid.num_times)
+        for layer in range(grid.sizeZ):
+            create_frame_images(config, parameter, grid,
+                _sections(TimeSeriesTypes.HOURLY), layer,
+                TimeSeriesTypes.HOURLY, data[layer], grid.datetimes[t],
+                images=images)
+
+            for time_series_type in rolling_types:
+                window = ROLLING_WINDOWS[time_series_type]
+                values = rolling_states[(time_series_type, layer)].add(data[layer])
+                if values is not None:
+                    # index of the hour represented by the window ending at t
+                    i = t - window['width'] + 1 + ((window['width'] - 1) // 2
+                        if window['centered'] else window['width'] - 1)
+                    create_frame_images(config, parameter, grid,
+                        _sections(time_series_type), layer, time_series_type,
+                        values, grid.datetimes[i], images=images)
+
+            for utc_offset in utc_offsets:
+                day_values = daily_states[(utc_offset, layer)].add(t, data[layer])
+                if day_values is not None:
+                    day, values = day_values
+                    for time_series_type in daily_types:
+                        create_frame_images(config, parameter, grid,
+                            _sections(time_series_type), layer,
+                            time_series_type,
+                            values[DAILY_STATISTIC[time_series_type]],
+                            daily_dates[utc_offset][day], utc_offset=utc_offset,
+                            images=images)
+
+    # GeoTIFF series are only complete once all time steps have been read
+    for time_series_type in [TimeSeriesTypes.HOURLY] + rolling_types + daily_types:
+        write_geotiff_series(config, parameter, grid, _sections(time_series_type))
+
+    # Create color bars to use in overlays
+    plot = None
+    for layer in range(grid.sizeZ):
+        for time_series_type in [TimeSeriesTypes.HOURLY] + rolling_types:
+            for section in _sections(time_series_type):
+                plot = create_dispersion_legend(config, parameter, grid,
+                    section, layer, time_series_type, images=images)
+        for time_series_type in daily_types:
+            for section in _sections(time_series_type):
+                for utc_offset in utc_offsets:
+                    plot = create_dispersion_legend(config, parameter, grid,
+                        section, layer, time_series_type, utc_offset=utc_offset,
+                        images=images)
+
+    # plot will be used for its already computed min/max lat/lon
+    return plot
+
+def _image_set_dirs(grid, section, layer, time_series_type, utc_offset=None):
+    height_label = dfu.create_height_label(grid.heights[layer])
+    dirs = [height_label, TIME_SET_DIR_NAMES[time_series_type]]
+    if utc_offset is not None:
+        dirs.append(dfu.get_utc_label(utc_offset))
+    return height_label, dirs + [section]
+
+def create_dispersion_image(config, parameter, grid, section, layer,
+        time_series_type, raster_data, dt, utc_offset=None, images=None):
+    """Creates a single image, and GeoTIFFs if configured to.  dt is the
+    grid datetime of an hourly or rolling window image (whose file name is
+    stamped an hour earlier), or the date of a daily image.  The image, if
+    any (see EMPTY_FRAMES), is appended to images as a
+    dfu.DispersionImage.
+    """
+    plot = create_color_plot(config, parameter, grid, section)
+    height_label, dirs = _image_set_dirs(grid, section, layer,
+        time_series_type, utc_offset=utc_offset)
+    outdir, geotiff_outdir = dfu.create_image_set_dir(config, parameter, *dirs)
+
+    if utc_offset is None:
+        # Shift filename date stamps
+        dt = dt - timedelta(hours=1)
+    fileroot = dfu.image_pathname(outdir, parameter, height_label,
+        time_series_type, section, dt, utc_offset=utc_offset)
+    geotiff_fileroot = geotiff_outdir and dfu.image_pathname(geotiff_outdir,
+        parameter, height_label, time_series_type, section, dt,
+        utc_offset=utc_offset)
+    start, end = dfu.image_time_span(time_series_type, dt)
+
+    # GeoTIFFs written as series are added to the image set's series,
+    # rather than written per frame
+    series_fileroot = None
+    if geotiff_fileroot and plot.geotiff_layout != 'frame':
+        series_fileroot = dfu.series_pathname(geotiff_outdir, parameter,
+            height_label, time_series_type, section, utc_offset=utc_offset)
+        geotiff_fileroot = None
+
+    # Skip images already created from the same inputs, if created
+    # incrementally
+    manifest = get_image_manifest(config, parameter)
+    fingerprint = manifest and manifest.fingerprint(section,
+        grid.heights[layer], time_series_type, utc_offset, dt)
+    if manifest and manifest.is_current(fileroot, fingerprint):
+        logging.debug("Image %s is up to date", fileroot)
+        files = manifest.get_files(fileroot)
+    else:
+        files = plot.make_contour_plot(raster_data, fileroot, geotiff_fileroot)
+        if manifest:
+            manifest.record(fileroot, fingerprint, files)
+
+    if series_fileroot:
+        # Series are written whole, so every frame is added to them, whether
+        # or not its image is up to date
+        plot.add_to_geotiff_series(raster_data, series_fileroot, start, end,
+            utc_offset=utc_offset)
+
+    image = fileroot + '.' + plot.export_format
+    if images is not None and image in files:
+        images.append(dfu.DispersionImage(image, height_label,
+            time_series_type, section, utc_offset=utc_offset, start=start,
+            end=end))
+    return plot
+
+def create_frame_images(config, parameter, grid, sections, layer,
+        time_series_type, raster_data, dt, utc_offset=None, images=None):
+    """Creates a frame's image, and GeoTIFFs, with each of the color maps
+    in sections.  The frame's data are converted to an array once, and
+    classified once per distinct set of levels (see RenderFrame).
+    """
+    frame = as_render_frame(raster_data)
+    plot = None
+    for section in sections:
+        plot = create_dispersion_image(config, parameter, grid, section,
+            layer, time_series_type, frame, dt, utc_offset=utc_offset,
+            images=images)
+    return plot
+
+def write_geotiff_series(config, parameter, grid, sections):
+    """Writes the GeoTIFF series that frames have been added to, if any,
+    with each of the color maps in sections
+    """
+    for section in sections:
+        create_color_plot(config, parameter, grid, section).write_geotiff_series()
+
+def create_dispersion_legend(config, parameter, grid, section, layer,
+        time_series_type, utc_offset=None, images=None):
+    plot = create_color_plot(config, parameter, grid, section)
+    height_label, dirs = _image_set_dirs(grid, section, layer,
+        time_series_type, utc_offset=utc_offset)
+    outdir, _ = dfu.create_image_set_dir(config, parameter, *dirs)
+    fileroot = dfu.legend_pathname(outdir, parameter, height_label,
+        time_series_type, section, utc_offset=utc_offset)
+
+    manifest = get_image_manifest(config, parameter)
+    fingerprint = manifest and manifest.fingerprint(section, 'legend')
+    if manifest and manifest.is_current(fileroot, fingerprint):
+        logging.debug("Legend %s is up to date", fileroot)
+    else:
+        plot.make_colorbar(fileroot)
+        if manifest:
+            manifest.record(fileroot, fingerprint,
+                [fileroot + '.' + plot.export_format])
+
+    if images is not None:
+        images.append(dfu.DispersionImage(fileroot + '.' + plot.export_format,
+            height_label, time_series_type, section, utc_offset=utc_offset))
+    return plot
+
+##
+## Parallel Rendering
+##
+
+class GridGeometry:
+    """The attributes of a BSDispersionGrid used in rendering its images,
+    without its data or reader, for passing to worker processes
+    """
+
+    ATTRS = ('minX', 'minY', 'sizeX', 'sizeY', 'cellSizeX', 'cellSizeY',
+        'heights', 'is_visual_range')
+
+    def __init__(self, grid):
+        for attr in self.ATTRS:
+            setattr(self, attr, getattr(grid, attr))
+
+
+def _attach_shared_memory(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before python 3.13, attaching registers the block with the
+        # resource tracker, which would unlink it when this process exits
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+# Shared memory blocks attached to by this process, by name
+_ATTACHED_SHARED_ARRAYS = {}
+
+class SharedArray:
+    """A copy of an array in shared memory.  Pickles as a reference to the
+    shared memory block, so that worker processes access the array without
+    its being copied to them.  Only the process that created it should
+    call release.
+    """
+
+    def __init__(self, data):
+        data = np.ascontiguousarray(data)
+        self._shm = shared_memory.SharedMemory(create=True,
+            size=max(data.nbytes, 1))
+        self.name = self._shm.name
+        self.shape = data.shape
+        self.dtype = data.dtype
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self._shm.buf)
+        self.array[...] = data
+
+    def __getstate__(self):
+        return {'name': self.name, 'shape': self.shape, 'dtype': self.dtype}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.name not in _ATTACHED_SHARED_ARRAYS:
+            _ATTACHED_SHARED_ARRAYS[self.name] = _attach_shared_memory(self.name)
+        self._shm = _ATTACHED_SHARED_ARRAYS[self.name]
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self._shm.buf)
+
+    def release(self):
+        del self.array
+        self._shm.close()
+        self._shm.unlink()
+
+def _share(data, storage):
+    # Frames are shared in the storage dtype, and decoded by the workers
+    stored = (data.stored if isinstance(data, StoredGridData)
+        else storage.encode(np.asarray(data)))
+    return SharedArray(stored)
+
+# Each worker process's config, parameter, and grid geometry
+_RENDER_WORKER = {}
+
+def _init_render_worker(config, parameter, geometry):
+    _RENDER_WORKER.update(config=config, parameter=parameter,
+        geometry=geometry)
+
+def _render_frames(frames, storage, keys, dts, sections, layer,
+        time_series_type, utc_offset):
+    # Each worker has its own BSDispersionPlot, via create_color_plot.  The
+    # images created are returned to the main process.
+    w = _RENDER_WORKER
+    images = []
+    batch = render_frame_batch([storage.decode(frames.array[key]) for key in keys])
+    for frame, dt in zip(batch, dts):
+        create_frame_images(w['config'], w['parameter'], w['geometry'],
+            sections, layer, time_series_type, frame, dt, utc_offset=utc_offset,
+            images=images)
+    write_geotiff_series(w['config'], w['parameter'], w['geometry'], sections)
+    return images
+
+def _render_legend(section, layer, time_series_type, utc_offset):
+    w = _RENDER_WORKER
+    images = []
+    create_dispersion_legend(w['config'], w['parameter'], w['geometry'],
+        section, layer, time_series_type, utc_offset=utc_offset, images=images)
+    return images
+
+def create_parallel_dispersion_images(config, parameter, grid, utc_offsets,
+        jobs, frames_per_task=8, images=None):
+    """Creates the same images as create_layer_dispersion_images, spread
+    across `jobs` worker processes.  The grid, and each rolling window and
+    daily aggregate, is computed here and copied into shared memory once;
+    workers render frames from it, in batches of frames_per_task.  The
+    images and legends the workers create are appended to images.
+    """
+    geometry = GridGeometry(grid)
+    shared = []
+    plot = None
+    try:
+        with ProcessPoolExecutor(max_workers=jobs,
+                initializer=_init_render_worker,
+                initargs=(config, parameter, geometry)) as executor:
+            futures = []
+
+            def _submit(frames, keys, dts, time_series_type, layer,
+                    utc_offset=None):
+                plot = None
+                sections = get_color_map_sections(config, parameter,
+                    time_series_type)
+                for section in sections:
+                    # Create output directories here, rather than have
+                    # workers race to create them
+                    _, dirs = _image_set_dirs(grid, section, layer,
+                        time_series_type, utc_offset=utc_offset)
+                    dfu.create_image_set_dir(config, parameter, *dirs)
+                    plot = create_color_plot(config, parameter, grid, section)
+                # Each frame is rendered with all color maps by one worker,
+                # and GeoTIFF series are written whole, by the worker
+                # rendering all of their frames
+                per_task = (max(len(keys), 1) if writes_geotiff_series(config)
+                    else frames_per_task)
+                for i in range(0, len(keys), per_task):
+                    futures.append(executor.submit(_render_frames, frames,
+                        grid.storage, keys[i:i + per_task],
+                        dts[i:i + per_task], sections, layer,
+                        time_series_type, utc_offset))
+                # Legends are submitted after frames, so that images are
+                # listed in the order create_layer_dispersion_images
+                # creates them
+                for section in sections:
+                    futures.append(executor.submit(_render_legend, section,
+                        layer, time_series_type, utc_offset))
+                return plot
+
+            cube = None
+            for layer in range(grid.sizeZ):
+                if get_color_map_sections(config, parameter,
+                        TimeSeriesTypes.HOURLY):
+                    if cube is None:
+                        cube = _share(grid.data, grid.storage)
+                        shared.append(cube)
+                    plot = _submit(cube,
+                        [(t, layer) for t in range(grid.num_times)],
+                        grid.datetimes, TimeSeriesTypes.HOURLY, layer) or plot
+
+                for time_series_type, window in ROLLING_WINDOWS.items():
+                    if not get_color_map_sections(config, parameter,
+                            time_series_type):
+                        continue
+                    frames = _share(grid.get_rolling_window(window['statistic'],
+                        layer, window['width']), grid.storage)
+                    shared.append(frames)
+                    first = ((window['width'] - 1) // 2 if window['centered']
+                        else window['width'] - 1)
+                    keys = list(range(len(frames.array)))
+                    plot = _submit(frames, keys,
+                        grid.datetimes[first:first + len(keys)],
+                        time_series_type, layer) or plot
+
+                for time_series_type in get_daily_time_series_types(grid):
+                    if not get_color_map_sections(config, parameter,
+                            time_series_type):
+                        continue
+                    for utc_offset in utc_offsets:
+                        grid.compute_days_spanned(utc_offset)
+                        frames = _share(grid.get_daily_aggregate(
+                            DAILY_STATISTIC[time_series_type], layer,
+                            utc_offset, utc_offsets=utc_offsets), grid.storage)
+                        shared.append(frames)
+                        plot = _submit(frames, list(range(grid.num_days)),
+                            grid.dates, time_series_type, layer,
+                            utc_offset=utc_offset) or plot
+
+            for future in futures:
+                created = future.result()
+                if images is not None:
+                    images.extend(created)
+    finally:
+        for frames in shared:
+            frames.release()
+
+    # plot will be used for its already computed min/max lat/lon
+    return plot
+
+##
+## Frame Cache
+##
+
+class CachedGrid(GridGeometry):
+    """Stands in for a BSDispersionGrid whose frames are cached, with the
+    attributes used in rendering them
+    """
+
+    ATTRS = GridGeometry.ATTRS + ('sizeZ', 'num_times')
+
+    def __init__(self, attrs, datetimes):
+        for attr in self.ATTRS:
+            setattr(self, attr, attrs[attr])
+        self.datetimes = datetimes
+
+
+class FrameCache:
+    """A grid's frames - hourly, rolling windows, and daily aggregates at
+    each UTC offset - saved, in the grid storage's dtype, as a .npy file
+    per layer and time series type (and offset), along with an index of
+    their datetimes and the grid's geometry.  Restyling (see
+    DispersionGridInput > RESTYLE) renders them, memory-mapped, rather
+    than reading the grid and recomputing them.
+    """
+
+    def __init__(self, config, parameter):
+        self.config = config
+        self.parameter = parameter
+        self.dir_name = dfu.frame_cache_dir_name(config, parameter)
+        self.index_pathname = dfu.frame_cache_index_pathname(config, parameter)
+
+    def save(self, grid, utc_offsets):
+        """Caches all of the grid's frames, including those of time series
+        types without color maps configured, for future color maps.  Every
+        rolling window and daily aggregate is therefore computed, and held
+        in memory (on the grid, in its storage's dtype), even those that
+        won't be rendered.  Hourly frames are written one at a time, so
+        that lazily read grids aren't read into memory whole.
+        """
+        logging.info("Caching frames in %s", self.dir_name)
+        os.makedirs(self.dir_name, exist_ok=True)
+        # The index is written last, so that frames aren't restyled
+        # from an incomplete cache
+        if os.path.exists(self.index_pathname):
+            os.remove(self.index_pathname)
+
+        frame_sets = []
+        for layer in range(grid.sizeZ):
+            for time_series_type, utc_offset, frames, dts in iter_frame_sets(
+                    self.config, self.parameter, grid, layer, utc_offsets,
+                    all_time_series_types=True):
+                filename = '_'.join([dfu.create_height_label(grid.heights[layer]),
+                    TIME_SET_DIR_NAMES[time_series_type]]
+                    + ([] if utc_offset is None else [dfu.get_utc_label(utc_offset)])
+                    ) + '.npy'
+                pathname = os.path.join(self.dir_name, filename)
+                if isinstance(frames, StoredGridData):
+                    np.save(pathname, frames.stored)
+                elif isinstance(frames, np.ndarray):
+                    np.save(pathname, grid.storage.encode(frames))
+                else:
+                    self._save_frames(pathname, frames, len(dts), grid)
+                frame_sets.append({
+                    'layer': layer,
+                    'time_series_type': time_series_type,
+                    'utc_offset': utc_offset,
+                    'filename': filename,
+                    'datetimes': [dt.isoformat() for dt in dts]
+                })
+
+        index = {
+            'grid_file': get_grid_file_id(self.config.get(
+                'DispersionGridInput', "FILENAME")),
+            'layers': self.config.get('DispersionGridInput', "LAYERS"),
+            'bounding_box': self.config.get('DispersionGridInput', "BOUNDING_BOX"),
+            'grid': dict((attr, getattr(grid, attr))
+                for attr in CachedGrid.ATTRS),
+            'datetimes': [dt.isoformat() for dt in grid.datetimes],
+            'storage': {
+                'dtype': grid.storage.dtype.name,
+                'scale': getattr(grid.storage, 'scale', None),
+                'offset': getattr(grid.storage, 'offset', 0.0)
+            },
+            'frame_sets': frame_sets
+        }
+        with open(self.index_pathname + '.tmp', 'w') as f:
+            # Grid attributes may be numpy scalars
+            json.dump(index, f, default=lambda v: v.item())
+        os.replace(self.index_pathname + '.tmp', self.index_pathname)
+
+    def _save_frames(self, pathname, frames, num_frames, grid):
+        # Frames computed as they're iterated are encoded and written to
+        # a memory-mapped .npy file one at a time
+        stored = np.lib.format.open_memmap(pathname, mode='w+',
+            dtype=grid.storage.dtype, shape=(num_frames, grid.sizeY, grid.sizeX))
+        for i, frame in enumerate(frames):
+            stored[i] = grid.storage.encode(frame)
+        stored.flush()
+        del stored
+
+    def _load_index(self):
+        if not hasattr(self, '_index'):
+            if not os.path.exists(self.index_pathname):
+                raise ValueError("No frames cached in {}".format(self.dir_name))
+            with open(self.index_pathname) as f:
+                self._index = json.load(f)
+            self._storage = GridStorage(**self._index['storage'])
+        return self._index
+
+    def load_grid(self):
+        """Returns the cached grid, after checking that its frames were
+        cached from the configured grid file, layers and bounding box.
+        Frames can be restyled after the grid file has been removed, in
+        which case only its path is checked.
+        """
+        index = self._load_index()
+        filename = self.config.get('DispersionGridInput', "FILENAME")
+        if os.path.exists(filename):
+            grid_file = ('grid file', index['grid_file'],
+                get_grid_file_id(filename))
+        else:
+            grid_file = ('grid file', index['grid_file'][:1],
+                [os.path.abspath(filename)])
+        for name, cached, configured in (grid_file,
+                ('layers', index.get('layers'),
+                    self.config.get('DispersionGridInput', "LAYERS")),
+                ('bounding box', index.get('bounding_box'),
+                    self.config.get('DispersionGridInput', "BOUNDING_BOX"))):
+            if cached != list(configured):
+                raise ValueError("Frames in {} were cached from {} {}, not {};"
+                    " rerun without RESTYLE to recache them".format(
+                    self.dir_name, name, cached, list(configured)))
+        return CachedGrid(index['grid'],
+            [datetime.fromisoformat(dt) for dt in index['datetimes']])
+
+    def iter_frame_sets(self, config, parameter, grid, layer, utc_offsets):
+        """Yields the same frame sets as iter_frame_sets, from the cache"""
+        frame_sets = dict(((f['layer'], f['time_series_type'], f['utc_offset']), f)
+            for f in self._load_index()['frame_sets'])
+
+        # In the same order as iter_frame_sets
+        keys = [(t, None) for t in [TimeSeriesTypes.HOURLY] + list(ROLLING_WINDOWS)]
+        keys.extend([(t, o) for t in get_daily_time_series_types(grid)
+            for o in utc_offsets])
+
+        for time_series_type, utc_offset in keys:
+            if not get_color_map_sections(config, parameter, time_series_type):
+                continue
+            frame_set = frame_sets.get((layer, time_series_type, utc_offset))
+            if not frame_set:
+                raise ValueError("{} frames{} not cached".format(
+                    TIME_SET_DIR_NAMES[time_series_type],
+                    '' if utc_offset is None else ' at UTC offset {}'.format(utc_offset)))
+            frames = np.load(os.path.join(self.dir_name, frame_set['filename']),
+                mmap_mode='r')
+            yield (time_series_type, utc_offset, self._storage.wrap(frames),
+                [datetime.fromisoformat(dt) for dt in frame_set['datetimes']])
+
 @memoizeme
 def create_color_plot(config, parameter, grid, section):
     # Create plots
@@ -719,106 +2859,22 @@ def create_color_plot(config, parameter, grid, section):
 
     return plot
 
-def create_hourly_dispersion_images(config, parameter, grid, section, layer):
-    plot = create_color_plot(config, parameter, grid, section)
-    height_label = dfu.create_height_label(grid.heights[layer])
-
-    outdir, geotiff_outdir = dfu.create_image_set_dir(config, parameter, height_label,
-        TIME_SET_DIR_NAMES[dfu.TimeSeriesTypes.HOURLY], section)
-
-    for i in range(grid.num_times):
-        # Shift filename date stamps
-        fileroot = dfu.image_pathname(
-            outdir, parameter, height_label,
-            dfu.TimeSeriesTypes.HOURLY, section,
-            grid.datetimes[i]-timedelta(hours=1))
-        geotiff_fileroot = geotiff_outdir and dfu.image_pathname(
-            geotiff_outdir, parameter, height_label,
-            dfu.TimeSeriesTypes.HOURLY, section,
-            grid.datetimes[i]-timedelta(hours=1))
-
-        logging.debug("Creating height %s hourly (%s) concentration "
-            "plot %d of %d " % (height_label, section, i+1, grid.num_times))
-
-        # Create a filled contour plot
-        plot.make_contour_plot(grid.data[i,layer,:,:], fileroot, geotiff_fileroot)
-
-    # Create a color bar to use in overlays
-    fileroot = dfu.legend_pathname(outdir, parameter, height_label,
-        dfu.TimeSeriesTypes.HOURLY, section)
-    plot.make_colorbar(fileroot)
-
-    # plot will be used for its already computed min/max lat/lon
-    return plot
-
-def create_three_hour_dispersion_images(config, parameter, grid, section, layer):
-
-    # TODO: switch to iterating over time first and then over color scheme, to
-    # avoid redundant average computations
-
-    # TODO: write tests for this function
-
-    plot = create_color_plot(config, parameter, grid, section)
-    height_label = dfu.create_height_label(grid.heights[layer])
-
-    outdir, geotiff_outdir = dfu.create_image_set_dir(config, parameter, height_label,
-        TIME_SET_DIR_NAMES[dfu.TimeSeriesTypes.THREE_HOUR], section)
-
-    for i in range(1, grid.num_times - 1):
-        # Shift filename date stamps; shift an extra hour because we are on third
-        # hour of three hour series and we want timestamp to reflect middle hour
-        fileroot = dfu.image_pathname(
-            outdir, parameter, height_label,
-            dfu.TimeSeriesTypes.THREE_HOUR, section,
-            grid.datetimes[i]-timedelta(hours=1))
-        geotiff_fileroot = geotiff_outdir and dfu.image_pathname(
-            geotiff_outdir, parameter, height_label,
-            dfu.TimeSeriesTypes.THREE_HOUR, section,
-            grid.datetimes[i]-timedelta(hours=1))
-
-        logging.debug("Creating height %s three hour (%s) concentration "
-            "plot %d of %d " % (height_label, section, i+1, grid.num_times))
-
-        # Create a filled contour plot
-        plot.make_contour_plot(np.average(grid.data[i-1:i+2,layer,:,:], 0),
-            fileroot, geotiff_fileroot)
-
-
-    # Create a color bar to use in overlays
-    fileroot = dfu.legend_pathname(outdir, parameter, height_label,
-        dfu.TimeSeriesTypes.THREE_HOUR, section)
-    plot.make_colorbar(fileroot)
-
-    # plot will be used for its already computed min/max lat/lon
-    return plot
+# Running averages, by time series type.  Each frame is of a window of
+# `width` hours, either centered on the frame's hour, or ending with it
+ROLLING_WINDOWS = {
+    dfu.TimeSeriesTypes.THREE_HOUR: {
+        'statistic': 'mean', 'width': 3, 'centered': True
+    },
+    dfu.TimeSeriesTypes.TWENTY_FOUR_HOUR: {
+        'statistic': 'mean', 'width': 24, 'centered': False
+    },
+    dfu.TimeSeriesTypes.NOWCAST: {
+        'statistic': 'nowcast', 'width': 12, 'centered': False
+    }
+}
 
-DATA_ATTR = {
-    dfu.TimeSeriesTypes.DAILY_MAXIMUM: 'max_data',
-    dfu.TimeSeriesTypes.DAILY_MINIMUM: 'min_data',
-    dfu.TimeSeriesTypes.DAILY_AVERAGE: 'avg_data'
+DAILY_STATISTIC = {
+    dfu.TimeSeriesTypes.DAILY_MAXIMUM: 'max',
+    dfu.TimeSeriesTypes.DAILY_MINIMUM: 'min',
+    dfu.TimeSeriesTypes.DAILY_AVERAGE: 'mean'
 }
-def create_daily_dispersion_images(config, parameter, grid, section, layer,
-        utc_offset, time_series_type):
-    plot = create_color_plot(config, parameter, grid, section)
-    height_label = dfu.create_height_label(grid.heights[layer])
-    outdir, geotiff_outdir = dfu.create_image_set_dir(config, parameter, height_label,
-        TIME_SET_DIR_NAMES[time_series_type],
-        dfu.get_utc_label(utc_offset), section)
-
-    grid.calc_aggregate_data(utc_offset)
-    data = getattr(grid, DATA_ATTR[time_series_type])
-    for i in range(grid.num_days):
-        logging.debug("Creating height %s %s daily %s concentration "
-            "plot %d of %d " % (height_label, dfu.get_utc_label(utc_offset),
-                dfu.TIME_SET_DIR_NAMES[time_series_type], i + 1, grid.num_days))
-        fileroot = dfu.image_pathname(
-            outdir, parameter, height_label,
-            time_series_type, section, grid.dates[i], utc_offset=utc_offset)
-        geotiff_fileroot = geotiff_outdir and dfu.image_pathname(
-            geotiff_outdir, parameter, height_label,
-            time_series_type, section, grid.dates[i], utc_offset=utc_offset)
-        plot.make_contour_plot(data[i,layer,:,:], fileroot, geotiff_fileroot)
-
-    plot.make_colorbar(dfu.legend_pathname(outdir, parameter, height_label,
-        time_series_type, section, utc_offset=utc_offset))
-    return plot
@@ -2,9 +2,12 @@ import logging
 import os
 import re
 import shutil
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from osgeo import gdal
 from PIL import Image
 # from PIL import ImageColor # TODO: Can this replace SimpleColor?
-from copy import deepcopy
 
 from . import dispersion_file_utils as dfu
 from .constants import TIME_SERIES_PRETTY_NAMES
@@ -50,10 +53,12 @@ class SimpleColor(object):
         return self.r, self.g, self.b, self.a
 
 
-def format_dispersion_images(config, parameter, heights):
+def get_background_color(config, parameter):
+    """Returns the (red, green, blue) background color, which is made fully
+    transparent in dispersion images
+    """
     # [DispersionImages] configurations
     section = 'DispersionImages'
-    image_opacity_factor = config.getfloat(section, "IMAGE_OPACITY_FACTOR")
     vr_part = ("_VISUAL_RANGE"
         if re.sub("[ _-]*", "", parameter.lower()) == 'visualrange' else "")
     if config.getboolean(section, "DEFINE_RGB"):
@@ -66,31 +71,53 @@ def format_dispersion_images(config, parameter, heights):
         red, green, blue = ((int(hex_val, 16) for hex_val in rgb_hex))
     else:
         raise Exception("Configuration ERROR...DispersionImages.DEFINE_RGB or DispersionImages.DEFINE_HEX must be true.")
-    background_color = SimpleColor(red, green, blue, 255)
-
-    # [DispersionGridOutput] configurations
-    images = dfu.collect_all_dispersion_images(config, parameter, heights)
-
-    def _format(data, *keys):
-        for k, v in data.items():
-            _keys = list(keys) + [k]
-            if 'smoke_images' in v:
-                # k is the color map section
-                # iof is the color map section's custom image opacity factor, if specified
-                iof = (config.getfloat(k, "IMAGE_OPACITY_FACTOR") if
-                    config.has_option(k, "IMAGE_OPACITY_FACTOR") else
-                    image_opacity_factor)
-                for i, image_name in enumerate(v['smoke_images']):
-                    logging.debug("Applying transparency {} to plot"
-                        " {} of {}".format(iof, i, ' > '.join(_keys)))
-                    image_path = os.path.join(v['root_dir'], image_name)
-                    image = Image.open(image_path)
-                    image = _apply_transparency(image, deepcopy(background_color), iof)
-                    image.save(image_path, "PNG")
-            else:
-                _format(v, *_keys)
-
-    _format(images)
+    return red, green, blue
+
+def get_image_opacity_factor(config, section):
+    """Returns the color map section's custom image opacity factor, if
+    specified, or else the default
+    """
+    return (config.getfloat(section, "IMAGE_OPACITY_FACTOR") if
+        config.has_option(section, "IMAGE_OPACITY_FACTOR") else
+        config.getfloat('DispersionImages', "IMAGE_OPACITY_FACTOR"))
+
+def format_dispersion_images(config, parameter, images):
+    """Applies transparency to dispersion images already written to disk -
+    the smoke images among images, a list of dfu.DispersionImage objects.
+    (Images are now rendered with transparency applied - see
+    BSDispersionPlot.format_image - so this is only needed for images
+    written by earlier versions.)  Images that are hard links to the same
+    file (see DispersionImages > EMPTY_FRAMES) are formatted once for each
+    image opacity factor, and stay linked.
+    """
+    background_color = get_background_color(config, parameter)
+
+    linked = {}
+    for image in dfu.iter_smoke_images(images):
+        stat = os.stat(image.path)
+        iof = get_image_opacity_factor(config, image.color_map_section)
+        linked.setdefault((stat.st_dev, stat.st_ino, iof), []).append(image)
+
+    def _format(images, iof):
+        logging.debug("Applying transparency {} to {}".format(iof,
+            images[0].describe()))
+        with Image.open(images[0].path) as image:
+            rgba = np.array(image.convert('RGBA'))
+        apply_transparency(rgba, background_color, iof)
+        # Replaced, rather than written to, so that other links to the
+        # file are unchanged
+        tmp_path = _temporary_pathname(images[0].path)
+        Image.fromarray(rgba, 'RGBA').save(tmp_path, "PNG")
+        os.replace(tmp_path, images[0].path)
+        for image in images[1:]:
+            _replace_with_link(images[0].path, image.path)
+
+    # PNG decoding and encoding, and the numpy operations, release the GIL,
+    # so images are formatted concurrently in threads
+    with ThreadPoolExecutor() as executor:
+        for future in [executor.submit(_format, images, key[2])
+                for key, images in linked.items()]:
+            future.result()
 
 
 def _apply_transparency(image, background_color, opacity_factor):
@@ -98,97 +125,120 @@ def _apply_transparency(image, background_color, opacity_factor):
     specified factor.
     Arguments:
         image            -- Image to apply transparency to (PIL.Image object)
-        background_color -- Color that will be made transparent (SimpleColor object)
+        background_color -- Color that will be made transparent (SimpleColor object); not modified
         opacity_factor   -- Determines visibility of image. A value of 0 would make the image fully transparent
                             (float 0.0 to 1.0)
     Returns:
-        Modified img object
+        Modified image (new PIL.Image object)
+    """
+    rgba = np.array(image.convert('RGBA'))
+    return Image.fromarray(apply_transparency(rgba,
+        background_color.get_color_tuple()[:3], opacity_factor), 'RGBA')
+
+def apply_transparency(rgba, background_color, opacity_factor):
+    """Sets pixels of the opaque background color to be fully transparent,
+    and scales the alpha of all others by the opacity factor, as whole-array
+    operations.
+    Arguments:
+        rgba             -- RGBA pixels, as uint8 array of any shape whose last
+                            dimension is of length 4; modified in place
+        background_color -- Color that will be made transparent ((r, g, b))
+        opacity_factor   -- Determines visibility of image (float 0.0 to 1.0)
+    Returns:
+        rgba
     """
-    background_color_tuple = background_color.get_color_tuple() # Get color tuple to search for
-    transparent_color_tuple = background_color.set_color(a=0).get_color_tuple() # Get transparent color tuple
-    pixdata = image.load()
-
-    for y in range(image.size[1]):
-        for x in range(image.size[0]):
-            if pixdata[x, y] == background_color_tuple:
-                pixdata[x, y] = transparent_color_tuple
-            else:
-                pixel = pixdata[x, y]
-                new_alpha = int(pixel[3]*opacity_factor)
-                if new_alpha > 255:
-                    new_alpha = 255
-                elif new_alpha < 0:
-                    new_alpha = 0
-                pixel_color = SimpleColor(r=pixel[0], g=pixel[1], b=pixel[2], a=new_alpha)
-                pixdata[x, y] = pixel_color.get_color_tuple()
-    return image
-
-def reproject_images(config, parameter, grid_bbox, heights):
+    background = np.all(rgba == tuple(background_color) + (255,), axis=-1)
+    # Truncated, as by int()
+    alpha = (rgba[..., 3] * opacity_factor).astype(np.int64)
+    rgba[..., 3] = np.clip(alpha, 0, 255)
+    rgba[background, 3] = 0
+    return rgba
+
+def reproject_images(config, parameter, grid_bbox, images):
     """Reproject images for display on map software (i.e. OpenLayers).
-    PNG images will first be translated to TIF files via the 'gdal_translate' command.  The new TIF file will then be
-    reprojected using the 'gdalwarp' command.  Finally, the reprojected TIF file will be warped back into PNG image form.
+    Each PNG image is georeferenced to the grid's bounding box, warped to
+    REPROJECT_IMAGES_SRS, and encoded back to PNG in process, on in-memory
+    datasets - see reproject_image.
 
     Currently hardcoded to reproject to  EPSG:3857 - http://spatialreference.org/ref/sr-org/epsg3857/
-    """
 
-    # Note: This code utilizes gdal CLI commands.  Idealy it should instead take advantage of the python gdal library.
-    # However, there is no official documentation available for the python gdal API, making it rather tricky to
-    # use correctly.  The below link points to a unit test suite for python gdal's transformation logic.  Perhaps there
-    # are enough examples there to determain how to replace the translation/warp operations used from the command line.
-    #
-    # http://svn.osgeo.org/gdal/trunk/autotest/gcore/transformer.py
-    #
-    # Below are links to the command line documentation for gdal's "translate" and "warp" commands.
-    #
-    # gdal_translate - http://www.gdal.org/gdal_translate.html
-    # gdalwarp -      http://www.gdal.org/gdalwarp.html
-
-    images = dfu.collect_all_dispersion_images(config, parameter, heights)
-
-    # Collect inputs for gdal translate and warp commands
+    images is the list of dfu.DispersionImage objects created by
+    dispersiongrid.create_dispersion_images; only the smoke images are
+    reprojected.  Images that are hard links to the same file (see
+    DispersionImages > EMPTY_FRAMES) are reprojected once.
+    """
     a_srs = 'WGS84'
-    a_ullr = '%s %s %s %s' % (str(grid_bbox[0]), str(grid_bbox[3]), str(grid_bbox[2]), str(grid_bbox[1]))
     t_srs = config.get('DispersionImages', "REPROJECT_IMAGES_SRS")
     logging.info("Reprojecting images to SRS: %s", t_srs)
 
     _save_original(config, parameter, a_srs)
 
-    def _reproject(data, *keys):
-        if isinstance(data, dict):
-            if 'smoke_images' in data:
-                for i, image_name in enumerate(data['smoke_images']):
-                    logging.debug("Reprojecting image"
-                        " {} of {}".format(i, ' > '.join(keys)))
-                    image_path = os.path.join(data['root_dir'], image_name)
-                    tiff_path1 = os.path.join(data['root_dir'], 'temp1.tif')
-                    tiff_path2 = os.path.join(data['root_dir'], 'temp2.tif')
-
-                    # Build gdal translate and warp command line strings
-                    gdal_translate_cmd1 = 'gdal_translate -a_srs %s -a_ullr %s %s %s' % (a_srs, a_ullr, image_path, tiff_path1)
-                    gdal_warp_cmd = 'gdalwarp -t_srs \'%s\' %s %s' % (t_srs, tiff_path1, tiff_path2)
-                    gdal_translate_cmd2 = 'gdal_translate -of PNG %s %s' % (tiff_path2, image_path)
-
-                    # Gdal translate PNG image to TIF
-                    logging.info("Executing: %s" % gdal_translate_cmd1)
-                    os.system(gdal_translate_cmd1)
-
-                    # Gdal warp TIF to new projection
-                    logging.info("Executing: %s" % gdal_warp_cmd)
-                    os.system(gdal_warp_cmd)
-
-                    # Gdal translate new TIF back to PNG
-                    logging.info("Executing: %s" % gdal_translate_cmd2)
-                    os.system(gdal_translate_cmd2)
-
-                    # Clean up intermediate files
-                    os.remove(tiff_path1)
-                    os.remove(tiff_path2)
-                    os.remove(image_path + '.aux.xml')
-            else:
-                for k, v in data.items():
-                    _reproject(v, *(list(keys) + [k]))
-
-    _reproject(images)
+    linked = {}
+    for image in dfu.iter_smoke_images(images):
+        stat = os.stat(image.path)
+        linked.setdefault((stat.st_dev, stat.st_ino), []).append(image)
+
+    def _reproject(images):
+        logging.debug("Reprojecting image {}".format(images[0].describe()))
+        reproject_image(images[0].path, grid_bbox, a_srs, t_srs)
+        for image in images[1:]:
+            _replace_with_link(images[0].path, image.path)
+
+    # GDAL releases the GIL, so images are reprojected concurrently in
+    # threads
+    with ThreadPoolExecutor() as executor:
+        for future in [executor.submit(_reproject, images)
+                for images in linked.values()]:
+            future.result()
+
+def reproject_image(path, grid_bbox, a_srs, t_srs):
+    """Reprojects the PNG image at path, whose extent is the lon/lat
+    grid_bbox in a_srs, to t_srs - the equivalent of gdal_translate
+    -a_srs -a_ullr, gdalwarp -t_srs, and gdal_translate -of PNG, without
+    intermediate files.  The reprojected image replaces the file at path,
+    rather than being written to it, so that any other links to the file
+    are unchanged.
+    """
+    ullr = [grid_bbox[0], grid_bbox[3], grid_bbox[2], grid_bbox[1]]
+    georeferenced = gdal.Translate('', path, format='MEM', outputSRS=a_srs,
+        outputBounds=ullr)
+    warped = georeferenced and gdal.Warp('', georeferenced, format='MEM',
+        dstSRS=t_srs)
+    if not warped:
+        raise RuntimeError("Failed to reproject {}".format(path))
+
+    # The PNG driver can only copy datasets, so the PNG is encoded to an
+    # in-memory file (under a name unique to the image, as images are
+    # reprojected concurrently), along with any .aux.xml file GDAL adds
+    vsimem_path = '/vsimem/{}.png'.format(uuid.uuid4().hex)
+    try:
+        if not gdal.Translate(vsimem_path, warped, format='PNG'):
+            raise RuntimeError("Failed to reproject {}".format(path))
+        f = gdal.VSIFOpenL(vsimem_path, 'rb')
+        try:
+            data = gdal.VSIFReadL(1, gdal.VSIStatL(vsimem_path).size, f)
+        finally:
+            gdal.VSIFCloseL(f)
+    finally:
+        for name in gdal.ReadDir('/vsimem/') or []:
+            if name.startswith(os.path.basename(vsimem_path)):
+                gdal.Unlink('/vsimem/' + name)
+
+    tmp_path = _temporary_pathname(path)
+    with open(tmp_path, 'xb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def _replace_with_link(source, path):
+    # Linked under a temporary name first, so that path is replaced in
+    # one step
+    tmp_path = _temporary_pathname(path)
+    os.link(source, tmp_path)
+    os.replace(tmp_path, path)
+
+def _temporary_pathname(path):
+    return os.path.join(os.path.dirname(path),
+        '.{}.png'.format(uuid.uuid4().hex))
 
 
 def _save_original(config, parameter, a_srs):
@@ -0,0 +1,171 @@
+"""Records, for each image (and its GeoTIFFs) and legend, a fingerprint of
+what it was created from, so that reruns into the same output directory only
+recreate those whose inputs have changed or whose files are missing.
+"""
+
+import hashlib
+import json
+import logging
+import os
+
+from . import __version__
+from . import dispersion_file_utils as dfu
+from .memoize import memoizeme
+
+__all__ = [
+    'ImageManifest', 'get_image_manifest', 'remove_image_manifest',
+    'get_grid_file_id'
+]
+
+# Options that don't affect the contents of any one image, by section -
+# only which images are created, where, or how.  All other options in these
+# sections, and in the image's color map section, are fingerprinted.
+UNFINGERPRINTED_OPTIONS = {
+    'DispersionGridInput': ('FILENAME', 'PARAMETER', 'PARAMETERS', 'LAYERS',
+        'DATA_ACCESS', 'STREAMING', 'RESTYLE'),
+    'DispersionGridOutput': ('OUTPUT_DIR', 'GEOTIFF_OUTPUT_DIR',
+        'GRID_INFO_JSON', 'CREATE_FRAME_CACHE', 'FRAME_CACHE_DIR'),
+    'DispersionImages': ('JOBS', 'INCREMENTAL', 'DAILY_IMAGES_UTC_OFFSETS',
+        'REPROJECT_IMAGES', 'REPROJECT_IMAGES_SRS',
+        'REPROJECT_IMAGES_SAVE_ORIGINAL')
+}
+
+def _is_fingerprinted(section, option):
+    # DispersionGridOutput's *_COLORS[_<PARAMETER>] options list color
+    # map sections, which are fingerprinted themselves
+    return (option.upper() not in UNFINGERPRINTED_OPTIONS.get(section, ())
+        and not (section == 'DispersionGridOutput' and '_COLORS' in option.upper()))
+
+
+class ImageManifest:
+    """A parameter's manifest, which lives in its images directory.  Entries
+    are appended, one JSON object per line, as images are created, so that
+    an interrupted run resumes where it left off; compact rewrites it with
+    just the latest entry for each image.  Worker processes each load and
+    append to it.
+    """
+
+    def __init__(self, config, parameter):
+        self.pathname = dfu.image_manifest_pathname(config, parameter)
+        self._config = config
+        self._options = {}
+        self._inputs = self._get_inputs(config, parameter)
+        self._entries = self._load()
+
+    def _get_inputs(self, config, parameter):
+        if config.getboolean('DispersionGridInput', "RESTYLE"):
+            # The grid isn't read; its frames were cached from it
+            with open(dfu.frame_cache_index_pathname(config, parameter)) as f:
+                grid_file_id = json.load(f)['grid_file']
+        else:
+            grid_file_id = get_grid_file_id(config.get('DispersionGridInput',
+                "FILENAME"))
+        return {
+            'version': __version__,
+            'grid': grid_file_id,
+            'parameter': parameter,
+            'config': dict((section, self._get_options(section))
+                for section in UNFINGERPRINTED_OPTIONS)
+        }
+
+    def _get_options(self, section):
+        if section not in self._options:
+            defaults = self._config.defaults()
+            self._options[section] = dict((option, val)
+                for option, val in self._config.items(section)
+                if option not in defaults and _is_fingerprinted(section, option))
+        return self._options[section]
+
+    def _load(self):
+        entries = {}
+        if os.path.exists(self.pathname):
+            with open(self.pathname) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A line cut short by an interrupted run
+                        continue
+                    entries[entry['key']] = entry
+        return entries
+
+    def _key(self, pathname):
+        return os.path.relpath(pathname, os.path.dirname(self.pathname))
+
+    def fingerprint(self, section, *inputs):
+        """Returns the fingerprint of an image created with the color map
+        section from the inputs that identify it (e.g. its layer, time
+        series type, UTC offset and date), which must be JSON serializable
+        """
+        return hashlib.sha256(json.dumps([self._inputs,
+            self._get_options(section), inputs], sort_keys=True,
+            default=str).encode()).hexdigest()
+
+    def is_current(self, fileroot, fingerprint):
+        """Returns True if the image at fileroot was created with the
+        given fingerprint, and all of the files it created still exist
+        """
+        entry = self._entries.get(self._key(fileroot))
+        return bool(entry and entry['fingerprint'] == fingerprint
+            and all(os.path.exists(os.path.join(os.path.dirname(self.pathname), f))
+                for f in entry['files']))
+
+    def get_files(self, fileroot):
+        """Returns the pathnames of the files recorded as created for the
+        image at fileroot
+        """
+        entry = self._entries.get(self._key(fileroot))
+        return [os.path.join(os.path.dirname(self.pathname), f)
+            for f in (entry['files'] if entry else [])]
+
+    def record(self, fileroot, fingerprint, files):
+        entry = {
+            'key': self._key(fileroot),
+            'fingerprint': fingerprint,
+            'files': [self._key(f) for f in files]
+        }
+        self._entries[entry['key']] = entry
+        # Lines are written in one go, so that processes appending to the
+        # manifest at once don't interleave them
+        with open(self.pathname, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+
+    def compact(self):
+        # Reload, to pick up entries appended by other processes
+        self._entries = self._load()
+        tmp_pathname = self.pathname + '.tmp'
+        with open(tmp_pathname, 'w') as f:
+            for entry in self._entries.values():
+                f.write(json.dumps(entry) + '\n')
+        os.replace(tmp_pathname, self.pathname)
+
+
+def get_grid_file_id(filename):
+    """Identifies the grid file, and the version of it, by its path, size
+    and modification time
+    """
+    stat = os.stat(filename)
+    return [os.path.abspath(filename), stat.st_size, stat.st_mtime_ns]
+
+@memoizeme
+def get_image_manifest(config, parameter):
+    """Returns the parameter's manifest, or None if images aren't being
+    created incrementally
+    """
+    if not config.getboolean('DispersionImages', "INCREMENTAL"):
+        return None
+    if config.getboolean('DispersionImages', "REPROJECT_IMAGES"):
+        # Images are reprojected in place, so wouldn't be in the state
+        # they were recorded in
+        logging.warning("Images are reprojected, so can't be created "
+            "incrementally")
+        return None
+    return ImageManifest(config, parameter)
+
+def remove_image_manifest(config, parameter):
+    """Removes the parameter's manifest, if any, since it won't reflect
+    images created without it
+    """
+    pathname = dfu.image_manifest_pathname(config, parameter)
+    if os.path.exists(pathname):
+        os.remove(pathname)
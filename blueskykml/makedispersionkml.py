@@ -44,26 +44,27 @@ def main(options):
             # For backwards compatibility, support old config key 'PARAMETER'
             dfu.create_dispersion_images_dir(config, parameter)
 
-            # Generate smoke dispersion images
+            # Generate smoke dispersion images.  They're rendered with
+            # their transparency already applied, so aren't post processed
+            # (see dispersionimages.format_dispersion_images)
             logging.info("Processing smoke dispersion NetCDF data into plot images...")
-            start_datetime, grid_bbox, heights = dg.create_dispersion_images(config, parameter)
+            start_datetime, grid_bbox, heights, images = dg.create_dispersion_images(
+                config, parameter)
 
             # Output dispersion grid bounds
             _output_grid_bbox(grid_bbox, config)
-
-            # Post process smoke dispersion images
-            logging.info("Formatting dispersion plot images...")
-            dispersionimages.format_dispersion_images(config, parameter, heights)
         else:
             start_datetime = config.get("DEFAULT", "DATE") if config.has_option("DEFAULT", "DATE") else datetime.now()
             heights = None
             grid_bbox = None
+            images = None
 
         all_parameter_args.append({
             "parameter": parameter,
             "start_datetime": start_datetime,
             "heights": heights,
-            "grid_bbox": grid_bbox
+            "grid_bbox": grid_bbox,
+            "images": images
         })
 
     # Generate single KMZ
@@ -73,7 +74,7 @@ def main(options):
     if config.getboolean('DispersionImages', 'REPROJECT_IMAGES'):
         for a in all_parameter_args:
             dispersionimages.reproject_images(config, a['parameter'],
-                a['grid_bbox'], a['heights'])
+                a['grid_bbox'], a['images'])
 
     logging.info("Make Dispersion finished.")
 
@@ -97,7 +97,10 @@ class PolygonGenerator(object):
     def _import_grid(self):
         self._infile = self._config.get('DispersionGridInput', "FILENAME")
         self._makepolygons_infile = "NETCDF:%s:%s" % (self._infile, self._parameter)
-        self._grid = BSDispersionGrid(self._infile, param=self._parameter)  # dispersion grid instance
+        # Only the grid's dimensions and times are used, so don't read the data
+        self._grid = BSDispersionGrid(self._infile, param=self._parameter,
+            data_access='lazy', reader=self._config.get('DispersionGridInput',
+            "READER"))  # dispersion grid instance
 
     def _generate_custom_cutpoints_file(self):
         self._custom_cutpoints_filename = os.path.join(self.output_dir, 'CutpointsGateway.csv')
@@ -1,11 +1,12 @@
 import datetime
+import hashlib
 import os
 import re
 import uuid
 import subprocess
 
 from .constants import *
-from .dispersiongrid import BSDispersionGrid
+from .dispersiongrid import BSDispersionGrid, is_derived_parameter
 from .polygon_generator import PolygonGenerator
 from . import dispersion_file_utils as dfu
 
@@ -84,6 +85,7 @@ class KmzCreator(object):
         self._concentration_information = None
         if 'dispersion' in self._modes:
             self._dispersion_images = self._collect_images()
+            self._image_paths = self._map_identical_images()
             self._concentration_information = self._create_concentration_information()
             self._image_assets = self._collect_image_assets()
             if self._do_create_polygons:
@@ -92,7 +94,7 @@ class KmzCreator(object):
                 self._polygon_information = []
                 self._polygon_screen_overlay = []
                 for param_args in self._all_parameter_args:
-                    if param_args['parameter'] == 'VisualRange':
+                    if is_derived_parameter(param_args['parameter']):
                         # makepolygons only works with parameters that
                         # are defined in the hytplis output .nc file, not
                         # derived parameters such as VisualRange
@@ -194,8 +196,10 @@ class KmzCreator(object):
     def _collect_images(self):
         collected = []
         for param_args in self._all_parameter_args:
+            # The images created by dispersiongrid.create_dispersion_images
             collected.append(dfu.collect_dispersion_images_for_kml(
-                self._config, param_args['parameter'], param_args['heights']))
+                self._config, param_args['parameter'], param_args['heights'],
+                param_args['images']))
 
         return collected
 
@@ -322,7 +326,11 @@ class KmzCreator(object):
                 height_root = pykml.Folder().set_name('Height %s ' % (height_label))
                 for time_series_type in TimeSeriesTypes.all_for_parameter(param_args['parameter']):
 
-                    t_dict = self._dispersion_images[i][height_label][time_series_type]
+                    # Time series without any configured color maps (e.g.
+                    # the optional running averages) have no images
+                    t_dict = self._dispersion_images[i][height_label].get(time_series_type)
+                    if not t_dict:
+                        continue
 
                     # Show lowest level daily max images first, unless we're
                     # creating visual range output, in which case we show daily min images
@@ -368,7 +376,7 @@ class KmzCreator(object):
                 if images_dict['legend']:
                     # TODO:  put legends in concentration folders?
                     overlay = self._create_screen_overlay(
-                        'Key', images_dict['legend'],
+                        'Key', self._image_href(images_dict['legend']),
                         visible=visible)
                     colorscheme_root = colorscheme_root.with_feature(overlay)
 
@@ -382,47 +390,66 @@ class KmzCreator(object):
 
             parent_root = parent_root.with_feature(colorscheme_root)
 
-    def _create_concentration_folder(self, param_args, name, images, visible=False):
+    def _create_concentration_folder(self, param_args, name, images,
+            visible=False):
         concentration_folder = pykml.Folder().set_name(name)
         for image in images:
-            # handle files names like 'pm25_10m_hourly_201405300000.png' and
-            # ' pm25_10m_daily_maximum_20140529_UTC-0700.png'
-            overlay_datetime_str = image.split('_')[-1].split('.')[0]
-            if len(overlay_datetime_str) == 8:
-                image_datetime_format = '%Y%m%d'
-                overlay_datetime_format = '%Y%m%d'
-                end_offset = 24
-            else:  # len == 12
-                image_datetime_format = '%Y%m%d%H00'
-                overlay_datetime_format = '%Y%m%d%H'
-                end_offset = 1
-            overlay_start = datetime.datetime.strptime(overlay_datetime_str, image_datetime_format)
-            overlay_end = overlay_start + datetime.timedelta(hours=end_offset, seconds=-1)
-            overlay_name = "%s %s" % (name, overlay_start.strftime(overlay_datetime_format))
+            # images are dfu.DispersionImage objects, with the time spans
+            # they represent
+            overlay_datetime_format = '%Y%m%d' if image.is_daily else '%Y%m%d%H'
+            overlay_name = "%s %s" % (name, image.start.strftime(overlay_datetime_format))
             concentration_overlay = self._create_ground_overlay(param_args,
-                overlay_name, image, start_date_time=overlay_start,
-                end_date_time=overlay_end, visible=visible)
+                overlay_name, self._image_href(image.path),
+                start_date_time=image.start,
+                end_date_time=image.end, visible=visible)
             concentration_folder.with_feature(concentration_overlay)
         return concentration_folder
 
 
-    def _collect_image_assets(self):
-        images = []
-
-        def _collect(data):
+    def _iter_image_paths(self):
+        def _iter(data):
             if 'smoke_images' in data:
                 if data['legend']:
-                    images.append(os.path.join(data['root_dir'], data['legend']))
-                if data['smoke_images']:
-                    images.extend([os.path.join(data['root_dir'], i) for i in data['smoke_images']])
+                    yield data['legend']
+                for i in data['smoke_images']:
+                    yield i.path
             else:
                 for k in data:
-                    _collect(data[k])
+                    yield from _iter(data[k])
 
         for di in self._dispersion_images:
-            _collect(di)
+            yield from _iter(di)
 
-        return images
+    def _map_identical_images(self):
+        """Maps the path of each image to that of the first image with the
+        same contents (e.g. empty frames, or the same legend at each height),
+        so that each unique image is only stored in the KMZ once.  Only
+        images the same size as another are hashed.
+        """
+        by_size = {}
+        for path in self._iter_image_paths():
+            by_size.setdefault(os.path.getsize(path), []).append(path)
+
+        canonical_paths = {}
+        for paths in by_size.values():
+            if len(paths) == 1:
+                canonical_paths[paths[0]] = paths[0]
+                continue
+            by_digest = {}
+            for path in paths:
+                with open(path, 'rb') as f:
+                    digest = hashlib.sha256(f.read()).digest()
+                canonical_paths[path] = by_digest.setdefault(digest, path)
+
+        # In the order the images were collected
+        return {p: canonical_paths[p] for p in self._iter_image_paths()}
+
+    def _image_href(self, path):
+        return os.path.basename(self._image_paths[path])
+
+    def _collect_image_assets(self):
+        # Canonical images are the first of their contents to be collected
+        return list(dict.fromkeys(self._image_paths.values()))
 
 
     def _create_polygon_information(self, polygon_kmls, parameter):
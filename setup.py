@@ -42,6 +42,11 @@ setup(
         "pillow==10.4.0",
         "matplotlib==3.9.2"
     ],
+    extras_require={
+        # Enables reading dispersion grids without GDAL (see
+        # DispersionGridInput > READER)
+        "netcdf": ["netCDF4"]
+    },
     dependency_links=[
         "https://pypi.airfire.org/simple/afdatetime/",
     ],
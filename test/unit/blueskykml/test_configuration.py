@@ -1,3 +1,5 @@
+import pickle
+
 from pytest import raises
 
 from blueskykml.configuration import (
@@ -70,6 +72,15 @@ class TestBlueSkyKMLConfigParser(object):
         with raises(ConfigurationError) as e:
             self.config_parser.set(section, param, 4.5)
 
+    def test_pickle(self):
+        # so that configs can be passed to worker processes
+        self.config_parser.add_section("foo")
+        self.config_parser.set("foo", "bar", [1, 2])
+        self.config_parser.set("foo", "baz", 4.3)
+        config_parser = pickle.loads(pickle.dumps(self.config_parser))
+        assert [1, 2] == config_parser.get("foo", "bar")
+        assert 4.3 == config_parser.get("foo", "baz")
+
     # TODO: add tests where config options are loaded from file
     #   might need to modify self.config_parser.TO_CONVERT to
-    #   test setting and getting scalars?
\ No newline at end of file
+    #   test setting and getting scalars?
@@ -0,0 +1,1271 @@
+import datetime
+import json
+import math
+import os
+import pickle
+
+import numpy as np
+from osgeo import gdal
+from PIL import Image
+from pytest import importorskip, raises, skip
+
+from blueskykml import configuration, dispersiongrid, dispersionimages
+from blueskykml import dispersion_file_utils as dfu
+from blueskykml.constants import TimeSeriesTypes
+
+
+def _config(options={}, tmpdir=None, **dispersion_images):
+    """Returns the default config, with options (values keyed by section
+    and option, adding any new sections) and DispersionImages options set.
+    Given tmpdir, output is
+    written under it, to an existing images-pm25 directory.
+    """
+    config = configuration.BlueSkyKMLConfigParser()
+    config.read(configuration.ConfigBuilder.DEFAULT_CONFIG)
+    if tmpdir:
+        config.set('DEFAULT', 'MAIN_OUTPUT_DIR', str(tmpdir))
+        config.set('DispersionGridOutput', 'OUTPUT_DIR', str(tmpdir.join('images')))
+        tmpdir.ensure('images-pm25', dir=True)
+    for (section, option), val in options.items():
+        if section != 'DEFAULT' and not config.has_section(section):
+            config.add_section(section)
+        config.set(section, option, val)
+    for option, val in dispersion_images.items():
+        config.set('DispersionImages', option, val)
+    return config
+
+# Options with which colors are left as they are rendered, without the
+# background made transparent or the opacity factor applied
+UNFORMATTED = dict([(('DispersionImages', 'BACKGROUND_COLOR_' + c), '255')
+    for c in ('RED', 'GREEN', 'BLUE')]
+    + [(('RedColorBar', 'IMAGE_OPACITY_FACTOR'), '1.0')])
+
+def _plot(config=None, section='RedColorBar', dpi=10,
+        levels=(0.0, 1.0, 5.0, 10.0),
+        colors=([0, 100, 200], [0, 110, 210], [0, 120, 220])):
+    """Returns a plot of a 2 x 3 grid, with a color for each interval"""
+    plot = dispersiongrid.BSDispersionPlot(config or _config(), 'PM25',
+        section, dpi=dpi)
+    plot.colormap_from_RGB(*colors)
+    plot.generate_colormap_index(list(levels))
+    plot.xvals = np.array([-120.0, -119.0, -118.0])
+    plot.yvals = np.array([40.0, 39.0])
+    return plot
+
+
+def _require_gdal_driver(name):
+    """Skips the test if GDAL doesn't have the given driver"""
+    driver = gdal.GetDriverByName(name)
+    if driver is None:
+        skip("GDAL {} driver is not available".format(name))
+    return driver
+
+def _write_grid(path, data, xorig=-120.0, yorig=35.0, xcell=0.5, ycell=0.25,
+        sdate=2024100, stime=0):
+    """Writes a BlueSky Models3-style netCDF dispersion file, with a PM25
+    variable dimensioned by [time, layer, row, col], rows stored south to
+    north, and hourly time steps starting at sdate (YYYYDDD) and stime
+    (HHMMSS)
+    """
+    netCDF4 = importorskip('netCDF4')
+    num_times, num_layers, num_rows, num_cols = data.shape
+    nc = netCDF4.Dataset(str(path), 'w', format='NETCDF3_CLASSIC')
+    nc.createDimension('TSTEP', None)
+    nc.createDimension('LAY', num_layers)
+    nc.createDimension('ROW', num_rows)
+    nc.createDimension('COL', num_cols)
+    nc.createDimension('VAR', 1)
+    nc.createDimension('DATE-TIME', 2)
+    tflag = nc.createVariable('TFLAG', 'i4', ('TSTEP', 'VAR', 'DATE-TIME'))
+    nc.createVariable('PM25', 'f4', ('TSTEP', 'LAY', 'ROW', 'COL'))[:] = data
+    start = datetime.datetime.strptime('{}{:06d}'.format(sdate, stime),
+        '%Y%j%H%M%S')
+    for t in range(num_times):
+        dt = start + datetime.timedelta(hours=t)
+        tflag[t, 0] = [int(dt.strftime('%Y%j')), int(dt.strftime('%H%M%S'))]
+    nc.IOAPI_VERSION = 'test'
+    nc.GDTYP = np.int32(1)
+    nc.XORIG = xorig
+    nc.YORIG = yorig
+    nc.XCELL = xcell
+    nc.YCELL = ycell
+    nc.NCOLS = np.int32(num_cols)
+    nc.NROWS = np.int32(num_rows)
+    nc.NLAYS = np.int32(num_layers)
+    nc.VGLVLS = np.array([10.0 * 10 ** z for z in range(num_layers)] + [0.0],
+        dtype='f4')
+    nc.SDATE = np.int32(sdate)
+    nc.STIME = np.int32(stime)
+    nc.TSTEP = np.int32(10000)
+    nc.close()
+    return str(path)
+
+
+class TestDerivedParameters(object):
+
+    def test_get_derived_parameter(self):
+        assert dispersiongrid.get_derived_parameter('PM25') is None
+        for p in ('VisualRange', 'visual_range', 'Visual Range'):
+            d = dispersiongrid.get_derived_parameter(p)
+            assert d['source_parameter'] == 'PM25'
+        assert dispersiongrid.is_derived_parameter('AQI')
+        assert dispersiongrid.is_derived_parameter('AQICategory')
+        assert not dispersiongrid.is_derived_parameter('PM25')
+
+    def test_visual_range(self):
+        convert = dispersiongrid.get_derived_parameter('VisualRange')['convert']
+        pm25 = np.array([[0.0, 0.5, 1.0], [2.0, 541.0, np.nan]])
+        expected = np.array([[541.0, 541.0, 541.0], [270.5, 1.0, 541.0]])
+        assert np.array_equal(expected, convert(pm25))
+
+    def test_aqi(self):
+        convert = dispersiongrid.get_derived_parameter('AQI')['convert']
+        pm25 = np.array([0.0, 9.0, 35.4, 55.5, 1000.0, np.nan])
+        aqi = convert(pm25)
+        assert np.array_equal([0, 50, 100, 151, 500], aqi[:-1])
+        assert np.isnan(aqi[-1])
+
+    def test_aqi_category(self):
+        convert = dispersiongrid.get_derived_parameter('AQICategory')['convert']
+        pm25 = np.array([0.0, 9.0, 9.05, 35.4, 35.5, 125.4, 225.5, np.nan])
+        categories = convert(pm25)
+        assert np.array_equal([1, 1, 2, 2, 3, 4, 6], categories[:-1])
+        assert np.isnan(categories[-1])
+
+
+class MockGrid(object):
+
+    def __init__(self, data):
+        self.full_data = data
+        self.num_times, self.sizeZ, self.sizeY, self.sizeX = data.shape
+        self.slabs_read = []
+
+    def read(self, times, layers):
+        self.slabs_read.extend([(t, z) for t in times for z in layers])
+        return self.full_data[np.ix_(times, layers)]
+
+
+class TestLazyGridData(object):
+
+    def setup_method(self):
+        self.full_data = np.arange(4*2*3*5, dtype=float).reshape(4, 2, 3, 5)
+
+    def _check(self, memory_mapped):
+        grid = MockGrid(self.full_data)
+        data = dispersiongrid.LazyGridData(grid, memory_mapped=memory_mapped)
+        assert data.shape == self.full_data.shape
+        assert grid.slabs_read == []
+
+        assert np.array_equal(self.full_data[1, 0, :, :], data[1, 0, :, :])
+        assert grid.slabs_read == [(1, 0)]
+
+        assert np.array_equal(self.full_data[0:3, 0], data[0:3, 0])
+        assert grid.slabs_read == [(1, 0), (0, 0), (2, 0)]
+
+        assert np.array_equal(self.full_data[2::-1, 0], data[2::-1, 0])
+        assert len(grid.slabs_read) == 3
+
+        assert np.array_equal(self.full_data[2, :, 1:, ::2], data[2, :, 1:, ::2])
+        assert np.array_equal(self.full_data[-1], data[-1])
+        assert np.array_equal(self.full_data, np.asarray(data))
+        # each slab is only read once
+        assert len(grid.slabs_read) == 8
+
+    def test_in_memory(self):
+        self._check(False)
+
+    def test_memory_mapped(self):
+        self._check(True)
+
+    def test_scaled_storage(self):
+        grid = MockGrid(self.full_data)
+        storage = dispersiongrid.GridStorage('uint16', scale=0.5)
+        for memory_mapped in (False, True):
+            data = dispersiongrid.LazyGridData(grid, memory_mapped=memory_mapped,
+                storage=storage)
+            assert data.dtype == np.float32
+            assert np.array_equal(self.full_data[1:3, 1], data[1:3, 1])
+            assert np.array_equal(self.full_data, np.asarray(data))
+
+
+class TestGridStorage(object):
+
+    def test_float64(self):
+        storage = dispersiongrid.GridStorage()
+        data = np.array([0.0, 1.5, np.nan])
+        assert storage.encode(data) is data
+        assert storage.store(data) is data
+
+    def test_float32(self):
+        storage = dispersiongrid.GridStorage('float32')
+        stored = storage.store(np.array([0.0, 1.5, 1e-10]))
+        assert stored.dtype == np.float32
+        assert np.array_equal(np.array([0.0, 1.5, 1e-10], dtype=np.float32), stored)
+
+    def test_uint16(self):
+        storage = dispersiongrid.GridStorage('uint16', scale=0.1, offset=-1.0)
+        data = np.array([[-5.0, -1.0, 0.0, 1.04], [2.36, 5000.0, 1e6, np.nan]])
+        stored = storage.encode(data)
+        assert stored.dtype == np.uint16
+        assert np.array_equal([[0, 0, 10, 20], [34, 50010, 65534, 65535]], stored)
+        decoded = storage.decode(stored)
+        assert decoded.dtype == np.float32
+        assert np.allclose([-1.0, -1.0, 0.0, 1.0], decoded[0])
+        assert np.allclose([2.4, 5000.0, 6552.4], decoded[1, :3])
+        assert np.isnan(decoded[1, 3])
+
+        wrapped = storage.wrap(stored)
+        assert wrapped.shape == (2, 4)
+        assert np.array_equal(decoded[0], wrapped[0])
+        assert np.allclose([0.0, 6552.4], wrapped[:, 2])
+
+    def test_invalid(self):
+        with raises(ValueError):
+            dispersiongrid.GridStorage('int8')
+        with raises(ValueError):
+            dispersiongrid.GridStorage('uint16')
+
+
+class TestGridWindow(object):
+
+    def setup_method(self):
+        # [time, layer, row, col], rows stored south to north
+        self.file_data = np.arange(3 * 2 * 4 * 6, dtype='f4').reshape(3, 2, 4, 6)
+        # as read, north up
+        self.data = self.file_data[:, :, ::-1, :]
+
+    def _grid(self, tmpdir, bbox, **kwargs):
+        filename = _write_grid(tmpdir.join('grid.nc'), self.file_data)
+        return dispersiongrid.BSDispersionGrid(filename, param='PM25',
+            bbox=bbox, reader='netcdf', **kwargs)
+
+    def _check(self, grid, window, minX, minY):
+        xoff, yoff, xsize, ysize = window
+        assert window == grid.window
+        assert (xsize, ysize) == (grid.sizeX, grid.sizeY)
+        assert (minX, minY) == (grid.minX, grid.minY)
+        assert (minX, 0.5, 0.0, minY, 0.0, -0.25) == grid.geotransform
+        assert np.array_equal(
+            self.data[:, :, yoff:yoff + ysize, xoff:xoff + xsize],
+            np.asarray(grid.data))
+
+    def test_full_grid(self, tmpdir):
+        grid = self._grid(tmpdir, None)
+        self._check(grid, (0, 0, 6, 4), -120.0, 35.75)
+
+    def test_on_grid_points(self, tmpdir):
+        # Grid points on the bounding box's edges are included
+        grid = self._grid(tmpdir, (-119.5, 35.25, -118.5, 35.5))
+        self._check(grid, (1, 1, 3, 2), -119.5, 35.5)
+
+    def test_between_grid_points(self, tmpdir):
+        # ...as are those just outside of it
+        grid = self._grid(tmpdir, (-119.25, 35.3, -118.75, 35.4))
+        self._check(grid, (1, 1, 3, 2), -119.5, 35.5)
+        grid = self._grid(tmpdir, (-119.4, 35.3, -118.6, 35.6))
+        self._check(grid, (1, 0, 3, 3), -119.5, 35.75)
+
+    def test_partly_outside_grid(self, tmpdir):
+        grid = self._grid(tmpdir, (-125.0, 30.0, -119.25, 35.3))
+        self._check(grid, (0, 1, 3, 3), -120.0, 35.5)
+        grid = self._grid(tmpdir, (-118.2, 35.6, -110.0, 40.0))
+        self._check(grid, (3, 0, 3, 2), -118.5, 35.75)
+
+    def test_outside_grid(self, tmpdir):
+        with raises(ValueError):
+            self._grid(tmpdir, (-130.0, 30.0, -125.0, 31.0))
+        with raises(ValueError):
+            self._grid(tmpdir, (-119.0, 36.0, -118.0, 37.0))
+
+    def test_layers(self, tmpdir):
+        for data_access in ('eager', 'lazy'):
+            grid = self._grid(tmpdir, (-119.5, 35.25, -118.5, 35.5),
+                layers=[1], data_access=data_access)
+            assert [1] == grid.layers
+            assert 1 == grid.sizeZ
+            assert ['100'] == grid.heights
+            assert np.array_equal(self.data[:, 1:, 1:3, 1:4],
+                np.asarray(grid.data))
+
+
+class TestGridReaders(object):
+
+    def setup_method(self):
+        self.file_data = np.arange(2 * 2 * 4 * 6, dtype='f4').reshape(2, 2, 4, 6)
+        # with more significant digits than a float32 has
+        self.attributes = dict(xorig=-120.123456789, yorig=35.7,
+            xcell=0.1 / 3, ycell=0.3)
+
+    def _grid(self, tmpdir, reader):
+        filename = _write_grid(tmpdir.join('grid.nc'), self.file_data,
+            **self.attributes)
+        return dispersiongrid.BSDispersionGrid(filename, param='PM25',
+            bbox=(-120.05, 35.8, -119.95, 36.4), reader=reader)
+
+    def test_attributes_round_trip(self, tmpdir):
+        grid = self._grid(tmpdir, 'netcdf')
+        for name, val in self.attributes.items():
+            assert val == float(grid.metadata['NC_GLOBAL#' + name.upper()])
+        assert ['10', '100'] == grid.heights
+
+    def test_same_grid(self, tmpdir):
+        _require_gdal_driver('netCDF')
+        grids = [self._grid(tmpdir, reader) for reader in ('netcdf', 'gdal')]
+        plots = [_plot() for grid in grids]
+        for plot, grid in zip(plots, grids):
+            plot.set_plot_bounds(grid)
+
+        assert grids[0].geotransform == grids[1].geotransform
+        assert grids[0].window == grids[1].window
+        assert np.array_equal(grids[0].data, grids[1].data)
+        for attr in ('lonmin', 'lonmax', 'latmin', 'latmax'):
+            assert getattr(plots[0], attr) == getattr(plots[1], attr)
+        assert np.array_equal(plots[0].xvals, plots[1].xvals)
+        assert np.array_equal(plots[0].yvals, plots[1].yvals)
+
+
+class TestDailyAggregates(object):
+
+    def setup_method(self):
+        self.grid = dispersiongrid.BSDispersionGrid.__new__(
+            dispersiongrid.BSDispersionGrid)
+        self.grid.num_times = 50
+        self.grid.datetimes = [datetime.datetime(2024, 8, 1, 5) +
+            datetime.timedelta(hours=i) for i in range(50)]
+        self.grid.data = np.random.RandomState(0).rand(50, 2, 3, 4)
+        self.grid.storage = dispersiongrid.GridStorage()
+        self.grid._daily_aggregates = {}
+
+    def _expected(self, utc_offset):
+        # local days start at 5 + utc_offset o'clock
+        first = (19 - utc_offset) % 24 or 24
+        bounds = [0] + list(range(first, 50, 24)) + [50]
+        return [self.grid.data[s:e] for s, e in zip(bounds[:-1], bounds[1:])]
+
+    def test_get_day_starts(self):
+        assert [0, 19, 43] == list(self.grid.get_day_starts(0))
+        assert [0, 2, 26] == list(self.grid.get_day_starts(-7))
+        assert [0, 24, 48] == list(self.grid.get_day_starts(-5))
+
+    def test_get_daily_aggregate(self):
+        utc_offsets = [-7, -5, 0, 10]
+        for statistic, reduce in (('max', np.max), ('min', np.min),
+                ('mean', np.mean)):
+            for layer in (0, 1):
+                for utc_offset in utc_offsets:
+                    data = self.grid.get_daily_aggregate(statistic, layer,
+                        utc_offset, utc_offsets=utc_offsets)
+                    expected = [reduce(d[:, layer], axis=0)
+                        for d in self._expected(utc_offset)]
+                    assert np.allclose(expected, data)
+
+        # all offsets are computed together, once
+        assert len(self.grid._daily_aggregates) == 3 * 2 * 4
+        data = self.grid.get_daily_aggregate('max', 1, 10)
+        assert data is self.grid._daily_aggregates[('max', 1, 10)]
+
+    def test_mean_same_as_average(self):
+        # Means equal to a contour level must be drawn in the same interval
+        # as np.average's, so they must be the same to the last bit, both
+        # in batch and streaming
+        self.grid.num_times = 48
+        self.grid.data = np.random.RandomState(0).rand(48, 1, 50, 50) * 100
+        for utc_offsets in ([0], [-7, -5, 0, 10]):
+            self.grid._daily_aggregates = {}
+            for utc_offset in utc_offsets:
+                means = self.grid.get_daily_aggregate('mean', 0, utc_offset,
+                    utc_offsets=utc_offsets)
+                starts = self.grid.get_day_starts(utc_offset)
+                bounds = list(starts) + [48]
+                expected = [np.average(self.grid.data[s:e, 0], axis=0)
+                    for s, e in zip(bounds[:-1], bounds[1:])]
+                assert np.array_equal(expected, means)
+
+                state = dispersiongrid.DailyAggregateState(['mean'], starts, 48)
+                days = [state.add(t, self.grid.data[t, 0]) for t in range(48)]
+                assert np.array_equal(expected,
+                    [d[1]['mean'] for d in days if d is not None])
+
+    def test_invalid(self):
+        with raises(ValueError):
+            self.grid.get_daily_aggregate('median', 0, 0)
+
+
+def _create_images(tmpdir, data, options={}, stime=0, **dispersion_images):
+    """Writes a grid of the given data (unless None, e.g. if restyling),
+    and creates its images under tmpdir.  Returns the list of images and
+    legends created, each as a tuple of its path relative to tmpdir and
+    its other attributes.
+    """
+    options = dict(options)
+    filename = tmpdir.join('grid.nc')
+    if data is not None:
+        _write_grid(filename, data, stime=stime)
+    options[('DispersionGridInput', 'FILENAME')] = str(filename)
+    options[('DispersionGridInput', 'READER')] = 'netcdf'
+    config = _config(options, tmpdir=tmpdir, **dispersion_images)
+    images = dispersiongrid.create_dispersion_images(config, 'PM25')[3]
+    return [(os.path.relpath(image.path, str(tmpdir)), image.height_label,
+        image.time_series_type, image.color_map_section, image.utc_offset,
+        image.start, image.end) for image in images]
+
+def _read_images(tmpdir, images):
+    return [tmpdir.join(image[0]).read_binary() for image in images]
+
+
+class TestRollingWindows(object):
+
+    def setup_method(self):
+        self.grid = dispersiongrid.BSDispersionGrid.__new__(
+            dispersiongrid.BSDispersionGrid)
+        self.grid.data = np.random.RandomState(0).rand(30, 2, 3, 4)
+        self.grid.storage = dispersiongrid.GridStorage()
+        self.grid._rolling_windows = {}
+
+    def test_mean(self):
+        for width in (1, 3, 24):
+            means = self.grid.get_rolling_window('mean', 1, width)
+            assert means.shape == (31 - width, 3, 4)
+            # each window's exact sum, rounded once
+            expected = [[[math.fsum(self.grid.data[i:i+width, 1, r, c]) / width
+                for c in range(4)] for r in range(3)] for i in range(31 - width)]
+            assert np.array_equal(expected, means)
+        assert self.grid.get_rolling_window('mean', 1, 3) is (
+            self.grid._rolling_windows[('mean', 1, 3)])
+        assert len(self.grid.get_rolling_window('mean', 0, 31)) == 0
+
+    def test_mean_on_level(self):
+        # The last window's average is exactly 1.0, which is drawn in the
+        # interval below it, but differencing cumulative sums gives
+        # 1.0000000000000047
+        data = np.array([57.8, 40.8, 0.2, 1.9, 0.9])[:, None, None]
+        means = dispersiongrid.ROLLING_STATISTICS['mean'](data, 3)
+        assert 1.0 == means[-1, 0, 0]
+        state = dispersiongrid.RollingWindowState('mean', 3)
+        assert 1.0 == [state.add(frame) for frame in data][-1][0, 0]
+
+        plot = _plot()
+        assert {1} == set(plot.classify_raster_data(means[-1]).ravel())
+
+    def test_mean_after_spike(self):
+        # Windows of only zeros are exactly zero once a spike has left them
+        data = np.array([1e6, 0.001, 0.0, 0.0, 0.0, 0.0, 0.3])[:, None, None]
+        means = dispersiongrid.ROLLING_STATISTICS['mean'](data, 3)
+        assert [0.0, 0.0] == means[2:4, 0, 0].tolist()
+        assert 0.3 / 3 == means[-1, 0, 0]
+
+    def test_nowcast(self):
+        data = np.array([0.0, 10.0, 20.0, 40.0, 0.0, 0.0])[:, None, None]
+        nowcast = dispersiongrid.ROLLING_STATISTICS['nowcast'](data, 3)
+        # min/max ratios are 0, 0.25, 0, and 0, each floored at 0.5
+        expected = [
+            (20 + 0.5*10 + 0.25*0) / 1.75,
+            (40 + 0.5*20 + 0.25*10) / 1.75,
+            (0 + 0.5*40 + 0.25*20) / 1.75,
+            (0 + 0.5*0 + 0.25*40) / 1.75
+        ]
+        assert np.allclose(expected, nowcast[:, 0, 0])
+
+        data = np.array([2.0, 2.0, 2.0, 3.0])[:, None, None]
+        nowcast = dispersiongrid.ROLLING_STATISTICS['nowcast'](data, 3)
+        assert np.allclose([2.0, (3 + 2*(2/3.0) + 2*(4/9.0)) / (1 + 2/3.0 + 4/9.0)],
+            nowcast[:, 0, 0])
+        assert len(dispersiongrid.ROLLING_STATISTICS['nowcast'](data, 5)) == 0
+
+    def test_invalid(self):
+        with raises(ValueError):
+            self.grid.get_rolling_window('median', 0, 3)
+
+
+class TestStreamingStates(object):
+
+    def setup_method(self):
+        self.grid = dispersiongrid.BSDispersionGrid.__new__(
+            dispersiongrid.BSDispersionGrid)
+        self.grid.num_times = 50
+        self.grid.datetimes = [datetime.datetime(2024, 8, 1, 5) +
+            datetime.timedelta(hours=i) for i in range(50)]
+        self.grid.data = np.random.RandomState(0).rand(50, 2, 3, 4)
+        self.grid.storage = dispersiongrid.GridStorage()
+        self.grid._daily_aggregates = {}
+        self.grid._rolling_windows = {}
+
+    def test_rolling_window_state(self):
+        for statistic, width in (('mean', 3), ('mean', 24), ('nowcast', 12)):
+            state = dispersiongrid.RollingWindowState(statistic, width)
+            values = [state.add(self.grid.data[t, 1]) for t in range(50)]
+            assert all(v is None for v in values[:width - 1])
+            expected = self.grid.get_rolling_window(statistic, 1, width)
+            assert np.array_equal(expected, values[width - 1:])
+
+    def test_same_images(self, tmpdir):
+        # 40 hours, starting at 05Z, so that the first and last days are
+        # partial for both UTC offsets, with a few hours without smoke
+        data = np.random.RandomState(0).rand(40, 1, 4, 6) * 30
+        data[10:14] = 0.0
+        images = {}
+        for streaming in ('False', 'True'):
+            images[streaming] = _create_images(tmpdir.mkdir(streaming), data,
+                {('DispersionGridInput', 'STREAMING'): streaming},
+                stime=50000, RENDERER='raster',
+                DAILY_IMAGES_UTC_OFFSETS='0, -7')
+
+        # Images are created in a different order when streaming
+        assert sorted(images['False']) == sorted(images['True'])
+        by_type = lambda t: sorted(i[5] for i in images['True'] if i[2] == t
+            and i[4] in (None, -7) and i[5])
+        # hourly, and three hour windows centered on each but the first
+        # and last hour
+        hours = [datetime.datetime(2024, 4, 9, 4) + datetime.timedelta(hours=h)
+            for h in range(40)]
+        assert hours == by_type(TimeSeriesTypes.HOURLY)
+        assert hours[1:-1] == by_type(TimeSeriesTypes.THREE_HOUR)
+        # local days spanned, including partial first and last days
+        assert [datetime.datetime(2024, 4, d) for d in (8, 9, 10)] == (
+            by_type(TimeSeriesTypes.DAILY_MAXIMUM))
+        assert (_read_images(tmpdir.join('False'), sorted(images['False']))
+            == _read_images(tmpdir.join('True'), sorted(images['True'])))
+
+    def test_daily_aggregate_state(self):
+        for utc_offset in (-7, -5, 0):
+            state = dispersiongrid.DailyAggregateState(['max', 'min', 'mean'],
+                self.grid.get_day_starts(utc_offset), 50)
+            days = [state.add(t, self.grid.data[t, 0]) for t in range(50)]
+            days = [d for d in days if d is not None]
+            assert [0, 1, 2] == [d[0] for d in days]
+            for statistic in ('max', 'min', 'mean'):
+                expected = self.grid.get_daily_aggregate(statistic, 0, utc_offset)
+                assert np.allclose(expected, [d[1][statistic] for d in days])
+
+
+class TestContourRenderer(object):
+
+    def setup_method(self):
+        self.plot = _plot()
+
+    def test_figure_reuse(self, tmpdir):
+        fileroot = str(tmpdir.join('frame'))
+        first = np.array([[20.0, 2.0, 0.0], [0.0, 2.0, 20.0]])
+        second = np.array([[0.0, 0.0, 2.0], [2.0, 0.0, 0.0]])
+
+        self.plot.create_png(first, fileroot)
+        self.plot.create_png(second, fileroot)
+        reused = np.asarray(Image.open(fileroot + '.png'))
+        assert 1 == len(self.plot._figures)
+
+        # nothing from the first frame is left on the figure
+        _plot().create_png(second, fileroot)
+        fresh = np.asarray(Image.open(fileroot + '.png'))
+        assert (48, 64, 4) == reused.shape
+        assert np.array_equal(fresh, reused)
+
+    def test_colorbar(self, tmpdir):
+        # legends are rendered at a third of the DPI
+        plot = _plot(dpi=75)
+        plot.make_colorbar(str(tmpdir.join('one')))
+        plot.make_colorbar(str(tmpdir.join('two')))
+        assert (tmpdir.join('one.png').read_binary()
+            == tmpdir.join('two.png').read_binary())
+
+
+class TestImageFormatting(object):
+
+    def test_same_as_post_processing(self, tmpdir):
+        data = np.array([[20.0, 2.0, 0.0], [0.0, 2.0, 7.0]])
+        for renderer in ('contour', 'raster'):
+            _plot(_config(UNFORMATTED, RENDERER=renderer)).create_png(data,
+                str(tmpdir.join('raw')))
+            _plot(_config(RENDERER=renderer)).create_png(data,
+                str(tmpdir.join('formatted')))
+
+            # as format_dispersion_images would have post processed it
+            image = Image.open(str(tmpdir.join('raw.png')))
+            expected = dispersionimages._apply_transparency(image,
+                dispersionimages.SimpleColor(0, 0, 0, 255), 0.7)
+            formatted = np.asarray(Image.open(str(tmpdir.join('formatted.png'))))
+            assert np.array_equal(np.asarray(expected), formatted)
+            # the background (below the lowest level) is transparent
+            assert (formatted[..., 3] == 0).any()
+            assert int(255 * 0.7) == formatted[..., 3].max()
+
+
+class TestPngEncoding(object):
+
+    def test_palette(self, tmpdir):
+        data = np.array([[20.0, 2.0, 0.0], [0.0, 2.0, 7.0]])
+        for renderer in ('contour', 'raster'):
+            _plot(_config(RENDERER=renderer)).create_png(data,
+                str(tmpdir.join('rgba')))
+            _plot(_config(RENDERER=renderer, PNG_PALETTE='True')).create_png(
+                data, str(tmpdir.join('palette')))
+            rgba = Image.open(str(tmpdir.join('rgba.png')))
+            palette = Image.open(str(tmpdir.join('palette.png')))
+            assert 'RGBA' == rgba.mode
+            assert 'P' == palette.mode
+            assert np.array_equal(np.asarray(rgba),
+                np.asarray(palette.convert('RGBA')))
+
+    def test_too_many_colors_for_palette(self, tmpdir):
+        plot = _plot(_config(PNG_PALETTE='True'))
+        rgba = np.full((1, 300, 4), 255, dtype=np.uint8)
+        rgba[..., 0] = np.arange(300) % 256
+        rgba[..., 1] = np.arange(300) // 256
+        plot.write_image(rgba, str(tmpdir.join('frame')))
+        image = Image.open(str(tmpdir.join('frame.png')))
+        assert 'RGBA' == image.mode
+        assert np.array_equal(rgba, np.asarray(image))
+
+    def test_compression(self, tmpdir):
+        rgba = np.zeros((200, 200, 4), dtype=np.uint8)
+        rgba[50:150, 50:150] = (10, 20, 30, 178)
+        sizes = []
+        for level in ('0', '9'):
+            _plot(_config(PNG_COMPRESS_LEVEL=level)).write_image(rgba,
+                str(tmpdir.join('frame')))
+            assert np.array_equal(rgba,
+                np.asarray(Image.open(str(tmpdir.join('frame.png')))))
+            sizes.append(tmpdir.join('frame.png').size())
+        assert sizes[0] > sizes[1]
+
+        _plot(_config(PNG_COMPRESS_TYPE='rle')).write_image(rgba,
+            str(tmpdir.join('frame')))
+        assert np.array_equal(rgba,
+            np.asarray(Image.open(str(tmpdir.join('frame.png')))))
+        with raises(ValueError):
+            _plot(_config(PNG_COMPRESS_TYPE='foo'))
+
+
+class TestEmptyFrames(object):
+
+    LEVELS = (1.0, 5.0, 10.0)
+    COLORS = ([50, 100, 200], [60, 110, 210], [70, 120, 220])
+
+    def test_is_empty_frame(self, tmpdir):
+        config = _config(tmpdir=tmpdir, EMPTY_FRAMES='omit')
+        plot = _plot(config, levels=self.LEVELS, colors=self.COLORS)
+        frame = lambda data: dispersiongrid.RenderFrame(np.array(data))
+        assert plot.is_empty_frame(frame([[0.0, 0.5, 0.0], [0.0, 0.9, 0.0]]))
+        assert plot.is_empty_frame(frame([[np.nan] * 3] * 2))
+        assert not plot.is_empty_frame(frame([[0.0, 1.0, 0.0], [0.0, np.nan, 0.0]]))
+
+        # Values in the lowest interval are drawn in the background color
+        config.set('DispersionImages', 'BACKGROUND_COLOR_RED', '50')
+        config.set('DispersionImages', 'BACKGROUND_COLOR_GREEN', '60')
+        config.set('DispersionImages', 'BACKGROUND_COLOR_BLUE', '70')
+        plot = _plot(config, levels=self.LEVELS, colors=self.COLORS)
+        assert plot.is_empty_frame(frame([[0.0, 1.0, 0.0], [0.0, 4.9, 0.0]]))
+        assert not plot.is_empty_frame(frame([[0.0, 1.0, 0.0], [0.0, 5.0, 0.0]]))
+
+        # ...or the highest, as for visual range
+        plot = _plot(config, levels=self.LEVELS,
+            colors=([200, 100, 50], [210, 110, 60], [220, 120, 70]))
+        assert plot.is_empty_frame(frame([[10.0, 20.0], [15.0, np.nan]]))
+        assert not plot.is_empty_frame(frame([[10.0, 20.0], [4.9, 11.0]]))
+        assert not plot.is_empty_frame(frame([[10.0, 20.0], [np.nan, 0.0]]))
+
+    def test_transparent(self, tmpdir):
+        empty = np.array([[0.0, 0.5, 0.0], [0.0, 0.9, 0.0]])
+        for renderer in ('contour', 'raster'):
+            plot = _plot(_config(tmpdir=tmpdir.mkdir(renderer),
+                RENDERER=renderer, EMPTY_FRAMES='transparent'),
+                levels=self.LEVELS, colors=self.COLORS)
+            transparent_image = str(tmpdir.join(renderer, 'images-pm25',
+                'pm25_transparent.png'))
+            for name in ('one', 'two'):
+                plot.make_contour_plot(empty, str(tmpdir.join(renderer, name)), None)
+                assert os.path.samefile(transparent_image,
+                    str(tmpdir.join(renderer, name + '.png')))
+            assert {(0, 0, 0, 0)} == set(map(tuple, np.asarray(
+                Image.open(transparent_image)).reshape(-1, 4)))
+            # GeoTIFFs are resampled to the same width as rendered frames'
+            width = plot.target_pixel_width
+            plot.make_contour_plot(empty + 2.0, str(tmpdir.join(renderer, 'three')), None)
+            assert width == plot.target_pixel_width
+            assert not os.path.samefile(transparent_image,
+                str(tmpdir.join(renderer, 'three.png')))
+            # Frames linked to the transparent image are replaced, rather
+            # than written through, when rendered
+            plot.make_contour_plot(empty + 2.0, str(tmpdir.join(renderer, 'two')), None)
+            assert not os.path.samefile(transparent_image,
+                str(tmpdir.join(renderer, 'two.png')))
+            assert os.path.samefile(transparent_image,
+                str(tmpdir.join(renderer, 'one.png')))
+            assert {(0, 0, 0, 0)} == set(map(tuple, np.asarray(
+                Image.open(transparent_image)).reshape(-1, 4)))
+
+    def test_omit(self, tmpdir):
+        plot = _plot(_config(tmpdir=tmpdir, EMPTY_FRAMES='omit'),
+            levels=self.LEVELS, colors=self.COLORS)
+        # e.g. rendered by an earlier run
+        tmpdir.join('empty.png').write_binary(b'png')
+        assert [] == plot.make_contour_plot(np.zeros((2, 3)),
+            str(tmpdir.join('empty')), None)
+        assert [str(tmpdir.join('full.png'))] == plot.make_contour_plot(
+            np.full((2, 3), 2.0), str(tmpdir.join('full')), None)
+        assert not tmpdir.join('empty.png').exists()
+        assert tmpdir.join('full.png').exists()
+
+    def test_invalid(self, tmpdir):
+        with raises(ValueError):
+            _plot(_config(tmpdir=tmpdir, EMPTY_FRAMES='foo'))
+
+
+class TestLegends(object):
+
+    LEVELS = (1.0, 5.0, 10.0)
+    COLORS = ([50, 100], [60, 110], [70, 120])
+
+    def test_mathtext_to_plain_text(self):
+        assert 'PM2.5 [ug/m3]' == dispersiongrid.mathtext_to_plain_text(
+            r'$PM_{2.5} \/[\mu g/m^{3}]$')
+        assert 'PM2.5 AQI' == dispersiongrid.mathtext_to_plain_text(
+            r'$PM_{2.5}$ AQI')
+        assert 'x2 Range' == dispersiongrid.mathtext_to_plain_text(
+            r'$x^2$ Range')
+
+    def test_rendered_once(self, tmpdir):
+        for legend_renderer in ('matplotlib', 'pil'):
+            config = _config(LEGEND_RENDERER=legend_renderer)
+            one = _plot(config, dpi=75, levels=self.LEVELS, colors=self.COLORS)
+            one.make_colorbar(str(tmpdir.join(legend_renderer + '-one')))
+            # The same legend, for another color map
+            _plot(config, section='RedColorBarPM25', dpi=75, levels=self.LEVELS,
+                colors=self.COLORS).make_colorbar(
+                str(tmpdir.join(legend_renderer + '-two')))
+            # A different one
+            _plot(config, dpi=75, levels=self.LEVELS,
+                colors=([50, 200], [60, 110], [70, 120])).make_colorbar(
+                str(tmpdir.join(legend_renderer + '-three')))
+
+            legend = lambda name: str(tmpdir.join(legend_renderer + '-' + name + '.png'))
+            assert os.path.samefile(legend('one'), legend('two'))
+            assert not os.path.samefile(legend('one'), legend('three'))
+            width, height = Image.open(legend('one')).size
+            assert width > 4 * height
+
+            # Rerendering a legend doesn't write through to those linked to it
+            one.colormap_from_RGB([50, 100], [60, 110], [70, 130])
+            one.make_colorbar(str(tmpdir.join(legend_renderer + '-two')))
+            assert not os.path.samefile(legend('one'), legend('two'))
+
+    def test_invalid(self):
+        with raises(ValueError):
+            _plot(_config(LEGEND_RENDERER='foo'))
+
+
+class TestRasterRenderer(object):
+
+    def setup_method(self):
+        self.plot = _plot(_config(UNFORMATTED, RENDERER='raster'))
+
+    def _render(self, tmpdir, value):
+        fileroot = str(tmpdir.join('frame'))
+        self.plot.create_png(np.full((2, 3), value), fileroot)
+        image = np.asarray(Image.open(fileroot + '.png'))
+        assert image.shape == (48, 64, 4)
+        return set(map(tuple, image.reshape(-1, 4).tolist()))
+
+    def test_classes(self, tmpdir):
+        # intervals are (low, high], except for the lowest, which includes
+        # the lowest level; values above the highest level get the last color
+        assert {(0, 0, 0, 255)} == self._render(tmpdir, 0.0)
+        assert {(0, 0, 0, 255)} == self._render(tmpdir, 1.0)
+        assert {(100, 110, 120, 255)} == self._render(tmpdir, 1.5)
+        assert {(200, 210, 220, 255)} == self._render(tmpdir, 10.0)
+        assert {(200, 210, 220, 255)} == self._render(tmpdir, 1000.0)
+        assert {(0, 0, 0, 0)} == self._render(tmpdir, -1.0)
+        assert {(0, 0, 0, 0)} == self._render(tmpdir, np.nan)
+
+    def test_orientation(self, tmpdir):
+        fileroot = str(tmpdir.join('frame'))
+        # north is up, whichever order the rows are in
+        for yvals, data in (([40.0, 39.0], [[2.0, 2.0, 2.0], [0.0, 0.0, 0.0]]),
+                ([39.0, 40.0], [[0.0, 0.0, 0.0], [2.0, 2.0, 2.0]])):
+            self.plot.yvals = np.array(yvals)
+            self.plot.create_png(np.array(data), fileroot)
+            image = np.asarray(Image.open(fileroot + '.png'))
+            assert tuple(image[0, 0]) == (100, 110, 120, 255)
+            assert tuple(image[-1, 0]) == (0, 0, 0, 255)
+
+
+class TestRenderFrame(object):
+
+    def test_derive(self):
+        frame = dispersiongrid.RenderFrame([[1.0, 2.0]])
+        calls = []
+        compute = lambda: calls.append(1) or frame.data * 2
+        assert np.array_equal([[2.0, 4.0]], frame.derive('double', compute))
+        assert np.array_equal([[2.0, 4.0]], frame.derive('double', compute))
+        assert 1 == len(calls)
+
+    def test_derive_batch(self):
+        frames = list(dispersiongrid.batch_render_frames(
+            (np.full((1, 2), i, dtype=float) for i in range(5)), 2))
+        calls = []
+        compute = lambda stack: calls.append(stack.shape) or stack * 2
+        assert np.array_equal([[2.0, 2.0]], frames[1].derive_batch('double', compute))
+        assert np.array_equal([[0.0, 0.0]], frames[0].derive_batch('double', compute))
+        assert np.array_equal([[8.0, 8.0]], frames[4].derive_batch('double', compute))
+        assert [(2, 1, 2), (1, 1, 2)] == calls
+
+        # Frames no longer in use are dropped from their batch
+        frames = dispersiongrid.render_frame_batch([[[0.0]], [[1.0]], [[2.0]]])
+        del frames[1]
+        frames[0].derive_batch('double', compute)
+        assert (2, 1, 1) == calls[-1]
+        assert np.array_equal([[4.0]], frames[1].derive_batch('double', compute))
+        assert 3 == len(calls)
+
+        # Without a batch
+        frame = dispersiongrid.RenderFrame([[3.0]])
+        assert np.array_equal([[6.0]], frame.derive_batch('double', compute))
+
+    def test_classified_once_per_level_set(self, tmpdir):
+        frame = dispersiongrid.RenderFrame(np.array([[0.5, 2.0, 20.0],
+            [7.0, 2.0, 0.0]]))
+        config = _config(RENDERER='raster')
+        plots = [_plot(config), _plot(config),
+            _plot(config, levels=(0.0, 2.0, 4.0, 8.0))]
+        calls = []
+        for plot in plots:
+            classify = plot.classify_raster_data
+            plot.classify_raster_data = lambda data, c=classify: (
+                calls.append(1) or c(data))
+        for i, plot in enumerate(plots):
+            plot.create_png(frame, str(tmpdir.join('frame{}'.format(i))))
+        assert 2 == len(calls)
+        assert (tmpdir.join('frame0.png').read_binary()
+            == tmpdir.join('frame1.png').read_binary())
+
+    def test_classify_geotiff_data(self):
+        plot = _plot(_config(RENDERER='raster'))
+        data = np.array([[-1.0, 0.0, 0.5, 1.0], [4.9, 5.0, 10.0, np.nan]],
+            dtype=np.float32)
+        # intervals are [low, high), with -1 for values outside all of them
+        assert [[-1, 0, 0, 1], [1, 2, -1, -1]] == plot.classify_geotiff_data(
+            data).tolist()
+
+
+class TestGeotiffData(object):
+
+    def _plot(self, levels=(0.0, 1.0, 5.0, 10.0)):
+        _require_gdal_driver('MEM')
+        plot = _plot(levels=levels)
+        plot.lonmin, plot.lonmax, plot.latmin, plot.latmax = -120.0, -117.0, 38.0, 40.0
+        plot.set_target_pixel_width((2, 3))
+        plot.set_geotiff_constants(np.zeros((2, 3)))
+        return plot
+
+    def test_batch_resampling(self):
+        plot = self._plot()
+        stack = np.random.RandomState(0).rand(5, 2, 3) * 20
+        batch = plot.resample_data_for_geotiffs(stack)
+        assert 5 == len(batch)
+        assert np.array_equal(
+            [plot.resample_data_for_geotiffs(frame) for frame in stack], batch)
+
+    def test_raw_pm25_color_table(self):
+        # intervals are [0, 1), [1, 5), and [5, 10); values beyond the
+        # last level aren't colored
+        plot = self._plot()
+        opacity = plot.image_opacity
+        for max_val in (0, 3, 7, 300):
+            color_table = plot.get_raw_pm25_color_table(max_val)
+            assert color_table is plot.get_raw_pm25_color_table(max_val)
+            assert min(max_val, 9) + 1 == color_table.GetCount()
+            expected = ([(0, 0, 0, 0)] + [(100, 110, 120, opacity)] * 4
+                + [(200, 210, 220, opacity)] * 5)[:max_val + 1]
+            assert expected == [tuple(color_table.GetColorEntry(val))
+                for val in range(color_table.GetCount())]
+
+        # ...up to the maximum value, past where color ramps end
+        color_table = self._plot(levels=(0.0, 1.0, 5.0, 1000.0)
+            ).get_raw_pm25_color_table(300)
+        assert 301 == color_table.GetCount()
+        for val in (5, 255, 256, 300):
+            assert (200, 210, 220, opacity) == tuple(
+                color_table.GetColorEntry(val))
+
+
+class TestGeotiffSeries(object):
+
+    def test_netcdf(self, tmpdir):
+        netCDF4 = importorskip('netCDF4')
+        plot = _plot(_config({
+            ('DispersionGridOutput', 'GEOTIFF_LAYOUT'): 'netcdf',
+            ('DispersionGridOutput', 'CREATE_SINGLE_BAND_RAW_PM25_GEOTIFFS'): 'True',
+            ('DispersionGridOutput', 'CREATE_SINGLE_BAND_SMOKE_LEVEL_GEOTIFFS'): 'True'
+        }))
+        plot.lonmin, plot.lonmax, plot.latmin, plot.latmax = -120.0, -117.0, 38.0, 40.0
+        # Frames are written at the grid's resolution, without resampling
+        plot.target_pixel_width = 3
+        plot.get_geotiff_resampled = dispersiongrid.as_render_frame
+
+        fileroot = str(tmpdir.join('pm25_100m_daily_maximum_UTC-0700_RedColorBar'))
+        for day, data in enumerate([[[0.0, 2.0, 7.0], [12.0, 4.0, 300.0]],
+                [[1.0, 1.0, 1.0], [1.0, 1.0, 1.0]]]):
+            start, end = dfu.image_time_span(TimeSeriesTypes.DAILY_MAXIMUM,
+                datetime.datetime(2024, 4, 9 + day))
+            plot.add_to_geotiff_series(np.array(data), fileroot, start, end,
+                utc_offset=-7)
+        plot.write_geotiff_series()
+
+        assert [fileroot + '.nc'] == [str(f) for f in tmpdir.listdir()]
+        with netCDF4.Dataset(fileroot + '.nc') as ds:
+            # 2024-04-09T07:00Z and 2024-04-10T07:00Z
+            assert [1712646000, 1712732400] == ds['time'][:].tolist()
+            assert [1712646000, 1712732400] == ds['time_bnds'][0].tolist()
+            assert [39.5, 38.5] == ds['lat'][:].tolist()
+            assert [-119.5, -118.5, -117.5] == ds['lon'][:].tolist()
+            assert [[[0, 1, 2], [0, 1, 0]], [[1, 1, 1], [1, 1, 1]]] == (
+                ds['smoke_level'][:].tolist())
+            assert 300 == ds['raw_pm25'][0, 1, 2]
+            assert 'from_0_to_1 from_1_to_5 from_5_to_10' == ds['smoke_level'].flag_meanings
+
+        # Series are only written once
+        plot.write_geotiff_series()
+        assert 1 == len(tmpdir.listdir())
+
+    HOURS = [datetime.datetime(2024, 4, 9, h) for h in range(3)]
+
+    def _write_hourly_series(self, tmpdir, layout, rgba=True):
+        plot = _plot(_config({
+            ('DispersionGridOutput', 'GEOTIFF_LAYOUT'): layout,
+            ('DispersionGridOutput', 'CREATE_RGBA_GEOTIFFS'): str(rgba),
+            ('DispersionGridOutput', 'CREATE_SINGLE_BAND_RAW_PM25_GEOTIFFS'): 'True',
+            ('DispersionGridOutput', 'CREATE_SINGLE_BAND_SMOKE_LEVEL_GEOTIFFS'): 'True'
+        }))
+        plot.lonmin, plot.lonmax, plot.latmin, plot.latmax = -120.0, -117.0, 38.0, 40.0
+        plot.target_pixel_width = 3
+        plot.get_geotiff_resampled = dispersiongrid.as_render_frame
+
+        fileroot = str(tmpdir.join('pm25_100m_hourly_RedColorBar'))
+        for hour, dt in enumerate(self.HOURS):
+            start, end = dfu.image_time_span(TimeSeriesTypes.HOURLY, dt)
+            plot.add_to_geotiff_series(np.full((2, 3), 3.0 * hour), fileroot,
+                start, end)
+        plot.write_geotiff_series()
+        return fileroot
+
+    def test_series(self, tmpdir):
+        _require_gdal_driver('GTiff')
+        fileroot = self._write_hourly_series(tmpdir, 'series')
+        assert sorted([fileroot + '.tif', fileroot + '-raw-pm25.tif',
+            fileroot + '-rgba.tif']) == sorted(str(f) for f in tmpdir.listdir())
+
+        for suffix, bands_per_frame in (('', 1), ('-raw-pm25', 1), ('-rgba', 4)):
+            dataset = gdal.Open(fileroot + suffix + '.tif')
+            assert 3 * bands_per_frame == dataset.RasterCount
+            assert '0 1 5 10' == dataset.GetMetadata()['LEVELS']
+            for i in range(dataset.RasterCount):
+                dt = self.HOURS[i // bands_per_frame]
+                assert {
+                    'START_TIME': dt.isoformat() + '+00:00',
+                    'END_TIME': dt.replace(minute=59, second=59).isoformat() + '+00:00'
+                } == dataset.GetRasterBand(i + 1).GetMetadata()
+
+        smoke_levels = gdal.Open(fileroot + '.tif').ReadAsArray()
+        assert [0, 1, 2] == smoke_levels[:, 0, 0].tolist()
+        raw = gdal.Open(fileroot + '-raw-pm25.tif')
+        assert gdal.GDT_Byte == raw.GetRasterBand(1).DataType
+        assert [0, 3, 6] == raw.ReadAsArray()[:, 1, 2].tolist()
+
+    def test_netcdf_hourly(self, tmpdir):
+        netCDF4 = importorskip('netCDF4')
+        fileroot = self._write_hourly_series(tmpdir, 'netcdf', rgba=False)
+        assert [fileroot + '.nc'] == [str(f) for f in tmpdir.listdir()]
+        with netCDF4.Dataset(fileroot + '.nc') as ds:
+            # 2024-04-09T00:00Z, 01:00Z and 02:00Z
+            starts = [1712620800 + 3600 * h for h in range(3)]
+            assert starts == ds['time'][:].tolist()
+            # Each frame ends where the next begins
+            assert [[t, t + 3600] for t in starts] == ds['time_bnds'][:].tolist()
+            assert [0, 1, 2] == ds['smoke_level'][:, 0, 0].tolist()
+            assert [0, 3, 6] == ds['raw_pm25'][:, 1, 2].tolist()
+
+    def test_not_streamed(self, tmpdir):
+        # Series are held in memory until complete
+        with raises(ValueError, match='supported when streaming'):
+            _create_images(tmpdir, np.zeros((3, 1, 2, 3)), {
+                ('DispersionGridInput', 'STREAMING'): 'True',
+                ('DispersionGridOutput', 'GEOTIFF_LAYOUT'): 'series',
+                ('DispersionGridOutput', 'CREATE_SINGLE_BAND_SMOKE_LEVEL_GEOTIFFS'): 'True'
+            })
+
+    def test_invalid(self):
+        with raises(ValueError):
+            _plot(_config({('DispersionGridOutput', 'GEOTIFF_LAYOUT'): 'bands'}))
+
+
+def _geotiff_plot(**options):
+    return _plot(_config(dict((('DispersionGridOutput', option), val)
+        for option, val in options.items())))
+
+
+class TestGeotiffEncoding(object):
+
+    SERIES_OPTIONS = ['TILED=YES', 'BLOCKXSIZE=256', 'BLOCKYSIZE=256',
+        'INTERLEAVE=BAND', 'BIGTIFF=IF_SAFER']
+
+    def test_plain(self):
+        # Plain GeoTIFFs are written as they always have been, whatever
+        # the compression options
+        for options in ({}, {'GEOTIFF_COMPRESS': 'ZSTD'},
+                {'GEOTIFF_NUM_THREADS': '2', 'GEOTIFF_BLOCK_SIZE': '512'}):
+            for data_type in (gdal.GDT_Byte, gdal.GDT_Float32):
+                assert [] == _geotiff_plot(**options).get_geotiff_creation_options(
+                    data_type=data_type)
+
+    def test_series(self):
+        plot = _geotiff_plot()
+        for data_type in (gdal.GDT_Byte, gdal.GDT_UInt16):
+            assert ['COMPRESS=DEFLATE', 'NUM_THREADS=ALL_CPUS'] + (
+                self.SERIES_OPTIONS + ['PREDICTOR=2']) == (
+                plot.get_geotiff_creation_options(series=True,
+                    data_type=data_type))
+        for data_type in (gdal.GDT_Float32, gdal.GDT_Float64):
+            assert ['COMPRESS=DEFLATE', 'NUM_THREADS=ALL_CPUS'] + (
+                self.SERIES_OPTIONS + ['PREDICTOR=3']) == (
+                plot.get_geotiff_creation_options(series=True,
+                    data_type=data_type))
+
+        plot = _geotiff_plot(GEOTIFF_COMPRESS='lzw', GEOTIFF_NUM_THREADS='4',
+            GEOTIFF_BLOCK_SIZE='128')
+        assert ['COMPRESS=LZW', 'NUM_THREADS=4', 'TILED=YES',
+            'BLOCKXSIZE=128', 'BLOCKYSIZE=128', 'INTERLEAVE=BAND',
+            'BIGTIFF=IF_SAFER', 'PREDICTOR=2'] == (
+            plot.get_geotiff_creation_options(series=True,
+                data_type=gdal.GDT_Byte))
+
+        # without a predictor
+        for options in ({'GEOTIFF_PREDICTOR': 'False'},
+                {'GEOTIFF_COMPRESS': 'NONE'}):
+            plot = _geotiff_plot(**options)
+            assert not [o for o in plot.get_geotiff_creation_options(
+                series=True, data_type=gdal.GDT_Float32)
+                if o.startswith('PREDICTOR')]
+
+    def test_cloud_optimized(self):
+        plot = _geotiff_plot(CLOUD_OPTIMIZED_GEOTIFFS='True',
+            GEOTIFF_COMPRESS='zstd', GEOTIFF_BLOCK_SIZE='512',
+            GEOTIFF_NUM_THREADS='2')
+        # The COG driver selects the predictor for the data type
+        for data_type in (gdal.GDT_Byte, gdal.GDT_Float32):
+            for series in (False, True):
+                assert ['COMPRESS=ZSTD', 'NUM_THREADS=2', 'BLOCKSIZE=512',
+                    'OVERVIEWS=AUTO', 'OVERVIEW_RESAMPLING=NEAREST',
+                    'PREDICTOR=YES'] == plot.get_geotiff_creation_options(
+                    series=series, data_type=data_type)
+
+        plot = _geotiff_plot(CLOUD_OPTIMIZED_GEOTIFFS='True',
+            GEOTIFF_PREDICTOR='False', GEOTIFF_OVERVIEW_LEVELS='2 4 8')
+        assert [2, 4, 8] == plot.geotiff_overview_levels
+        assert ['COMPRESS=DEFLATE', 'NUM_THREADS=ALL_CPUS', 'BLOCKSIZE=256',
+            'OVERVIEWS=FORCE_USE_EXISTING', 'OVERVIEW_RESAMPLING=NEAREST'
+            ] == plot.get_geotiff_creation_options(data_type=gdal.GDT_Byte)
+
+        plot = _geotiff_plot(CLOUD_OPTIMIZED_GEOTIFFS='True',
+            GEOTIFF_COMPRESS='NONE')
+        assert ['COMPRESS=NONE', 'NUM_THREADS=ALL_CPUS', 'BLOCKSIZE=256',
+            'OVERVIEWS=AUTO', 'OVERVIEW_RESAMPLING=NEAREST'
+            ] == plot.get_geotiff_creation_options(data_type=gdal.GDT_Byte)
+
+    def _write_cog(self, tmpdir, **options):
+        _require_gdal_driver('COG')
+        dataset = _require_gdal_driver('MEM').Create('', 600, 400, 1,
+            gdal.GDT_Byte)
+        dataset.GetRasterBand(1).WriteArray(
+            (np.arange(400 * 600) % 7).reshape(400, 600).astype(np.uint8))
+        filename = str(tmpdir.join('frame.tif'))
+        _geotiff_plot(CLOUD_OPTIMIZED_GEOTIFFS='True', **options).write_geotiff(
+            dataset, filename)
+        return gdal.Open(filename)
+
+    def test_cog_layout(self, tmpdir):
+        # Overviews down to a single 256 pixel tile - 300x200 and 150x100
+        cog = self._write_cog(tmpdir)
+        assert 'COG' == cog.GetMetadataItem('LAYOUT', 'IMAGE_STRUCTURE')
+        assert 2 == cog.GetRasterBand(1).GetOverviewCount()
+        assert (256, 256) == tuple(cog.GetRasterBand(1).GetBlockSize())
+
+        cog = self._write_cog(tmpdir.mkdir('levels'),
+            GEOTIFF_OVERVIEW_LEVELS='2 4 8', GEOTIFF_BLOCK_SIZE='512')
+        assert 'COG' == cog.GetMetadataItem('LAYOUT', 'IMAGE_STRUCTURE')
+        assert 3 == cog.GetRasterBand(1).GetOverviewCount()
+        assert [300, 150, 75] == [cog.GetRasterBand(1).GetOverview(i).XSize
+            for i in range(3)]
+
+    def test_invalid(self):
+        with raises(ValueError):
+            _geotiff_plot(GEOTIFF_COMPRESS='JPEG')
+
+
+class TestParallelRendering(object):
+
+    def test_same_images(self, tmpdir):
+        data = np.random.RandomState(0).rand(12, 1, 4, 6) * 30
+        data[5:7] = 0.0
+        images = {}
+        for jobs in ('1', '2'):
+            images[jobs] = _create_images(tmpdir.mkdir(jobs), data,
+                stime=50000, JOBS=jobs)
+        assert images['1'] == images['2']
+        assert (_read_images(tmpdir.join('1'), images['1'])
+            == _read_images(tmpdir.join('2'), images['2']))
+
+
+class TestFrameCache(object):
+
+    # A color map for the restyled images, including 24-hour averages,
+    # which have no color maps when the frames are cached
+    NEW_COLOR_MAP = {
+        ('NewColorBar', 'DEFINE_RGB'): 'True',
+        ('NewColorBar', 'DEFINE_HEX'): 'False',
+        ('NewColorBar', 'DATA_LEVELS'): '0.0 2.0 8.0 16.0 2000.0',
+        ('NewColorBar', 'RED'): '0 50 100 150',
+        ('NewColorBar', 'GREEN'): '0 60 110 160',
+        ('NewColorBar', 'BLUE'): '0 70 120 170',
+        ('DispersionGridOutput', 'HOURLY_COLORS_PM25'): 'NewColorBar',
+        ('DispersionGridOutput', 'TWENTY_FOUR_HOUR_COLORS_PM25'): 'NewColorBar',
+        ('DispersionGridOutput', 'DAILY_COLORS_PM25'): 'NewColorBar'
+    }
+    STORAGE = {
+        ('DispersionGridInput', 'STORAGE_DTYPE'): 'uint16',
+        ('DispersionGridInput', 'STORAGE_SCALE'): '0.01'
+    }
+
+    def setup_method(self):
+        self.data = np.random.RandomState(0).rand(30, 1, 4, 6) * 20
+        self.data[5:7] = 0.0
+
+    def _create_images(self, tmpdir, options, restyle=False,
+            **dispersion_images):
+        if restyle:
+            options = {**options, ('DispersionGridInput', 'RESTYLE'): 'True'}
+        return _create_images(tmpdir, None if restyle else self.data,
+            {**self.STORAGE, **options},
+            stime=50000, RENDERER='raster', DAILY_IMAGES_UTC_OFFSETS='0, -7',
+            **dispersion_images)
+
+    def test_restyle(self, tmpdir):
+        self._create_images(tmpdir.mkdir('restyled'),
+            {('DispersionGridOutput', 'CREATE_FRAME_CACHE'): 'True'})
+
+        cache_dir = tmpdir.join('restyled', 'frame-cache-pm25')
+        assert sorted(['10m_hourly.npy', '10m_three_hour.npy',
+            '10m_twenty_four_hour.npy', '10m_nowcast.npy', '10m_daily_maximum_UTC+0000.npy',
+            '10m_daily_maximum_UTC-0700.npy', '10m_daily_average_UTC+0000.npy',
+            '10m_daily_average_UTC-0700.npy']) == sorted(
+            f.basename for f in cache_dir.listdir('10m_*.npy'))
+        hourly = np.load(str(cache_dir.join('10m_hourly.npy')))
+        assert (30, 4, 6) == hourly.shape
+        assert np.uint16 == hourly.dtype
+        # uint16 values round trip to within half the storage scale
+        assert np.abs(hourly * 0.01 - self.data[:, 0, ::-1]).max() <= 0.005
+
+        index = json.loads(cache_dir.join('index.json').read())
+        assert {'dtype': 'uint16', 'scale': 0.01, 'offset': 0.0} == index['storage']
+        assert ['10'] == index['grid']['heights']
+        assert 30 == index['grid']['num_times']
+        assert 8 == len(index['frame_sets'])
+
+        # The grid file is removed, so that it can't be the source of the
+        # restyled images
+        tmpdir.join('restyled', 'grid.nc').remove()
+        restyled = self._create_images(tmpdir.join('restyled'),
+            self.NEW_COLOR_MAP, restyle=True)
+        direct = self._create_images(tmpdir.mkdir('direct'), self.NEW_COLOR_MAP)
+        assert direct == restyled
+        assert {'NewColorBar', 'RainbowColorBarPM25'} == set(
+            image[3] for image in restyled)
+        assert any(image[2] == TimeSeriesTypes.TWENTY_FOUR_HOUR
+            for image in restyled)
+        assert (_read_images(tmpdir.join('direct'), direct)
+            == _read_images(tmpdir.join('restyled'), restyled))
+
+    def test_not_cached(self, tmpdir):
+        with raises(ValueError, match='No frames cached'):
+            self._create_images(tmpdir, {}, restyle=True)
+
+        self._create_images(tmpdir,
+            {('DispersionGridOutput', 'CREATE_FRAME_CACHE'): 'True'})
+        # An offset whose daily aggregates weren't cached
+        with raises(ValueError, match='UTC offset -5 not cached'):
+            _create_images(tmpdir, None,
+                {('DispersionGridInput', 'RESTYLE'): 'True'},
+                DAILY_IMAGES_UTC_OFFSETS='-5')
+
+        # A frame set missing from the index
+        index_file = tmpdir.join('frame-cache-pm25', 'index.json')
+        index = json.loads(index_file.read())
+        index['frame_sets'] = [f for f in index['frame_sets']
+            if f['time_series_type'] != TimeSeriesTypes.HOURLY]
+        index_file.write(json.dumps(index))
+        with raises(ValueError, match='hourly frames not cached'):
+            self._create_images(tmpdir, {}, restyle=True)
+
+    def test_inputs_changed(self, tmpdir):
+        self._create_images(tmpdir,
+            {('DispersionGridOutput', 'CREATE_FRAME_CACHE'): 'True'})
+
+        for option, value in (('LAYERS', '0, 1'),
+                ('BOUNDING_BOX', '-119.5, 38.5, -118.0, 39.5')):
+            with raises(ValueError, match='cached from {}'.format(
+                    'layers' if option == 'LAYERS' else 'bounding box')):
+                self._create_images(tmpdir,
+                    {('DispersionGridInput', option): value}, restyle=True)
+
+        # A different grid written to the same file
+        _write_grid(tmpdir.join('grid.nc'), self.data[:20], stime=50000)
+        with raises(ValueError, match='cached from grid file'):
+            self._create_images(tmpdir, {}, restyle=True)
+
+        # which once recached, restyles
+        self.data = self.data[:20]
+        self._create_images(tmpdir,
+            {('DispersionGridOutput', 'CREATE_FRAME_CACHE'): 'True'})
+        assert self._create_images(tmpdir, {}, restyle=True)
+
+        # Without the grid file, only its path is checked
+        tmpdir.join('grid.nc').remove()
+        assert self._create_images(tmpdir, {}, restyle=True)
+        config = _config({('DispersionGridInput', 'FILENAME'):
+            str(tmpdir.join('other.nc'))}, tmpdir=tmpdir)
+        with raises(ValueError, match='cached from grid file'):
+            dispersiongrid.FrameCache(config, 'PM25').load_grid()
+
+    def test_numpy_scalars(self, tmpdir):
+        config = _config({
+            ('DispersionGridInput', 'FILENAME'): _write_grid(
+                tmpdir.join('grid.nc'), self.data[:3]),
+            ('DispersionGridOutput', 'FRAME_CACHE_DIR'): str(tmpdir.join('cache'))
+        })
+        grid = dispersiongrid.BSDispersionGrid(config.get('DispersionGridInput',
+            'FILENAME'), param='PM25', reader='netcdf')
+        # e.g. as a grid reader might return them
+        grid.sizeX = np.int32(grid.sizeX)
+        grid.minX = np.float32(grid.minX)
+        frame_cache = dispersiongrid.FrameCache(config, 'PM25')
+        frame_cache.save(grid, [0])
+
+        cached_grid = dispersiongrid.FrameCache(config, 'PM25').load_grid()
+        assert 6 == cached_grid.sizeX
+        assert -120.0 == cached_grid.minX
+        assert grid.datetimes == cached_grid.datetimes
+
+
+class TestSharedArray(object):
+
+    def test_pickle(self):
+        data = np.arange(24, dtype=np.float32).reshape(2, 3, 4)
+        shared = dispersiongrid.SharedArray(data)
+        try:
+            attached = pickle.loads(pickle.dumps(shared))
+            assert attached.name == shared.name
+            assert np.array_equal(data, attached.array)
+            # the same memory, not a copy
+            shared.array[1, 2, 3] = -1
+            assert -1 == attached.array[1, 2, 3]
+        finally:
+            del attached
+            shared.release()
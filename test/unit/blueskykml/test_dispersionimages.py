@@ -0,0 +1,171 @@
+import datetime
+import os
+
+import numpy as np
+from PIL import Image
+
+from blueskykml import configuration, dispersionimages
+from blueskykml import dispersion_file_utils as dfu
+from blueskykml.constants import TimeSeriesTypes
+
+
+def _apply_transparency_per_pixel(rgba, background_color, opacity_factor):
+    # The original, pixel by pixel, implementation
+    rgba = rgba.copy()
+    for pixel in rgba.reshape(-1, 4):
+        if tuple(pixel) == tuple(background_color) + (255,):
+            pixel[3] = 0
+        else:
+            pixel[3] = min(max(int(pixel[3] * opacity_factor), 0), 255)
+    return rgba
+
+
+def _image(path, dt=None):
+    start, end = (dfu.image_time_span(TimeSeriesTypes.HOURLY, dt) if dt
+        else (None, None))
+    return dfu.DispersionImage(path, '100m', TimeSeriesTypes.HOURLY,
+        'RedColorBar', start=start, end=end)
+
+
+class TestApplyTransparency(object):
+
+    def setup_method(self):
+        rng = np.random.default_rng(0)
+        self.rgba = rng.integers(0, 4, size=(6, 8, 4), dtype=np.uint8) * 85
+        # some opaque, and some translucent, background pixels
+        self.rgba[0, :4] = (0, 85, 170, 255)
+        self.rgba[1, :4] = (0, 85, 170, 170)
+
+    def test_same_as_per_pixel(self):
+        expected = _apply_transparency_per_pixel(self.rgba, (0, 85, 170), 0.7)
+        actual = dispersionimages.apply_transparency(self.rgba, (0, 85, 170), 0.7)
+        assert np.array_equal(expected, actual)
+        assert (actual[0, :4, 3] == 0).all()
+        assert (actual[1, :4, 3] == int(170 * 0.7)).all()
+
+    def test_image(self):
+        expected = _apply_transparency_per_pixel(self.rgba, (0, 85, 170), 0.7)
+        background_color = dispersionimages.SimpleColor(0, 85, 170, 255)
+        image = dispersionimages._apply_transparency(
+            Image.fromarray(self.rgba, 'RGBA'), background_color, 0.7)
+        assert np.array_equal(expected, np.asarray(image))
+        # the background color isn't modified
+        assert (0, 85, 170, 255) == background_color.get_color_tuple()
+
+    def test_opacity_clipped(self):
+        rgba = np.array([[[10, 10, 10, 200], [10, 10, 10, 100]]], dtype=np.uint8)
+        actual = dispersionimages.apply_transparency(rgba, (0, 0, 0), 2.0)
+        assert [255, 200] == actual[0, :, 3].tolist()
+
+
+class TestFormatDispersionImages(object):
+
+    def test_format(self, tmpdir):
+        config = configuration.BlueSkyKMLConfigParser()
+        config.read(configuration.ConfigBuilder.DEFAULT_CONFIG)
+        config.set('DispersionGridOutput', 'OUTPUT_DIR', str(tmpdir.join('graphics')))
+        config.set('DispersionGridOutput', 'GEOTIFF_OUTPUT_DIR', '')
+        config.set('DispersionImages', 'DAILY_IMAGES_UTC_OFFSETS', '0')
+        outdir, _ = dfu.create_image_set_dir(config, 'PM25', '100m',
+            dfu.TIME_SET_DIR_NAMES[TimeSeriesTypes.HOURLY], 'RainbowColorBarPM25')
+
+        rgba = np.zeros((4, 5, 4), dtype=np.uint8)
+        rgba[:, :, 3] = 255
+        rgba[:2] = (200, 100, 50, 255)
+        paths = []
+        images = []
+        for hour in range(3):
+            dt = datetime.datetime(2024, 4, 9, hour)
+            fileroot = dfu.image_pathname(outdir, 'PM25', '100m',
+                TimeSeriesTypes.HOURLY, 'RainbowColorBarPM25', dt)
+            Image.fromarray(rgba, 'RGBA').save(fileroot + '.png')
+            paths.append(fileroot + '.png')
+            start, end = dfu.image_time_span(TimeSeriesTypes.HOURLY, dt)
+            images.append(dfu.DispersionImage(fileroot + '.png', '100m',
+                TimeSeriesTypes.HOURLY, 'RainbowColorBarPM25', start=start,
+                end=end))
+        legend = dfu.legend_pathname(outdir, 'PM25', '100m',
+            TimeSeriesTypes.HOURLY, 'RainbowColorBarPM25') + '.png'
+        Image.fromarray(rgba, 'RGBA').save(legend)
+        images.append(dfu.DispersionImage(legend, '100m',
+            TimeSeriesTypes.HOURLY, 'RainbowColorBarPM25'))
+
+        dispersionimages.format_dispersion_images(config, 'PM25', images)
+
+        expected = _apply_transparency_per_pixel(rgba, (0, 0, 0), 0.7)
+        for path in paths:
+            assert np.array_equal(expected, np.asarray(Image.open(path)))
+        # legends are left as they are
+        assert np.array_equal(rgba, np.asarray(Image.open(legend)))
+
+    def test_linked_images(self, tmpdir):
+        config = configuration.BlueSkyKMLConfigParser()
+        config.read(configuration.ConfigBuilder.DEFAULT_CONFIG)
+        config.set('RedColorBar', 'IMAGE_OPACITY_FACTOR', '0.5')
+        dt = datetime.datetime(2024, 4, 9)
+        rgba = np.full((2, 3, 4), 200, dtype=np.uint8)
+        rgba[..., 3] = 255
+        transparent = tmpdir.join('transparent.png')
+        Image.fromarray(rgba, 'RGBA').save(str(transparent))
+        images = []
+        for name in ('a.png', 'b.png', 'c.png'):
+            os.link(str(transparent), str(tmpdir.join(name)))
+            images.append(_image(str(tmpdir.join(name)), dt))
+        images[2] = dfu.DispersionImage(images[2].path, '100m',
+            TimeSeriesTypes.HOURLY, 'RainbowColorBarPM25', start=images[2].start,
+            end=images[2].end)
+        images.append(_image(str(transparent)))
+
+        dispersionimages.format_dispersion_images(config, 'PM25', images)
+
+        # Formatted once for each opacity factor, rather than once per link
+        for name, iof in (('a.png', 0.5), ('b.png', 0.5), ('c.png', 0.7)):
+            assert np.array_equal(_apply_transparency_per_pixel(rgba,
+                (0, 0, 0), iof), np.asarray(Image.open(str(tmpdir.join(name)))))
+        assert (os.stat(str(tmpdir.join('a.png'))).st_ino
+            == os.stat(str(tmpdir.join('b.png'))).st_ino)
+        # The linked file, which isn't a smoke image, is left as it is
+        assert np.array_equal(rgba, np.asarray(Image.open(str(transparent))))
+        assert {'transparent.png', 'a.png', 'b.png', 'c.png'} == set(
+            f.basename for f in tmpdir.listdir())
+
+
+class TestReprojectImages(object):
+
+    def test_linked_images(self, tmpdir, monkeypatch):
+        config = configuration.BlueSkyKMLConfigParser()
+        config.read(configuration.ConfigBuilder.DEFAULT_CONFIG)
+        dt = datetime.datetime(2024, 4, 9)
+        transparent = tmpdir.join('transparent.png')
+        transparent.write_binary(b'empty')
+        images = []
+        for name in ('a.png', 'b.png', 'c.png'):
+            if name == 'b.png':
+                tmpdir.join(name).write_binary(b'smoke')
+            else:
+                os.link(str(transparent), str(tmpdir.join(name)))
+            images.append(_image(str(tmpdir.join(name)), dt))
+        images.append(_image(str(transparent)))
+
+        reprojected = []
+        def _reproject_image(path, grid_bbox, a_srs, t_srs):
+            reprojected.append(os.path.basename(path))
+            # Replaced, as reproject_image does
+            data = open(path, 'rb').read()
+            os.remove(path)
+            open(path, 'wb').write(b'reprojected ' + data)
+        monkeypatch.setattr(dispersionimages, 'reproject_image', _reproject_image)
+
+        dispersionimages.reproject_images(config, 'PM25',
+            (-120.0, 38.0, -117.0, 40.0), images)
+
+        assert ['a.png', 'b.png'] == sorted(reprojected)
+        assert b'reprojected empty' == tmpdir.join('a.png').read_binary()
+        assert b'reprojected empty' == tmpdir.join('c.png').read_binary()
+        assert b'reprojected smoke' == tmpdir.join('b.png').read_binary()
+        assert (os.stat(str(tmpdir.join('a.png'))).st_ino
+            == os.stat(str(tmpdir.join('c.png'))).st_ino)
+        # The linked file, which isn't a smoke image, is left as it is
+        assert b'empty' == transparent.read_binary()
+        assert {'transparent.png', 'a.png', 'b.png', 'c.png'} == set(
+            f.basename for f in tmpdir.listdir())
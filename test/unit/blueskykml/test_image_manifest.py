@@ -0,0 +1,84 @@
+import datetime
+
+from blueskykml import configuration
+from blueskykml.image_manifest import ImageManifest
+
+
+class TestImageManifest(object):
+
+    def setup_method(self):
+        self.dt = datetime.datetime(2024, 4, 9, 5)
+
+    def _manifest(self, tmpdir, options={}):
+        config = configuration.BlueSkyKMLConfigParser()
+        config.read(configuration.ConfigBuilder.DEFAULT_CONFIG)
+        config.set('DEFAULT', 'MAIN_OUTPUT_DIR', str(tmpdir))
+        if not tmpdir.join('smoke.nc').exists():
+            tmpdir.join('smoke.nc').write_binary(b'grid')
+        config.set('DispersionGridInput', 'FILENAME', str(tmpdir.join('smoke.nc')))
+        config.set('DispersionGridOutput', 'OUTPUT_DIR', str(tmpdir.join('images')))
+        for (section, option), val in options.items():
+            config.set(section, option, val)
+        tmpdir.ensure('images-pm25', dir=True)
+        return ImageManifest(config, 'PM25')
+
+    def test_fingerprint(self, tmpdir):
+        fingerprint = self._manifest(tmpdir).fingerprint('RedColorBar', '10',
+            'hourly', None, self.dt)
+        assert fingerprint == self._manifest(tmpdir).fingerprint('RedColorBar',
+            '10', 'hourly', None, self.dt)
+        assert fingerprint != self._manifest(tmpdir).fingerprint('RedColorBar',
+            '100', 'hourly', None, self.dt)
+        assert fingerprint != self._manifest(tmpdir).fingerprint('RainbowColorBarPM25',
+            '10', 'hourly', None, self.dt)
+
+        # Options that don't change the image's contents
+        assert fingerprint == self._manifest(tmpdir, {
+            ('DispersionImages', 'JOBS'): '4',
+            ('DispersionGridInput', 'LAYERS'): '0,1',
+            ('DispersionGridOutput', 'HOURLY_COLORS'): 'RedColorBar,RainbowColorBarPM25'
+        }).fingerprint('RedColorBar', '10', 'hourly', None, self.dt)
+
+        # Options that do
+        assert fingerprint != self._manifest(tmpdir, {
+            ('RedColorBar', 'IMAGE_OPACITY_FACTOR'): '0.5'
+        }).fingerprint('RedColorBar', '10', 'hourly', None, self.dt)
+        assert fingerprint != self._manifest(tmpdir, {
+            ('DispersionImages', 'RENDERER'): 'raster'
+        }).fingerprint('RedColorBar', '10', 'hourly', None, self.dt)
+
+        # The grid
+        tmpdir.join('smoke.nc').write_binary(b'new grid')
+        assert fingerprint != self._manifest(tmpdir).fingerprint('RedColorBar',
+            '10', 'hourly', None, self.dt)
+
+    def test_is_current(self, tmpdir):
+        manifest = self._manifest(tmpdir)
+        fileroot = str(tmpdir.join('images-pm25', 'frame'))
+        fingerprint = manifest.fingerprint('RedColorBar', self.dt)
+        assert not manifest.is_current(fileroot, fingerprint)
+
+        tmpdir.join('images-pm25', 'frame.png').write_binary(b'png')
+        tmpdir.join('images-pm25', 'frame.tif').write_binary(b'tif')
+        manifest.record(fileroot, fingerprint, [fileroot + '.png', fileroot + '.tif'])
+        assert manifest.is_current(fileroot, fingerprint)
+        assert not manifest.is_current(fileroot, 'other')
+
+        # Reloaded, including after an interrupted run
+        with open(manifest.pathname, 'a') as f:
+            f.write('{"key": "fra')
+        assert self._manifest(tmpdir).is_current(fileroot, fingerprint)
+
+        tmpdir.join('images-pm25', 'frame.tif').remove()
+        assert not self._manifest(tmpdir).is_current(fileroot, fingerprint)
+
+    def test_compact(self, tmpdir):
+        manifest = self._manifest(tmpdir)
+        fileroot = str(tmpdir.join('images-pm25', 'frame'))
+        manifest.record(fileroot, 'one', [])
+        manifest.record(fileroot, 'two', [])
+        self._manifest(tmpdir).record(fileroot + '2', 'three', [])
+        manifest.compact()
+        assert 2 == len(tmpdir.join('images-pm25', 'manifest.jsonl').readlines())
+        assert manifest.is_current(fileroot, 'two')
+        assert manifest.is_current(fileroot + '2', 'three')
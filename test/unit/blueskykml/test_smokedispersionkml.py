@@ -0,0 +1,96 @@
+import datetime
+
+from blueskykml import configuration
+from blueskykml import dispersion_file_utils as dfu
+from blueskykml.constants import TimeSeriesTypes
+from blueskykml.smokedispersionkml import KmzCreator
+
+
+def _image(path, height_label, time_series_type, section, ts=None,
+        utc_offset=None):
+    start, end = (dfu.image_time_span(time_series_type, ts) if ts
+        else (None, None))
+    return dfu.DispersionImage(path, height_label, time_series_type, section,
+        utc_offset=utc_offset, start=start, end=end)
+
+
+class TestCollectImages(object):
+
+    def test_collect_dispersion_images_for_kml(self):
+        config = configuration.BlueSkyKMLConfigParser()
+        config.read(configuration.ConfigBuilder.DEFAULT_CONFIG)
+        config.set('DispersionImages', 'DAILY_IMAGES_UTC_OFFSETS', '-7')
+        dt = datetime.datetime(2024, 4, 9, 5)
+        hourly, daily = TimeSeriesTypes.HOURLY, TimeSeriesTypes.DAILY_MAXIMUM
+        images = [
+            _image('b.png', '10m', hourly, 'RainbowColorBarPM25', dt + datetime.timedelta(hours=1)),
+            _image('a.png', '10m', hourly, 'RainbowColorBarPM25', dt),
+            _image('legend.png', '10m', hourly, 'RainbowColorBarPM25'),
+            _image('d.png', '10m', daily, 'RainbowColorBarPM25', dt, utc_offset=-7)
+        ]
+
+        collected = dfu.collect_dispersion_images_for_kml(config, 'PM25',
+            ['10', '100'], images)
+        assert ['10m', '100m'] == list(collected)
+        hourly_images = collected['10m'][hourly]['RainbowColorBarPM25']
+        assert 'legend.png' == hourly_images['legend']
+        assert ['a.png', 'b.png'] == [i.path for i in hourly_images['smoke_images']]
+        assert datetime.datetime(2024, 4, 9, 5) == hourly_images['smoke_images'][0].start
+        assert (datetime.datetime(2024, 4, 9, 5, 59, 59)
+            == hourly_images['smoke_images'][0].end)
+
+        daily_images = collected['10m'][daily]['UTC-0700']['RainbowColorBarPM25']
+        assert daily_images['legend'] is None
+        assert [datetime.datetime(2024, 4, 9)] == [i.start for i in daily_images['smoke_images']]
+        assert (datetime.datetime(2024, 4, 9, 23, 59, 59)
+            == daily_images['smoke_images'][0].end)
+
+        # Image sets without any images created
+        assert {'smoke_images': [], 'legend': None} == collected['100m'][hourly]['RainbowColorBarPM25']
+
+
+class TestIdenticalImages(object):
+
+    def setup_method(self):
+        # Only _dispersion_images is needed to map images
+        self.kmz_creator = KmzCreator.__new__(KmzCreator)
+
+    def _images(self, tmpdir, name, contents):
+        root_dir = tmpdir.mkdir(name)
+        for image, content in contents.items():
+            root_dir.join(image).write_binary(content)
+        dt = datetime.datetime(2024, 4, 9)
+        return {
+            'legend': str(root_dir.join('colorbar.png')),
+            'smoke_images': [_image(str(root_dir.join(i)), '10m',
+                TimeSeriesTypes.HOURLY, 'RedColorBar', dt)
+                for i in sorted(contents) if i != 'colorbar.png']
+        }
+
+    def test_map_identical_images(self, tmpdir):
+        self.kmz_creator._dispersion_images = [{
+            '10m': {'hourly': {'RedColorBar': self._images(tmpdir, 'a', {
+                'colorbar.png': b'legend',
+                'pm25_1.png': b'empty',
+                'pm25_2.png': b'smoke',
+                'pm25_3.png': b'empty',
+                'pm25_4.png': b'blank'
+            })}},
+            '100m': {'hourly': {'RedColorBar': self._images(tmpdir, 'b', {
+                'colorbar.png': b'legend',
+                'pm25_1.png': b'empty'
+            })}}
+        }]
+        self.kmz_creator._image_paths = self.kmz_creator._map_identical_images()
+
+        a, b = tmpdir.join('a'), tmpdir.join('b')
+        assert 'pm25_1.png' == self.kmz_creator._image_href(str(a.join('pm25_3.png')))
+        assert 'pm25_1.png' == self.kmz_creator._image_href(str(b.join('pm25_1.png')))
+        assert 'pm25_4.png' == self.kmz_creator._image_href(str(a.join('pm25_4.png')))
+        assert 'colorbar.png' == self.kmz_creator._image_href(str(b.join('colorbar.png')))
+        assert [
+            str(tmpdir.join('a', 'colorbar.png')),
+            str(tmpdir.join('a', 'pm25_1.png')),
+            str(tmpdir.join('a', 'pm25_2.png')),
+            str(tmpdir.join('a', 'pm25_4.png'))
+        ] == self.kmz_creator._collect_image_assets()